@@ -177,9 +177,9 @@ class InstructorProfile(models.Model):
         enrollments = Enrollment.objects.filter(course__instructor=self.user)
         self.total_students = enrollments.values('user').distinct().count()
         
-        # Calculate revenue
-        completed_enrollments = enrollments.filter(payment_status='completed')
-        self.total_revenue = sum(e.amount_paid for e in completed_enrollments)
+        # Revenue net of refunds, from the ledger balance (see payments.ledger)
+        from payments.ledger import get_balance
+        self.total_revenue = get_balance(self.user).total_revenue
         
         # Calculate average rating
         from courses.models import Review
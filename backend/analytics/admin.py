@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import UserActivity, CourseAnalytics, LearningPath, PlatformAnalytics
+from .models import (
+    UserActivity, CourseAnalytics, CourseDailyStats, LearningCalendar, LearningPath, PlatformAnalytics
+)
 
 @admin.register(UserActivity)
 class UserActivityAdmin(admin.ModelAdmin):
@@ -14,6 +16,19 @@ class CourseAnalyticsAdmin(admin.ModelAdmin):
     search_fields = ('course__title',)
     readonly_fields = ('last_updated',)
 
+@admin.register(CourseDailyStats)
+class CourseDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('course', 'date', 'views', 'enrollments', 'completions', 'revenue')
+    list_filter = ('date',)
+    search_fields = ('course__title',)
+    ordering = ['-date']
+
+@admin.register(LearningCalendar)
+class LearningCalendarAdmin(admin.ModelAdmin):
+    list_display = ('user', 'last_active_day', 'longest_streak_days', 'updated_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('first_day', 'days', 'last_active_day', 'longest_streak_days', 'updated_at')
+
 @admin.register(PlatformAnalytics)
 class PlatformAnalyticsAdmin(admin.ModelAdmin):
     list_display = ('date', 'new_users', 'active_users', 'new_enrollments', 'daily_revenue')
@@ -0,0 +1,423 @@
+"""
+Buffered ingestion pipeline for UserActivity events.
+
+``track_activity`` only validates events and appends them to a buffer; the
+``flush_activity_buffer`` Celery task drains the buffer and writes events with
+``bulk_create``, so the database sees one INSERT per batch instead of one per
+event.
+
+Buffers:
+
+* ``RedisActivityBuffer`` - a Redis list shared by every web process and
+  drained by the Celery worker. A batch is moved to an in-flight list by a Lua
+  script before it is written, so a worker crash replays it instead of losing
+  it; event ids are generated at enqueue time and inserts ignore conflicts, so
+  replays are idempotent.
+* ``MemoryActivityBuffer`` - an in-process deque flushed inline once a batch
+  fills up or the flush interval passes. Only for single-process development.
+
+When the buffer holds ``MAX_PENDING`` events ``enqueue`` raises
+``BufferFull`` so the API can push back on clients. When Redis itself is
+unreachable events are appended to JSON-lines spill files on the web host;
+once Redis is back, the next ``enqueue`` on that host pushes them back onto
+the queue (a flush running on the same host replays them too).
+"""
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+# Atomically move up to ARGV[1] events from the queue to the in-flight list
+CLAIM_BATCH_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+# Redis' Lua stack limits how many values one unpack() call can push
+MAX_CLAIM_SIZE = 5000
+
+# How often a web process looks for spill files to push back onto the queue
+SPILL_CHECK_SECONDS = 30
+
+
+class BufferFull(Exception):
+    """Raised when the buffer is over its high-water mark"""
+
+
+def ingestion_settings():
+    return settings.ACTIVITY_INGESTION
+
+
+def build_event(user, data, ip_address=None, user_agent=''):
+    """Serialisable event dict for a validated activity payload"""
+    return {
+        'id': str(uuid.uuid4()),
+        'user_id': str(user.pk),
+        'activity_type': data['activity_type'],
+        'course_id': str(data['course_id']) if data.get('course_id') else None,
+        'lecture_id': str(data['lecture_id']) if data.get('lecture_id') else None,
+        'metadata': data.get('metadata') or {},
+        'ip_address': ip_address,
+        'user_agent': user_agent or '',
+        'created_at': timezone.now().isoformat(),
+    }
+
+
+def write_events(events):
+    """
+    Insert a batch of events with a single bulk INSERT.
+    
+    Events of users that no longer exist are dropped, and references to
+    courses or lectures that no longer exist are cleared, rather than failing
+    the whole batch. If the INSERT still fails, the events are written one at
+    a time and those the database rejects go to ``dead_letter``, so a bad
+    event cannot stall the pipeline. The users' learning calendars are
+    updated in the same transaction. Returns the number of events written.
+    """
+    from django.contrib.auth import get_user_model
+    from courses.models import Course, Lecture
+    from .models import UserActivity
+    
+    if not events:
+        return 0
+    
+    known_users = {
+        str(pk) for pk in get_user_model().objects.filter(
+            pk__in={e['user_id'] for e in events}
+        ).values_list('pk', flat=True)
+    }
+    events = [e for e in events if e['user_id'] in known_users]
+    course_ids = {e['course_id'] for e in events if e.get('course_id')}
+    lecture_ids = {e['lecture_id'] for e in events if e.get('lecture_id')}
+    known_courses = {
+        str(pk) for pk in Course.objects.filter(pk__in=course_ids).values_list('pk', flat=True)
+    } if course_ids else set()
+    known_lectures = {
+        str(pk) for pk in Lecture.objects.filter(pk__in=lecture_ids).values_list('pk', flat=True)
+    } if lecture_ids else set()
+    
+    activities = [
+        UserActivity(
+            id=event['id'],
+            user_id=event['user_id'],
+            activity_type=event['activity_type'],
+            course_id=event['course_id'] if event.get('course_id') in known_courses else None,
+            lecture_id=event['lecture_id'] if event.get('lecture_id') in known_lectures else None,
+            metadata=event.get('metadata') or {},
+            ip_address=event.get('ip_address'),
+            user_agent=event.get('user_agent', ''),
+            created_at=parse_datetime(event['created_at']) or timezone.now(),
+        )
+        for event in events
+    ]
+    
+    try:
+        insert_activities(activities)
+    except DatabaseError:
+        logger.exception('Activity batch failed, writing %d events one at a time', len(activities))
+        rejected = []
+        for activity, event in zip(activities, events):
+            try:
+                insert_activities([activity])
+            except DatabaseError as e:
+                rejected.append({**event, 'error': str(e)})
+        dead_letter(rejected)
+        return len(activities) - len(rejected)
+    return len(activities)
+
+
+def insert_activities(activities):
+    from .models import UserActivity
+    from .streaks import activity_days, record_activity
+    
+    with transaction.atomic():
+        UserActivity.objects.bulk_create(
+            activities,
+            batch_size=ingestion_settings()['BATCH_SIZE'],
+            ignore_conflicts=True,
+        )
+        record_activity(activity_days(activities))
+
+
+def dead_letter(events):
+    """Keep events the database rejected in ``SPILL_DIR/dead-letter.jsonl`` for inspection"""
+    if not events:
+        return
+    logger.error('Database rejected %d activity events, see dead-letter.jsonl', len(events))
+    directory = ingestion_settings()['SPILL_DIR']
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'dead-letter.jsonl'), 'a', encoding='utf-8') as handle:
+        handle.write(''.join(json.dumps(event) + '\n' for event in events))
+
+
+def same_file(handle, path):
+    """Whether ``path`` still names the open file, i.e. it was not claimed meanwhile"""
+    try:
+        return os.path.samestat(os.fstat(handle.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+class SpillFile:
+    """
+    Durable JSON-lines overflow used while the primary buffer is down.
+    
+    Each process appends to its own ``pending-<host>-<pid>`` file while
+    holding an exclusive ``flock`` on it. ``drain`` claims a file by renaming
+    it under the same lock, and an appender that finds its file renamed once
+    it has the lock starts a new one, so nothing is written to a file after
+    it was read. Spill files live on the host that wrote them, so only that
+    host's files are drained.
+    """
+    
+    def __init__(self, directory):
+        self.directory = directory
+        self.host = socket.gethostname()
+        self._lock = threading.Lock()
+    
+    def append(self, events):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'pending-{self.host}-{os.getpid()}.jsonl')
+        payload = ''.join(json.dumps(event) + '\n' for event in events)
+        with self._lock:
+            while True:
+                with open(path, 'a', encoding='utf-8') as handle:
+                    fcntl.flock(handle, fcntl.LOCK_EX)
+                    if same_file(handle, path):
+                        handle.write(payload)
+                        handle.flush()
+                        os.fsync(handle.fileno())
+                        return
+    
+    def files(self):
+        """This host's spill files, oldest first"""
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return []
+        prefixes = (f'pending-{self.host}-', f'claimed-{self.host}-')
+        return [name for name in names if name.startswith(prefixes)]
+    
+    def drain(self, write):
+        """Replay this host's spill files through ``write``; returns events replayed"""
+        replayed = 0
+        for name in self.files():
+            path = os.path.join(self.directory, name)
+            if name.startswith('pending-'):
+                path = self.claim(path)
+            if path:
+                replayed += self.replay(path, write)
+        return replayed
+    
+    def claim(self, path):
+        """Rename a pending file under its lock so its appender starts a fresh one"""
+        claimed = os.path.join(self.directory, f'claimed-{self.host}-{uuid.uuid4().hex}.jsonl')
+        try:
+            with open(path, 'rb') as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                if not same_file(handle, path):
+                    return None
+                os.replace(path, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+    
+    def replay(self, path, write):
+        try:
+            handle = open(path, encoding='utf-8')
+        except FileNotFoundError:
+            return 0
+        with handle:
+            try:
+                # Held until the file is removed, so two drains never replay it together
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            if not same_file(handle, path):
+                return 0
+            
+            events = []
+            for line in handle:
+                if line.strip():
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        logger.warning('Skipping a torn line in %s', path)
+            replayed = 0
+            batch_size = ingestion_settings()['BATCH_SIZE']
+            for start in range(0, len(events), batch_size):
+                replayed += write(events[start:start + batch_size])
+            os.remove(path)
+        return replayed
+
+
+class RedisActivityBuffer:
+    queue_key = 'analytics:activity:queue'
+    inflight_key = 'analytics:activity:inflight'
+    lock_key = 'analytics:activity:flush-lock'
+    
+    def __init__(self, options):
+        import redis
+        
+        self.options = options
+        self.client = redis.Redis.from_url(options['REDIS_URL'])
+        self.claim_batch = self.client.register_script(CLAIM_BATCH_SCRIPT)
+        self.spill = SpillFile(options['SPILL_DIR'])
+        self.spill_lock = threading.Lock()
+        self.next_spill_check = 0
+    
+    def enqueue(self, events):
+        import redis
+        
+        payload = [json.dumps(event) for event in events]
+        try:
+            if self.client.llen(self.queue_key) >= self.options['MAX_PENDING']:
+                raise BufferFull()
+            pending = self.client.rpush(self.queue_key, *payload)
+        except redis.RedisError:
+            logger.warning('Activity buffer unavailable, spilling %d events to disk', len(events))
+            self.spill.append(events)
+            return
+        
+        self.requeue_spilled()
+        
+        # Start a flush as soon as a full batch is waiting
+        batch_size = self.options['BATCH_SIZE']
+        if pending // batch_size > (pending - len(payload)) // batch_size:
+            from .tasks import flush_activity_buffer
+            flush_activity_buffer.delay()
+    
+    def requeue_spilled(self):
+        """Push events this host spilled while Redis was down back onto the queue"""
+        import redis
+        
+        now = time.monotonic()
+        if now < self.next_spill_check or not self.spill_lock.acquire(blocking=False):
+            return
+        try:
+            self.next_spill_check = now + SPILL_CHECK_SECONDS
+            if self.spill.files():
+                self.spill.drain(self.requeue)
+        except redis.RedisError:
+            logger.warning('Activity buffer unavailable, leaving spilled events on disk')
+        finally:
+            self.spill_lock.release()
+    
+    def requeue(self, events):
+        self.client.rpush(self.queue_key, *[json.dumps(event) for event in events])
+        return len(events)
+    
+    def pending(self):
+        return self.client.llen(self.queue_key)
+    
+    def flush(self, max_batches=None):
+        """Drain the queue in batches; only one flusher runs at a time"""
+        lock = self.client.lock(self.lock_key, timeout=300, blocking=False)
+        if not lock.acquire():
+            return 0
+        try:
+            written = self.spill.drain(write_events)
+            
+            # Replay a batch left behind by a crashed flush
+            stale = self.client.lrange(self.inflight_key, 0, -1)
+            if stale:
+                written += write_events([json.loads(item) for item in stale])
+                self.client.delete(self.inflight_key)
+            
+            batch_size = min(self.options['BATCH_SIZE'], MAX_CLAIM_SIZE)
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                items = self.claim_batch(keys=[self.queue_key, self.inflight_key], args=[batch_size])
+                if not items:
+                    break
+                written += write_events([json.loads(item) for item in items])
+                self.client.delete(self.inflight_key)
+                batches += 1
+                lock.extend(300, replace_ttl=True)
+            return written
+        finally:
+            lock.release()
+
+
+class MemoryActivityBuffer:
+    def __init__(self, options):
+        self.options = options
+        self.events = deque()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.last_flush = time.monotonic()
+    
+    def enqueue(self, events):
+        with self.lock:
+            if len(self.events) >= self.options['MAX_PENDING']:
+                raise BufferFull()
+            self.events.extend(events)
+            due = (
+                len(self.events) >= self.options['BATCH_SIZE']
+                or time.monotonic() - self.last_flush >= self.options['FLUSH_INTERVAL_SECONDS']
+            )
+        if due:
+            self.flush()
+    
+    def pending(self):
+        return len(self.events)
+    
+    def flush(self, max_batches=None):
+        if not self.flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            written = 0
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                with self.lock:
+                    count = min(len(self.events), self.options['BATCH_SIZE'])
+                    batch = [self.events.popleft() for _ in range(count)]
+                if not batch:
+                    break
+                try:
+                    written += write_events(batch)
+                except Exception:
+                    with self.lock:
+                        self.events.extendleft(reversed(batch))
+                    raise
+                batches += 1
+            self.last_flush = time.monotonic()
+            return written
+        finally:
+            self.flush_lock.release()
+
+
+BUFFER_BACKENDS = {
+    'redis': RedisActivityBuffer,
+    'memory': MemoryActivityBuffer,
+}
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """Process-wide buffer instance for the configured backend"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                options = ingestion_settings()
+                _buffer = BUFFER_BACKENDS[options['BACKEND']](options)
+    return _buffer
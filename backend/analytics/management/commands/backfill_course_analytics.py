@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from courses.models import Enrollment
+from analytics.models import UserActivity
+from analytics.rollups import refresh_course_analytics, rollup_days
+
+class Command(BaseCommand):
+    help = 'Backfill daily course rollups and CourseAnalytics from history, in chunks'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to roll up (YYYY-MM-DD), defaults to the oldest data')
+        parser.add_argument('--end', help='Last day to roll up (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--chunk-days', type=int, default=7, help='Days rolled up per transaction')
+    
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else self.oldest_day()
+            end = date.fromisoformat(options['end']) if options['end'] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        if start is None:
+            self.stdout.write(self.style.WARNING('No history to backfill'))
+            return
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be at least 1')
+        
+        chunk = timedelta(days=options['chunk_days'])
+        day = start
+        while day <= end:
+            chunk_end = min(day + chunk, end + timedelta(days=1))
+            touched = rollup_days(day, chunk_end, refresh=False)
+            self.stdout.write(f'Rolled up {day} to {chunk_end - timedelta(days=1)} ({len(touched)} courses)')
+            day = chunk_end
+        
+        refreshed = refresh_course_analytics()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed analytics for {refreshed} courses'))
+    
+    def oldest_day(self):
+        candidates = [
+            Enrollment.objects.order_by('enrolled_at').values_list('enrolled_at', flat=True).first(),
+            UserActivity.objects.order_by('created_at').values_list('created_at', flat=True).first(),
+        ]
+        candidates = [timezone.localtime(value).date() for value in candidates if value]
+        return min(candidates) if candidates else None
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from analytics.models import LearningCalendar, UserActivity
+from analytics.streaks import STREAK_ACTIVITY_TYPES, DayBitmap, sync_profiles
+
+class Command(BaseCommand):
+    help = 'Rebuild every learning calendar (and profile streaks) from UserActivity history'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users written per transaction')
+    
+    def handle(self, *args, **options):
+        days = UserActivity.objects.filter(
+            activity_type__in=STREAK_ACTIVITY_TYPES
+        ).annotate(day=TruncDate('created_at')).values_list('user_id', 'day').distinct().order_by('user_id', 'day')
+        
+        batch, bitmap, user_id = [], None, None
+        written = 0
+        for row_user_id, day in days.iterator():
+            if row_user_id != user_id:
+                if bitmap is not None:
+                    batch.append(self.build(user_id, bitmap))
+                user_id, bitmap = row_user_id, DayBitmap()
+            bitmap.add(day)
+            
+            if len(batch) >= options['batch_size']:
+                written += self.write(batch)
+                batch = []
+        
+        if bitmap is not None:
+            batch.append(self.build(user_id, bitmap))
+        written += self.write(batch)
+        
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt learning calendars for {written} users'))
+    
+    def build(self, user_id, bitmap):
+        return LearningCalendar(
+            user_id=user_id,
+            first_day=bitmap.first_day,
+            days=bytes(bitmap.bits),
+            last_active_day=max(bitmap),
+            longest_streak_days=bitmap.longest_streak(),
+            updated_at=timezone.now(),
+        )
+    
+    def write(self, calendars):
+        if not calendars:
+            return 0
+        with transaction.atomic():
+            LearningCalendar.objects.filter(user_id__in=[c.user_id for c in calendars]).delete()
+            LearningCalendar.objects.bulk_create(calendars)
+            sync_profiles(calendars, timezone.localdate())
+        return len(calendars)
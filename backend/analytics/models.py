@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from courses.models import Course, Lecture
 import uuid
 
@@ -28,12 +29,14 @@ class UserActivity(models.Model):
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True)
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the event is received, not when the buffered batch is written
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', 'activity_type']),
+            models.Index(fields=['user', '-created_at', '-id']),
             models.Index(fields=['course', 'activity_type']),
             models.Index(fields=['created_at']),
         ]
@@ -62,6 +65,40 @@ class CourseAnalytics(models.Model):
     def __str__(self):
         return f"Analytics for {self.course.title}"
 
+class CourseDailyStats(models.Model):
+    """Per-course daily rollup maintained by analytics.rollups"""
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    
+    views = models.PositiveIntegerField(default=0)
+    enrollments = models.PositiveIntegerField(default=0)
+    completions = models.PositiveIntegerField(default=0)
+    completion_minutes = models.PositiveIntegerField(default=0)  # summed enrollment-to-completion time
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['course', 'date']
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.course.title} - {self.date}"
+
+class LearningCalendar(models.Model):
+    """Per-user bitmap of days with learning activity, maintained by analytics.streaks"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='learning_calendar')
+    first_day = models.DateField()  # day represented by bit 0
+    days = models.BinaryField(default=bytes)  # bit n set = active on first_day + n days
+    last_active_day = models.DateField()
+    longest_streak_days = models.PositiveIntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user.email} - learning calendar"
+
 class LearningPath(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='learning_paths')
     courses = models.ManyToManyField(Course, through='LearningPathCourse')
@@ -0,0 +1,188 @@
+"""
+Daily course rollups feeding CourseAnalytics.
+
+``rollup_days`` recomputes ``CourseDailyStats`` for a date range from the raw
+UserActivity, Enrollment, Payment and MobileMoneyTransaction rows using one
+GROUP BY query per source, then ``refresh_course_analytics`` re-sums the
+daily rows of the affected courses into ``CourseAnalytics``. Days are always
+rebuilt whole, so rerunning a window (the scheduled task re-rolls the last
+couple of days, the backfill command walks history in chunks) is idempotent.
+Dashboards then read CourseAnalytics and never touch the raw tables.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from courses.models import Course, Enrollment
+from .models import CourseAnalytics, CourseDailyStats, UserActivity
+
+METRIC_FIELDS = ('views', 'enrollments', 'completions', 'completion_minutes', 'revenue')
+MONTHLY_WINDOW_DAYS = 30
+BULK_BATCH_SIZE = 1000
+
+
+def _bounds(start_date, end_date):
+    """Aware datetimes covering local days [start_date, end_date)"""
+    return (
+        timezone.make_aware(datetime.combine(start_date, time.min)),
+        timezone.make_aware(datetime.combine(end_date, time.min)),
+    )
+
+
+def _grouped(queryset, timestamp_field, start, end, **aggregates):
+    """Aggregates of ``queryset`` per (course, local day) inside [start, end)"""
+    return queryset.filter(**{
+        f'{timestamp_field}__gte': start,
+        f'{timestamp_field}__lt': end,
+    }).annotate(day=TruncDate(timestamp_field)).values('course_id', 'day').annotate(**aggregates).order_by()
+
+
+def compute_daily_stats(start_date, end_date):
+    """Map (course_id, day) to metric values for local days [start_date, end_date)"""
+    from payments.models import Payment
+    from mobile_payments.models import MobileMoneyTransaction
+    
+    start, end = _bounds(start_date, end_date)
+    rows = defaultdict(lambda: dict.fromkeys(METRIC_FIELDS, 0))
+    
+    views = _grouped(
+        UserActivity.objects.filter(activity_type='course_view', course__isnull=False),
+        'created_at', start, end, total=Count('id'),
+    )
+    for row in views:
+        rows[(row['course_id'], row['day'])]['views'] = row['total']
+    
+    for row in _grouped(Enrollment.objects.all(), 'enrolled_at', start, end, total=Count('id')):
+        rows[(row['course_id'], row['day'])]['enrollments'] = row['total']
+    
+    completions = _grouped(
+        Enrollment.objects.filter(completed=True, completed_at__isnull=False),
+        'completed_at', start, end,
+        total=Count('id'),
+        duration=Sum(ExpressionWrapper(F('completed_at') - F('enrolled_at'), output_field=DurationField())),
+    )
+    for row in completions:
+        stats = rows[(row['course_id'], row['day'])]
+        stats['completions'] = row['total']
+        stats['completion_minutes'] = int(row['duration'].total_seconds() // 60) if row['duration'] else 0
+    
+    revenue_sources = (
+        _grouped(Payment.objects.filter(payment_status='completed'), 'completed_at', start, end, total=Sum('amount')),
+        _grouped(MobileMoneyTransaction.objects.filter(status='confirmed'), 'confirmed_at', start, end, total=Sum('amount')),
+    )
+    for source in revenue_sources:
+        for row in source:
+            rows[(row['course_id'], row['day'])]['revenue'] += row['total'] or Decimal('0')
+    
+    return rows
+
+
+def rollup_days(start_date, end_date, refresh=True):
+    """
+    Rebuild CourseDailyStats for local days [start_date, end_date).
+    
+    Returns the ids of every course whose daily rows changed. With
+    ``refresh`` their CourseAnalytics rows are updated as well.
+    """
+    rows = compute_daily_stats(start_date, end_date)
+    
+    with transaction.atomic():
+        existing = CourseDailyStats.objects.filter(date__gte=start_date, date__lt=end_date)
+        touched = set(existing.values_list('course_id', flat=True).distinct())
+        existing.delete()
+        CourseDailyStats.objects.bulk_create(
+            [
+                CourseDailyStats(course_id=course_id, date=day, **metrics)
+                for (course_id, day), metrics in rows.items()
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        touched.update(course_id for course_id, _ in rows)
+        
+        if refresh:
+            refresh_course_analytics(touched)
+    return touched
+
+
+def _rate(numerator, denominator):
+    if not denominator:
+        return Decimal('0')
+    return min(Decimal('100'), Decimal(numerator * 100) / Decimal(denominator)).quantize(Decimal('0.01'))
+
+
+def refresh_course_analytics(course_ids=None):
+    """Re-sum daily rollups into CourseAnalytics for the given courses (all when None)"""
+    month_start = timezone.localdate() - timedelta(days=MONTHLY_WINDOW_DAYS)
+    
+    daily = CourseDailyStats.objects.all()
+    courses = Course.objects.all()
+    if course_ids is not None:
+        course_ids = list(course_ids)
+        daily = daily.filter(course_id__in=course_ids)
+        courses = courses.filter(pk__in=course_ids)
+    
+    totals = {
+        row['course_id']: row
+        for row in daily.values('course_id').annotate(
+            **{f'total_{field}': Sum(field) for field in METRIC_FIELDS},
+            monthly_revenue=Sum('revenue', filter=Q(date__gte=month_start)),
+        ).order_by()
+    }
+    
+    existing = {a.course_id: a for a in CourseAnalytics.objects.filter(course__in=courses)}
+    now = timezone.now()
+    to_create, to_update = [], []
+    
+    for course in courses.only('id', 'rating_sum', 'rating_count').iterator(chunk_size=BULK_BATCH_SIZE):
+        row = totals.get(course.pk, {})
+        views = row.get('total_views') or 0
+        enrollments = row.get('total_enrollments') or 0
+        completions = row.get('total_completions') or 0
+        
+        analytics = existing.get(course.pk) or CourseAnalytics(course_id=course.pk)
+        analytics.total_views = views
+        analytics.total_enrollments = enrollments
+        analytics.total_completions = completions
+        analytics.average_completion_time = (row.get('total_completion_minutes') or 0) // completions if completions else 0
+        analytics.average_rating = Decimal(course.average_rating).quantize(Decimal('0.01'))
+        analytics.conversion_rate = _rate(enrollments, views)
+        analytics.completion_rate = _rate(completions, enrollments)
+        analytics.revenue_total = row.get('total_revenue') or Decimal('0')
+        analytics.revenue_monthly = row.get('monthly_revenue') or Decimal('0')
+        analytics.last_updated = now
+        
+        (to_update if analytics.pk else to_create).append(analytics)
+    
+    CourseAnalytics.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+    CourseAnalytics.objects.bulk_update(
+        to_update,
+        [
+            'total_views', 'total_enrollments', 'total_completions', 'average_completion_time',
+            'average_rating', 'conversion_rate', 'completion_rate', 'revenue_total',
+            'revenue_monthly', 'last_updated',
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    return len(to_create) + len(to_update)
+
+
+def rollup_recent():
+    """
+    Scheduled rollup: rebuild the last few days and slide the monthly window.
+    
+    Courses whose monthly revenue may have aged out of the window are
+    refreshed even when they had no new activity.
+    """
+    lookback = settings.ANALYTICS_ROLLUP_LOOKBACK_DAYS
+    today = timezone.localdate()
+    touched = rollup_days(today - timedelta(days=lookback - 1), today + timedelta(days=1), refresh=False)
+    touched.update(
+        CourseAnalytics.objects.filter(revenue_monthly__gt=0).values_list('course_id', flat=True)
+    )
+    return refresh_course_analytics(touched)
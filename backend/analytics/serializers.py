@@ -7,6 +7,13 @@ class UserActivitySerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('id', 'user', 'created_at')
 
+class ActivityEventSerializer(serializers.Serializer):
+    """A single tracked event as posted by clients"""
+    activity_type = serializers.ChoiceField(choices=UserActivity.ACTIVITY_TYPES)
+    course_id = serializers.UUIDField(required=False, allow_null=True)
+    lecture_id = serializers.UUIDField(required=False, allow_null=True)
+    metadata = serializers.DictField(required=False, default=dict)
+
 class CourseAnalyticsSerializer(serializers.ModelSerializer):
     course_title = serializers.CharField(source='course.title', read_only=True)
     
@@ -0,0 +1,194 @@
+"""
+Learning streaks from a per-user daily activity bitmap.
+
+Each user has one LearningCalendar row whose ``days`` bytes hold one bit per
+calendar day starting at ``first_day``, so a year of history is 46 bytes.
+Ingestion sets the bits for every flushed batch (``record_activity``), and
+streaks, heatmaps and "active in the last N days" figures are answered from
+the bitmap alone, never from the UserActivity table. The running streak
+figures are mirrored onto UserProfile; ``reset_lapsed_streaks`` runs nightly
+to zero the current streak of users who stopped studying, as nothing is
+recorded for them.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+# Activity that counts towards a learning streak
+STREAK_ACTIVITY_TYPES = ('lecture_start', 'lecture_complete')
+
+
+class DayBitmap:
+    """A set of dates stored as a bitmap anchored at ``first_day``"""
+    
+    def __init__(self, first_day=None, data=b''):
+        self.first_day = first_day
+        self.bits = bytearray(data)
+    
+    @classmethod
+    def for_calendar(cls, calendar):
+        if calendar is None:
+            return cls()
+        return cls(calendar.first_day, calendar.days)
+    
+    def _offset(self, day):
+        return (day - self.first_day).days
+    
+    def __contains__(self, day):
+        if self.first_day is None:
+            return False
+        offset = self._offset(day)
+        return 0 <= offset < len(self.bits) * 8 and bool(self.bits[offset >> 3] & (1 << (offset & 7)))
+    
+    def add(self, day):
+        """Mark ``day`` active; returns False if it already was"""
+        if self.first_day is None:
+            self.first_day = day
+        offset = self._offset(day)
+        if offset < 0:
+            # Re-anchor earlier, a whole number of bytes at a time
+            pad = (-offset + 7) // 8
+            self.bits[:0] = bytes(pad)
+            self.first_day -= timedelta(days=pad * 8)
+            offset += pad * 8
+        if offset >= len(self.bits) * 8:
+            self.bits.extend(bytes((offset >> 3) + 1 - len(self.bits)))
+        
+        mask = 1 << (offset & 7)
+        if self.bits[offset >> 3] & mask:
+            return False
+        self.bits[offset >> 3] |= mask
+        return True
+    
+    def __iter__(self):
+        for index, byte in enumerate(self.bits):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield self.first_day + timedelta(days=index * 8 + bit)
+    
+    def days_between(self, start, end):
+        """Active dates in [start, end]"""
+        day = start
+        while day <= end:
+            if day in self:
+                yield day
+            day += timedelta(days=1)
+    
+    def streak_ending(self, day):
+        """Number of consecutive active days ending on ``day``"""
+        length = 0
+        while day in self:
+            length += 1
+            day -= timedelta(days=1)
+        return length
+    
+    def run_through(self, day):
+        """Length of the run of consecutive active days that contains ``day``"""
+        if day not in self:
+            return 0
+        after = 0
+        while day + timedelta(days=after + 1) in self:
+            after += 1
+        return self.streak_ending(day) + after
+    
+    def longest_streak(self):
+        longest = current = 0
+        previous = None
+        for day in self:
+            current = current + 1 if previous and day - previous == timedelta(days=1) else 1
+            longest = max(longest, current)
+            previous = day
+        return longest
+
+
+def current_streak(bitmap, today=None):
+    """
+    Consecutive active days up to today. A streak stays alive until the end of
+    the day after the last activity, so not having studied yet today does not
+    reset it.
+    """
+    today = today or timezone.localdate()
+    if today in bitmap:
+        return bitmap.streak_ending(today)
+    return bitmap.streak_ending(today - timedelta(days=1))
+
+
+def activity_days(activities):
+    """Group streak-relevant UserActivity objects into ``{user_id: {date, ...}}``"""
+    days = defaultdict(set)
+    for activity in activities:
+        if activity.activity_type in STREAK_ACTIVITY_TYPES:
+            days[activity.user_id].add(timezone.localtime(activity.created_at).date())
+    return days
+
+
+def sync_profiles(calendars, today):
+    from accounts.models import UserProfile
+    
+    by_user = {calendar.user_id: calendar for calendar in calendars}
+    profiles = list(UserProfile.objects.filter(user_id__in=by_user))
+    for profile in profiles:
+        calendar = by_user[profile.user_id]
+        profile.current_streak_days = current_streak(DayBitmap.for_calendar(calendar), today)
+        profile.longest_streak_days = calendar.longest_streak_days
+    UserProfile.objects.bulk_update(profiles, ['current_streak_days', 'longest_streak_days'])
+
+
+def reset_lapsed_streaks(today=None):
+    """Zero the mirrored current streak of users not active since before yesterday"""
+    from accounts.models import UserProfile
+    
+    today = today or timezone.localdate()
+    return UserProfile.objects.filter(current_streak_days__gt=0).exclude(
+        user__learning_calendar__last_active_day__gte=today - timedelta(days=1)
+    ).update(current_streak_days=0)
+
+
+def record_activity(user_days):
+    """
+    Set the bits for ``{user_id: {date, ...}}`` and refresh streak figures.
+    
+    Idempotent, so replayed ingestion batches are harmless.
+    """
+    from .models import LearningCalendar
+    
+    if not user_days:
+        return 0
+    
+    with transaction.atomic():
+        calendars = {
+            calendar.user_id: calendar
+            for calendar in LearningCalendar.objects.select_for_update().filter(user_id__in=user_days)
+        }
+        
+        now = timezone.now()
+        to_create, to_update = [], []
+        for user_id, days in user_days.items():
+            calendar = calendars.get(user_id)
+            bitmap = DayBitmap.for_calendar(calendar)
+            added = [day for day in sorted(days) if bitmap.add(day)]
+            if not added:
+                continue
+            
+            longest = max(bitmap.run_through(day) for day in added)
+            if calendar is None:
+                calendar = LearningCalendar(user_id=user_id, last_active_day=added[-1])
+                to_create.append(calendar)
+            else:
+                to_update.append(calendar)
+            calendar.first_day = bitmap.first_day
+            calendar.days = bytes(bitmap.bits)
+            calendar.last_active_day = max(calendar.last_active_day, added[-1])
+            calendar.longest_streak_days = max(calendar.longest_streak_days, longest)
+            calendar.updated_at = now
+        
+        LearningCalendar.objects.bulk_create(to_create)
+        LearningCalendar.objects.bulk_update(
+            to_update, ['first_day', 'days', 'last_active_day', 'longest_streak_days', 'updated_at']
+        )
+        sync_profiles(to_create + to_update, timezone.localdate())
+    return len(to_create) + len(to_update)
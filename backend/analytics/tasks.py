@@ -0,0 +1,23 @@
+from celery import shared_task
+
+from .ingestion import get_buffer
+
+
+@shared_task(ignore_result=True)
+def flush_activity_buffer():
+    """Write buffered UserActivity events to the database in batches"""
+    return get_buffer().flush()
+
+
+@shared_task(ignore_result=True)
+def rollup_course_analytics():
+    """Re-roll recent days of CourseDailyStats and refresh CourseAnalytics"""
+    from .rollups import rollup_recent
+    return rollup_recent()
+
+
+@shared_task(ignore_result=True)
+def reset_lapsed_streaks():
+    """Zero UserProfile.current_streak_days for users whose streak has lapsed"""
+    from . import streaks
+    return streaks.reset_lapsed_streaks()
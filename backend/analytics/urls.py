@@ -5,6 +5,7 @@ urlpatterns = [
     path('activities/', views.UserActivityListView.as_view(), name='user-activities'),
     path('track/', views.track_activity, name='track-activity'),
     path('user/stats/', views.user_learning_stats, name='user-learning-stats'),
+    path('user/calendar/', views.user_activity_calendar, name='user-activity-calendar'),
     path('instructor/stats/', views.instructor_analytics, name='instructor-analytics'),
     path('platform/stats/', views.platform_analytics, name='platform-analytics'),
     path('learning-paths/', views.LearningPathListCreateView.as_view(), name='learning-paths'),
@@ -1,16 +1,28 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Count, Avg, Sum
+from django.conf import settings
+from django.db.models import Count, Avg, Q, Sum
 from django.utils import timezone
 from datetime import timedelta
-from .models import UserActivity, CourseAnalytics, LearningPath, PlatformAnalytics
-from .serializers import UserActivitySerializer, CourseAnalyticsSerializer, LearningPathSerializer
+from .models import (
+    UserActivity, CourseDailyStats, LearningCalendar, LearningPath, PlatformAnalytics
+)
+from .ingestion import BufferFull, build_event, get_buffer
+from .streaks import DayBitmap, current_streak
+from .serializers import (
+    UserActivitySerializer, ActivityEventSerializer, CourseAnalyticsSerializer, LearningPathSerializer
+)
 from courses.models import Course, Enrollment
+from learnhub.pagination import KeysetPagination
+
+# Longest window the activity calendar endpoint will return
+MAX_CALENDAR_DAYS = 731
 
 class UserActivityListView(generics.ListAPIView):
     serializer_class = UserActivitySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         return UserActivity.objects.filter(user=self.request.user)
@@ -18,23 +30,42 @@ class UserActivityListView(generics.ListAPIView):
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def track_activity(request):
-    activity_type = request.data.get('activity_type')
-    course_id = request.data.get('course_id')
-    lecture_id = request.data.get('lecture_id')
-    metadata = request.data.get('metadata', {})
-    
-    activity = UserActivity.objects.create(
-        user=request.user,
-        activity_type=activity_type,
-        course_id=course_id,
-        lecture_id=lecture_id,
-        metadata=metadata,
-        ip_address=request.META.get('REMOTE_ADDR'),
-        user_agent=request.META.get('HTTP_USER_AGENT', '')
-    )
+    """Accept a single event, a list of events or {"events": [...]} for buffered ingestion"""
+    payload = request.data
+    if isinstance(payload, dict) and 'events' in payload:
+        payload = payload['events']
+    many = isinstance(payload, list)
+    
+    if many and len(payload) > settings.ACTIVITY_INGESTION['MAX_EVENTS_PER_REQUEST']:
+        return Response(
+            {'error': f"At most {settings.ACTIVITY_INGESTION['MAX_EVENTS_PER_REQUEST']} events per request"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    serializer = UserActivitySerializer(activity)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    serializer = ActivityEventSerializer(data=payload, many=many)
+    serializer.is_valid(raise_exception=True)
+    
+    ip_address = request.META.get('REMOTE_ADDR')
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    events = [
+        build_event(request.user, data, ip_address, user_agent)
+        for data in (serializer.validated_data if many else [serializer.validated_data])
+    ]
+    
+    try:
+        get_buffer().enqueue(events)
+    except BufferFull:
+        response = Response(
+            {'error': 'Activity ingestion is saturated, retry later'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        response['Retry-After'] = str(settings.ACTIVITY_INGESTION['FLUSH_INTERVAL_SECONDS'])
+        return response
+    
+    return Response(
+        {'accepted': len(events), 'ids': [event['id'] for event in events]},
+        status=status.HTTP_202_ACCEPTED
+    )
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -54,26 +85,39 @@ def user_learning_stats(request):
         'average_progress': enrollments.aggregate(avg_progress=Avg('progress_percentage'))['avg_progress'] or 0,
     }
     
-    # Learning streak
-    activities = UserActivity.objects.filter(
-        user=user,
-        activity_type__in=['lecture_start', 'lecture_complete']
-    ).order_by('-created_at')
+    # Learning streak, from the daily activity bitmap
+    calendar = LearningCalendar.objects.filter(user=user).first()
+    bitmap = DayBitmap.for_calendar(calendar)
+    today = timezone.localdate()
     
-    current_streak = 0
-    if activities.exists():
-        current_date = timezone.now().date()
-        for activity in activities:
-            if activity.created_at.date() == current_date:
-                current_streak += 1
-                current_date -= timedelta(days=1)
-            else:
-                break
-    
-    stats['current_streak'] = current_streak
+    stats['current_streak'] = current_streak(bitmap, today)
+    stats['longest_streak'] = calendar.longest_streak_days if calendar else 0
+    stats['active_days_last_30'] = len(list(bitmap.days_between(today - timedelta(days=29), today)))
     
     return Response(stats)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def user_activity_calendar(request):
+    """Days with learning activity over the last ``days`` days, for heatmaps"""
+    try:
+        days = min(max(int(request.query_params.get('days', 365)), 1), MAX_CALENDAR_DAYS)
+    except ValueError:
+        return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    calendar = LearningCalendar.objects.filter(user=request.user).first()
+    bitmap = DayBitmap.for_calendar(calendar)
+    today = timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    
+    return Response({
+        'start': start,
+        'end': today,
+        'active_days': list(bitmap.days_between(start, today)),
+        'current_streak': current_streak(bitmap, today),
+        'longest_streak': calendar.longest_streak_days if calendar else 0,
+    })
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def instructor_analytics(request):
@@ -83,39 +127,51 @@ def instructor_analytics(request):
             status=status.HTTP_403_FORBIDDEN
         )
     
+    # Reads only the maintained Course counters and the CourseAnalytics /
+    # CourseDailyStats rollups; see analytics.rollups.
     courses = Course.objects.filter(instructor=request.user)
     
-    # Calculate instructor stats
-    stats = {
-        'total_courses': courses.count(),
-        'published_courses': courses.filter(status='published').count(),
-        'draft_courses': courses.filter(status='draft').count(),
-        'total_students': sum([course.total_students for course in courses]),
-        'total_revenue': sum([course.total_revenue for course in courses]),
-        'average_rating': courses.aggregate(avg_rating=Avg('reviews__rating'))['avg_rating'] or 0,
-    }
+    totals = courses.aggregate(
+        total_courses=Count('id'),
+        published_courses=Count('id', filter=Q(status='published')),
+        draft_courses=Count('id', filter=Q(status='draft')),
+        total_students=Sum('enrollment_count'),
+        rating_sum=Sum('rating_sum'),
+        rating_count=Sum('rating_count'),
+    )
     
-    # Monthly stats
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    recent_enrollments = Enrollment.objects.filter(
-        course__in=courses,
-        enrolled_at__gte=thirty_days_ago
+    # Total and monthly revenue both come from the daily rollups of card
+    # and mobile money payments, so the two figures agree
+    thirty_days_ago = timezone.localdate() - timedelta(days=30)
+    rollups = CourseDailyStats.objects.filter(course__instructor=request.user).aggregate(
+        total_revenue=Sum('revenue'),
+        monthly_enrollments=Sum('enrollments', filter=Q(date__gte=thirty_days_ago)),
+        monthly_revenue=Sum('revenue', filter=Q(date__gte=thirty_days_ago)),
     )
     
-    stats['monthly_enrollments'] = recent_enrollments.count()
-    stats['monthly_revenue'] = sum([e.amount_paid for e in recent_enrollments])
+    stats = {
+        'total_courses': totals['total_courses'],
+        'published_courses': totals['published_courses'],
+        'draft_courses': totals['draft_courses'],
+        'total_students': totals['total_students'] or 0,
+        'total_revenue': rollups['total_revenue'] or 0,
+        'average_rating': (totals['rating_sum'] / totals['rating_count']) if totals['rating_count'] else 0,
+        'monthly_enrollments': rollups['monthly_enrollments'] or 0,
+        'monthly_revenue': rollups['monthly_revenue'] or 0,
+    }
     
     # Course performance
     course_stats = []
-    for course in courses.filter(status='published'):
-        course_analytics, created = CourseAnalytics.objects.get_or_create(course=course)
+    for course in courses.filter(status='published').select_related('analytics'):
+        course_analytics = getattr(course, 'analytics', None)
         course_stats.append({
             'course_id': course.id,
             'course_title': course.title,
             'total_students': course.total_students,
-            'total_revenue': course.total_revenue,
+            'total_revenue': course_analytics.revenue_total if course_analytics else 0,
             'average_rating': course.average_rating,
-            'completion_rate': course_analytics.completion_rate,
+            'completion_rate': course_analytics.completion_rate if course_analytics else 0,
+            'analytics_updated_at': course_analytics.last_updated if course_analytics else None,
         })
     
     stats['course_performance'] = course_stats
@@ -13,7 +13,11 @@ class CourseAdmin(admin.ModelAdmin):
     list_display = ('title', 'instructor', 'category', 'status', 'price', 'is_free', 'created_at')
     list_filter = ('status', 'difficulty_level', 'is_free', 'is_bestseller', 'category', 'created_at')
     search_fields = ('title', 'description', 'instructor__email')
-    readonly_fields = ('id', 'created_at', 'updated_at')
+    readonly_fields = (
+        'id', 'created_at', 'updated_at',
+        'rating_sum', 'rating_count', 'enrollment_count', 'completed_revenue',
+        'total_duration', 'total_duration_seconds', 'total_lectures',
+    )
     
     fieldsets = (
         ('Basic Information', {
@@ -33,7 +37,8 @@ class CourseAdmin(admin.ModelAdmin):
             'fields': ('is_bestseller', 'is_featured')
         }),
         ('Statistics', {
-            'fields': ('total_duration', 'total_lectures'),
+            'fields': ('total_duration', 'total_duration_seconds', 'total_lectures', 'rating_sum', 'rating_count',
+                      'enrollment_count', 'completed_revenue'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
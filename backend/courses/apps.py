@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class CoursesConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'courses'
+    verbose_name = 'Courses'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
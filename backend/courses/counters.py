@@ -0,0 +1,109 @@
+"""
+Denormalised catalog counters stored on Course.
+
+Review and Enrollment writes push their contribution onto the parent course
+with a single ``F()`` UPDATE, so catalog pages can read ratings, student
+counts and revenue straight off the course row instead of aggregating the
+child tables per course.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import detail_cache
+from .models import Course, Enrollment, Review
+
+COUNTER_FIELDS = ('rating_sum', 'rating_count', 'enrollment_count', 'completed_revenue')
+
+REVIEW_TRACKED_FIELDS = ('course_id', 'rating')
+ENROLLMENT_TRACKED_FIELDS = ('course_id', 'payment_status', 'amount_paid')
+
+
+def review_contribution(values):
+    """Counter values a single review adds to its course"""
+    return values['course_id'], {
+        'rating_sum': values['rating'],
+        'rating_count': 1,
+    }
+
+
+def enrollment_contribution(values):
+    """Counter values a single enrollment adds to its course"""
+    revenue = values['amount_paid'] if values['payment_status'] == 'completed' else Decimal('0')
+    return values['course_id'], {
+        'enrollment_count': 1,
+        'completed_revenue': Decimal(str(revenue or 0)),
+    }
+
+
+def apply_transition(old, new):
+    """
+    Move a row's contribution from its old state to its new one.
+    
+    ``old`` and ``new`` are ``(course_id, {field: value})`` pairs as returned by
+    the ``*_contribution`` helpers, or ``None`` for inserts and deletes.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    if old is not None:
+        for field, value in old[1].items():
+            deltas[old[0]][field] -= value
+    if new is not None:
+        for field, value in new[1].items():
+            deltas[new[0]][field] += value
+    
+    changed = []
+    for course_id, fields in deltas.items():
+        changes = {field: F(field) + value for field, value in fields.items() if value}
+        if course_id and changes:
+            Course.objects.filter(pk=course_id).update(**changes)
+            changed.append(course_id)
+    detail_cache.invalidate(changed)
+
+
+def actual_counter_expressions():
+    """Subquery expressions computing each counter from the source tables"""
+    reviews = Review.objects.filter(course=OuterRef('pk')).order_by().values('course')
+    enrollments = Enrollment.objects.filter(course=OuterRef('pk')).order_by().values('course')
+    
+    return {
+        'rating_sum': Coalesce(
+            Subquery(reviews.annotate(total=Sum('rating')).values('total')),
+            Value(0), output_field=IntegerField(),
+        ),
+        'rating_count': Coalesce(
+            Subquery(reviews.annotate(total=Count('id')).values('total')),
+            Value(0), output_field=IntegerField(),
+        ),
+        'enrollment_count': Coalesce(
+            Subquery(enrollments.annotate(total=Count('id')).values('total')),
+            Value(0), output_field=IntegerField(),
+        ),
+        'completed_revenue': Coalesce(
+            Subquery(
+                enrollments.filter(payment_status='completed')
+                .annotate(total=Sum('amount_paid')).values('total')
+            ),
+            Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    }
+
+
+def drifted_courses(queryset=None):
+    """Courses whose stored counters disagree with the source tables"""
+    queryset = Course.objects.all() if queryset is None else queryset
+    expressions = actual_counter_expressions()
+    annotated = queryset.annotate(**{f'actual_{name}': expr for name, expr in expressions.items()})
+    
+    drift = Q()
+    for name in COUNTER_FIELDS:
+        drift |= ~Q(**{name: F(f'actual_{name}')})
+    return annotated.filter(drift)
+
+
+def rebuild_counters(queryset=None):
+    """Recompute every counter from scratch in a single UPDATE"""
+    queryset = Course.objects.all() if queryset is None else queryset
+    detail_cache.invalidate_all()
+    return queryset.update(**actual_counter_expressions())
@@ -0,0 +1,193 @@
+"""
+Curriculum totals and ordering.
+
+Section lecture counts and durations used to be recomputed on every
+serialization, while ``Course.total_duration`` and ``total_lectures`` were
+typed in by hand. Like the counters in ``counters.py``, they are now
+maintained incrementally: creating, editing, moving or deleting a lecture
+pushes its difference onto the affected sections and courses with ``F()``
+UPDATEs, and a section moved to another course takes its totals along.
+
+``reorder`` rewrites the order of a course's sections, and the order and
+section of its lectures, with one ``CASE`` UPDATE per table, then
+recomputes the totals of the sections lectures moved between with one more.
+``rebuild_totals`` recomputes everything from the lecture rows.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import detail_cache
+from .models import Course, Lecture, Section
+
+LECTURE_TRACKED_FIELDS = ('section_id', 'video_duration')
+
+
+class ReorderError(ValueError):
+    pass
+
+
+def apply_course_deltas(deltas):
+    """Add ``{course_id: (lectures, seconds)}`` to the course totals"""
+    for course_id, (lectures, seconds) in deltas.items():
+        if lectures or seconds:
+            Course.objects.filter(pk=course_id).update(
+                total_lectures=F('total_lectures') + lectures,
+                total_duration_seconds=F('total_duration_seconds') + seconds,
+                # Right-hand sides see the old row, so add the delta again
+                total_duration=(F('total_duration_seconds') + seconds) / 60,
+            )
+    detail_cache.invalidate(deltas)
+
+
+def apply_lecture_transition(old, new):
+    """
+    Move a lecture's contribution from its old state to its new one.
+    
+    ``old`` and ``new`` are ``{'section_id', 'video_duration'}`` dicts, or
+    ``None`` for inserts and deletes.
+    """
+    section_deltas = defaultdict(lambda: [0, 0])
+    for values, sign in ((old, -1), (new, 1)):
+        if values is not None and values['section_id']:
+            delta = section_deltas[values['section_id']]
+            delta[0] += sign
+            delta[1] += sign * (values['video_duration'] or 0)
+    section_deltas = {section_id: delta for section_id, delta in section_deltas.items() if any(delta)}
+    if not section_deltas:
+        return
+    
+    courses = dict(Section.objects.filter(pk__in=list(section_deltas)).values_list('id', 'course_id'))
+    course_deltas = defaultdict(lambda: [0, 0])
+    for section_id, (lectures, seconds) in section_deltas.items():
+        Section.objects.filter(pk=section_id).update(
+            lecture_count=F('lecture_count') + lectures,
+            total_duration=F('total_duration') + seconds,
+        )
+        if section_id in courses:
+            course_deltas[courses[section_id]][0] += lectures
+            course_deltas[courses[section_id]][1] += seconds
+    apply_course_deltas(course_deltas)
+
+
+def apply_section_move(section, old_course_id):
+    """Move a section's totals from ``old_course_id`` to its current course"""
+    # The instance may have been loaded before lectures changed the totals
+    section.lecture_count, section.total_duration = Section.objects.filter(pk=section.pk).values_list(
+        'lecture_count', 'total_duration'
+    ).get()
+    apply_course_deltas({
+        old_course_id: (-section.lecture_count, -section.total_duration),
+        section.course_id: (section.lecture_count, section.total_duration),
+    })
+
+
+def actual_section_expressions():
+    lectures = Lecture.objects.filter(section=OuterRef('pk')).order_by().values('section')
+    return {
+        'lecture_count': Coalesce(
+            Subquery(lectures.annotate(total=Count('id')).values('total')),
+            Value(0), output_field=IntegerField(),
+        ),
+        'total_duration': Coalesce(
+            Subquery(lectures.annotate(total=Sum('video_duration')).values('total')),
+            Value(0), output_field=IntegerField(),
+        ),
+    }
+
+
+def actual_course_expressions():
+    lectures = Lecture.objects.filter(section__course=OuterRef('pk')).order_by().values('section__course')
+    seconds = Coalesce(
+        Subquery(lectures.annotate(total=Sum('video_duration')).values('total')),
+        Value(0), output_field=IntegerField(),
+    )
+    return {
+        'total_lectures': Coalesce(
+            Subquery(lectures.annotate(total=Count('id')).values('total')),
+            Value(0), output_field=IntegerField(),
+        ),
+        'total_duration_seconds': seconds,
+        'total_duration': seconds / 60,
+    }
+
+
+def refresh_sections(section_ids):
+    """Recompute the totals of ``section_ids`` in a single UPDATE"""
+    return Section.objects.filter(pk__in=list(section_ids)).update(**actual_section_expressions())
+
+
+def rebuild_totals(courses=None):
+    """Recompute section and course totals from scratch, one UPDATE each"""
+    courses = Course.objects.all() if courses is None else courses
+    Section.objects.filter(course__in=courses).update(**actual_section_expressions())
+    detail_cache.invalidate_all()
+    return courses.update(**actual_course_expressions())
+
+
+def positions(ids, value=lambda position, pk: position):
+    """CASE expression mapping each pk in ``ids`` to a value, by default its position"""
+    return Case(
+        *[When(pk=pk, then=Value(value(position, pk))) for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+
+
+def reorder(course, section_ids=None, lectures=None):
+    """
+    Rewrite the order of a course's curriculum; raises ReorderError.
+    
+    ``section_ids`` lists every section of the course in its new order.
+    ``lectures`` maps section ids to the lecture ids they should hold, in
+    order, and may move lectures between sections of the course; each
+    section listed must list all of its lectures that are not moved away.
+    """
+    with transaction.atomic():
+        sections = set(
+            Section.objects.select_for_update().filter(course=course).values_list('id', flat=True)
+        )
+        if section_ids is not None:
+            if len(section_ids) != len(sections) or set(section_ids) != sections:
+                raise ReorderError("sections must list every section of the course once")
+            Section.objects.filter(course=course).update(order=positions(section_ids))
+        
+        if lectures:
+            unknown = set(lectures) - sections
+            if unknown:
+                raise ReorderError(f"Sections not in this course: {sorted(unknown)}")
+            
+            current = dict(Lecture.objects.filter(section__course=course).values_list('id', 'section_id'))
+            placements = {}
+            for section_id, lecture_ids in lectures.items():
+                for position, lecture_id in enumerate(lecture_ids):
+                    if lecture_id not in current:
+                        raise ReorderError(f"Lecture {lecture_id} is not in this course")
+                    if lecture_id in placements:
+                        raise ReorderError(f"Lecture {lecture_id} is listed more than once")
+                    placements[lecture_id] = (section_id, position)
+            for section_id in lectures:
+                left_out = [
+                    lecture_id for lecture_id, current_section in current.items()
+                    if current_section == section_id and lecture_id not in placements
+                ]
+                if left_out:
+                    raise ReorderError(f"Section {section_id} must list all of its lectures")
+            
+            lecture_ids = list(placements)
+            Lecture.objects.filter(pk__in=lecture_ids).update(
+                section_id=positions(lecture_ids, lambda position, pk: placements[pk][0]),
+                order=positions(lecture_ids, lambda position, pk: placements[pk][1]),
+            )
+            
+            moved = {
+                section_id
+                for lecture_id, (new_section, _) in placements.items()
+                if current[lecture_id] != new_section
+                for section_id in (current[lecture_id], new_section)
+            }
+            if moved:
+                refresh_sections(moved)
+        
+        detail_cache.invalidate([course.pk])
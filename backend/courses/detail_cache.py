@@ -0,0 +1,103 @@
+"""
+Cached course detail payloads.
+
+``CourseDetailView`` serializes the whole curriculum, the category, the
+instructor and the review count of a course on every view. The rendered JSON
+is now cached per course and content version:
+
+* every course has a version token in the cache, replaced after commit
+  whenever the course, its sections, lectures or reviews change, its
+  counters move (see ``counters.py``), or its category or instructor is
+  edited (see ``signals.py``); ``invalidate_all`` replaces a shared
+  generation token for bulk rewrites
+* the body and a strong ETag (a hash of the body) are cached under the
+  version current when rendering started, so a payload rendered from rows
+  read before a change is never served after it
+* hits are served from the cache, and requests whose ``If-None-Match``
+  matches get a 304; neither touches the ORM
+
+Tokens are random rather than counters, so a version key evicted from the
+cache can never come back as a value an old payload was stored under.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+GENERATION_KEY = 'courses:detail-generation'
+
+# Part of every payload key; bump it when the serialized fields change so
+# payloads rendered by older code are never served
+PAYLOAD_FORMAT = 2
+
+
+def detail_settings():
+    return settings.COURSE_DETAIL_CACHE
+
+
+def version_key(course_id):
+    return f'courses:detail-version:{course_id}'
+
+
+def current_version(course_id):
+    keys = [GENERATION_KEY, version_key(course_id)]
+    tokens = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in tokens}
+    if missing:
+        # add() so concurrent first readers settle on one token
+        for key, token in missing.items():
+            if not cache.add(key, token, None):
+                token = cache.get(key, token)
+            tokens[key] = token
+    return f'{tokens[GENERATION_KEY]}.{tokens[version_key(course_id)]}'
+
+
+def payload_key(course_id, request):
+    # Image and file fields are rendered as absolute URLs
+    origin = hashlib.md5(request.build_absolute_uri('/').encode()).hexdigest()[:12]
+    return f'courses:detail:{PAYLOAD_FORMAT}:{course_id}:{current_version(course_id)}:{origin}'
+
+
+def get_payload(key):
+    return cache.get(key)
+
+
+def store_payload(key, body):
+    entry = {'body': body, 'etag': quote_etag(hashlib.sha256(body).hexdigest()[:32])}
+    cache.set(key, entry, detail_settings()['TIMEOUT'])
+    return entry
+
+
+def respond(request, entry):
+    """200 with the cached body, or 304 if the client already has it"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if '*' in etags or entry['etag'] in etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = entry['etag']
+            return response
+
+    response = HttpResponse(entry['body'], content_type='application/json')
+    response['ETag'] = entry['etag']
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _bump(course_ids):
+    cache.set_many({version_key(course_id): uuid.uuid4().hex for course_id in course_ids}, None)
+
+
+def invalidate(course_ids):
+    """Retire the cached payloads of ``course_ids`` once the current transaction commits"""
+    course_ids = {course_id for course_id in course_ids if course_id}
+    if course_ids:
+        transaction.on_commit(lambda: _bump(course_ids))
+
+
+def invalidate_all():
+    transaction.on_commit(lambda: cache.set(GENERATION_KEY, uuid.uuid4().hex, None))
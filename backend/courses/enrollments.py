@@ -0,0 +1,69 @@
+"""
+Bulk enrollment of paying users.
+
+Payment confirmation paths (mobile money, Stripe webhooks) confirm many
+purchases at once; ``create_paid_enrollments`` enrolls them with one
+existence query and one INSERT, then adds the new rows to
+``courses.counters`` with one UPDATE per course, since ``bulk_create``
+skips the signals that normally maintain them.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from .counters import apply_transition, enrollment_contribution
+from .models import Enrollment
+
+
+def create_paid_enrollments(purchases):
+    """
+    Create completed enrollments for ``purchases`` (anything with ``user_id``,
+    ``course_id`` and ``amount``), skipping users already enrolled.
+    """
+    existing = set(
+        Enrollment.objects.filter(
+            user_id__in={purchase.user_id for purchase in purchases},
+            course_id__in={purchase.course_id for purchase in purchases}
+        ).values_list('user_id', 'course_id')
+    )
+    enrollments = {}
+    for purchase in purchases:
+        key = (purchase.user_id, purchase.course_id)
+        if key not in existing and key not in enrollments:
+            enrollments[key] = Enrollment(
+                user_id=purchase.user_id,
+                course_id=purchase.course_id,
+                amount_paid=purchase.amount,
+                payment_status='completed'
+            )
+    if not enrollments:
+        return []
+    
+    try:
+        with transaction.atomic():
+            Enrollment.objects.bulk_create(enrollments.values())
+    except IntegrityError:
+        # Enrolled concurrently; the per-row path keeps the course counters right
+        created = []
+        for enrollment in enrollments.values():
+            enrollment, was_created = Enrollment.objects.get_or_create(
+                user_id=enrollment.user_id,
+                course_id=enrollment.course_id,
+                defaults={'amount_paid': enrollment.amount_paid, 'payment_status': 'completed'}
+            )
+            if was_created:
+                created.append(enrollment)
+        return created
+    
+    per_course = defaultdict(lambda: defaultdict(int))
+    for enrollment in enrollments.values():
+        course_id, values = enrollment_contribution({
+            'course_id': enrollment.course_id,
+            'payment_status': enrollment.payment_status,
+            'amount_paid': enrollment.amount_paid,
+        })
+        for field, value in values.items():
+            per_course[course_id][field] += value
+    for course_id, values in per_course.items():
+        apply_transition(None, (course_id, values))
+    return list(enrollments.values())
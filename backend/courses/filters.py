@@ -1,5 +1,8 @@
 import django_filters
+from django.db.models import F
+from rest_framework import filters
 from .models import Course, Category
+from .search import search_courses
 
 class CourseFilter(django_filters.FilterSet):
     category = django_filters.ModelChoiceFilter(queryset=Category.objects.all())
@@ -14,5 +17,21 @@ class CourseFilter(django_filters.FilterSet):
         fields = ['category', 'difficulty_level', 'is_free', 'language', 'is_bestseller']
     
     def filter_by_rating(self, queryset, name, value):
-        # This would require a custom annotation for average rating
-        return queryset
+        # rating_sum / rating_count >= value, without dividing in SQL
+        return queryset.filter(rating_count__gt=0, rating_sum__gte=F('rating_count') * value)
+
+
+class CourseSearchFilter(filters.SearchFilter):
+    """SearchFilter backed by the course inverted index, ranked by relevance"""
+    
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').replace('\x00', '')
+        if not query.strip():
+            return queryset
+        
+        queryset = search_courses(queryset, query)
+        
+        # Relevance wins unless the client asked for an explicit ordering
+        if request.query_params.get(filters.OrderingFilter.ordering_param):
+            return queryset
+        return queryset.order_by('-search_rank', *queryset.query.order_by)
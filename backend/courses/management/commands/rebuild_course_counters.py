@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from courses.counters import COUNTER_FIELDS, drifted_courses, rebuild_counters
+
+class Command(BaseCommand):
+    help = 'Rebuild denormalised course counters and report drift'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report courses whose counters have drifted, do not rewrite them',
+        )
+    
+    def handle(self, *args, **options):
+        drifted = list(drifted_courses().values(
+            'id', 'title', *COUNTER_FIELDS, *[f'actual_{name}' for name in COUNTER_FIELDS]
+        ))
+        
+        for course in drifted:
+            changes = ', '.join(
+                f"{name} {course[name]} -> {course[f'actual_{name}']}"
+                for name in COUNTER_FIELDS
+                if course[name] != course[f'actual_{name}']
+            )
+            self.stdout.write(self.style.WARNING(f"{course['title']} ({course['id']}): {changes}"))
+        
+        if options['verify']:
+            if drifted:
+                self.stdout.write(self.style.WARNING(f'{len(drifted)} courses have drifted counters'))
+            else:
+                self.stdout.write(self.style.SUCCESS('All course counters are consistent'))
+            return
+        
+        updated = rebuild_counters()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt counters for {updated} courses ({len(drifted)} had drifted)')
+        )
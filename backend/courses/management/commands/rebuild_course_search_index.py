@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from courses.search import index_courses
+
+class Command(BaseCommand):
+    help = 'Rebuild the course search inverted index'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+    
+    def handle(self, *args, **options):
+        indexed = index_courses(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} courses'))
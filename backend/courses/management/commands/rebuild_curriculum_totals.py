@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from courses.curriculum import rebuild_totals
+
+class Command(BaseCommand):
+    help = 'Recompute section and course lecture counts and durations from the lectures'
+    
+    def handle(self, *args, **options):
+        updated = rebuild_totals()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt curriculum totals for {updated} courses'))
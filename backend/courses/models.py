@@ -1,10 +1,44 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
 
 User = get_user_model()
 
+class LoadedValuesMixin:
+    """Remember the column values a row was loaded with and save atomically.
+
+    Signal handlers that maintain derived data (``courses.counters``,
+    ``courses.curriculum``, ``courses.search``) diff these values against the
+    ones being written, so only real changes do extra work, and the row write
+    and derived updates commit or roll back together.
+
+    Columns listed in ``derived_fields`` are maintained with ``F()`` UPDATEs,
+    so saving an existing row without ``update_fields`` leaves them out
+    rather than writing back the values it was loaded with.
+    """
+    
+    derived_fields = ()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        if (
+            self.derived_fields and not args and not self._state.adding
+            and kwargs.get('update_fields') is None and not kwargs.get('force_insert')
+        ):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.derived_fields
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
@@ -20,7 +54,7 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-class Course(models.Model):
+class Course(LoadedValuesMixin, models.Model):
     DIFFICULTY_CHOICES = [
         ('beginner', 'Beginner'),
         ('intermediate', 'Intermediate'),
@@ -58,48 +92,90 @@ class Course(models.Model):
     is_bestseller = models.BooleanField(default=False)
     is_featured = models.BooleanField(default=False)
     
+    # Curriculum totals maintained by courses.curriculum
     total_duration = models.PositiveIntegerField(default=0)  # in minutes
+    total_duration_seconds = models.PositiveIntegerField(default=0)
     total_lectures = models.PositiveIntegerField(default=0)
     
+    # Denormalised counters maintained by courses.counters
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    enrollment_count = models.PositiveIntegerField(default=0)
+    completed_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(blank=True, null=True)
     
+    derived_fields = (
+        'total_duration', 'total_duration_seconds', 'total_lectures',
+        'rating_sum', 'rating_count', 'enrollment_count', 'completed_revenue',
+    )
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'enrollment_count']),
+        ]
     
     def __str__(self):
         return self.title
     
+    def save(self, *args, **kwargs):
+        # Publication date of record for dashboard.metrics; kept if unpublished
+        if self.status == 'published' and self.published_at is None:
+            self.published_at = timezone.now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'published_at'}
+        super().save(*args, **kwargs)
+    
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews:
-            return sum([r.rating for r in reviews]) / len(reviews)
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return 0
     
     @property
     def total_students(self):
-        return self.enrollments.count()
+        return self.enrollment_count
     
     @property
     def total_revenue(self):
-        return sum([e.amount_paid for e in self.enrollments.filter(payment_status='completed')])
+        return self.completed_revenue
+
+class CourseSearchTerm(models.Model):
+    """Posting in the course search inverted index (see courses.search)"""
+    term = models.CharField(max_length=64, db_index=True)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['term', 'course']
+    
+    def __str__(self):
+        return f"{self.term} -> {self.course_id} ({self.weight})"
 
-class Section(models.Model):
+class Section(LoadedValuesMixin, models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='sections')
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     order = models.PositiveIntegerField(default=0)
+    
+    # Maintained by courses.curriculum
+    lecture_count = models.PositiveIntegerField(default=0)
+    total_duration = models.PositiveIntegerField(default=0)  # in seconds
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
+    derived_fields = ('lecture_count', 'total_duration')
+    
     class Meta:
         ordering = ['order']
     
     def __str__(self):
         return f"{self.course.title} - {self.title}"
 
-class Lecture(models.Model):
+class Lecture(LoadedValuesMixin, models.Model):
     LECTURE_TYPES = [
         ('video', 'Video'),
         ('text', 'Text'),
@@ -132,7 +208,7 @@ class Lecture(models.Model):
     def __str__(self):
         return f"{self.section.course.title} - {self.title}"
 
-class Enrollment(models.Model):
+class Enrollment(LoadedValuesMixin, models.Model):
     PAYMENT_STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('completed', 'Completed'),
@@ -185,7 +261,7 @@ class LectureProgress(models.Model):
     def __str__(self):
         return f"{self.enrollment.user.email} - {self.lecture.title}"
 
-class Review(models.Model):
+class Review(LoadedValuesMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
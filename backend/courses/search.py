@@ -0,0 +1,165 @@
+"""
+Course search backed by an inverted index.
+
+Every course is tokenised into ``CourseSearchTerm`` postings (term, course,
+weight) covering its title, subtitle, description, category and instructor
+name. A search looks the query terms up by index instead of scanning the
+catalog with ``icontains``; the last term is matched as a prefix so the
+endpoint can serve type-ahead. Postings are plain rows with a B-tree index on
+``term``, so the same code runs on PostgreSQL and on the SQLite dev database.
+"""
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Q, Value, When
+
+from .models import Course, CourseSearchTerm
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MIN_TOKEN_LENGTH = 2
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+MAX_TERM_FREQUENCY = 5
+
+STOP_WORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'the', 'to', 'with', 'you', 'your',
+})
+
+# Weight of a single occurrence of a term in each indexed field
+FIELD_WEIGHTS = {
+    'title': 10,
+    'subtitle': 5,
+    'category': 4,
+    'instructor': 4,
+    'description': 1,
+}
+
+# Course columns whose change requires the course to be re-indexed
+INDEXED_COURSE_FIELDS = ('title', 'subtitle', 'description', 'category_id', 'instructor_id')
+
+# Category and instructor columns copied into the index of their courses
+INDEXED_CATEGORY_FIELDS = ('name',)
+INDEXED_INSTRUCTOR_FIELDS = ('first_name', 'last_name')
+
+
+def tokenize(text):
+    """Lower-cased search terms in ``text``, in order, stop words removed"""
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall((text or '').lower())
+        if len(token) >= MIN_TOKEN_LENGTH and token not in STOP_WORDS
+    ]
+
+
+def course_fields(course):
+    """Text of each indexed field of a course"""
+    return {
+        'title': course.title,
+        'subtitle': course.subtitle,
+        'description': course.description,
+        'category': course.category.name,
+        'instructor': f"{course.instructor.first_name} {course.instructor.last_name}",
+    }
+
+
+def build_postings(course):
+    """Map each term of a course to its accumulated weight"""
+    postings = Counter()
+    for field, text in course_fields(course).items():
+        for term, frequency in Counter(tokenize(text)).items():
+            postings[term] += FIELD_WEIGHTS[field] * min(frequency, MAX_TERM_FREQUENCY)
+    return postings
+
+
+def index_course(course):
+    """Replace the postings of a single course"""
+    with transaction.atomic():
+        CourseSearchTerm.objects.filter(course=course).delete()
+        CourseSearchTerm.objects.bulk_create([
+            CourseSearchTerm(term=term, course=course, weight=weight)
+            for term, weight in build_postings(course).items()
+        ])
+
+
+def index_courses(queryset=None, batch_size=500):
+    """Rebuild postings for many courses, ``batch_size`` courses per transaction"""
+    queryset = Course.objects.all() if queryset is None else queryset
+    queryset = queryset.select_related('instructor', 'category').order_by('pk')
+    
+    indexed = 0
+    batch = []
+    for course in queryset.iterator(chunk_size=batch_size):
+        batch.append(course)
+        if len(batch) >= batch_size:
+            _index_batch(batch)
+            indexed += len(batch)
+            batch = []
+    if batch:
+        _index_batch(batch)
+        indexed += len(batch)
+    return indexed
+
+
+def _index_batch(courses):
+    with transaction.atomic():
+        CourseSearchTerm.objects.filter(course__in=courses).delete()
+        CourseSearchTerm.objects.bulk_create([
+            CourseSearchTerm(term=term, course=course, weight=weight)
+            for course in courses
+            for term, weight in build_postings(course).items()
+        ])
+
+
+def parse_query(query):
+    """
+    Split a raw query into lookup terms.
+    
+    Returns ``(terms, prefix)`` where ``prefix`` is True when the last term is
+    still being typed and should match as a prefix.
+    """
+    terms = tokenize(query)[:MAX_QUERY_TERMS]
+    prefix = bool(terms) and not query[-1:].isspace()
+    return terms, prefix
+
+
+def search_courses(queryset, query):
+    """
+    Filter a Course queryset down to courses matching every query term.
+    
+    The result is annotated with ``search_rank``, the summed posting weight of
+    the matched terms; ordering is left to the caller.
+    """
+    terms, prefix = parse_query(query)
+    if not terms:
+        return queryset.none()
+    
+    conditions = []
+    for position, term in enumerate(terms):
+        if prefix and position == len(terms) - 1:
+            conditions.append(Q(search_terms__term__startswith=term))
+        else:
+            conditions.append(Q(search_terms__term=term))
+    
+    any_term = Q()
+    for condition in conditions:
+        any_term |= condition
+    
+    term_scores = {
+        f'_term_{position}_score': Max(Case(
+            When(condition, then=F('search_terms__weight')),
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+        for position, condition in enumerate(conditions)
+    }
+    
+    names = list(term_scores)
+    rank = F(names[0])
+    for name in names[1:]:
+        rank = rank + F(name)
+    
+    return queryset.filter(any_term).annotate(**term_scores).filter(
+        **{f'{name}__gt': 0 for name in term_scores}
+    ).annotate(search_rank=rank)
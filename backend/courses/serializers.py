@@ -22,18 +22,12 @@ class LectureSerializer(serializers.ModelSerializer):
 
 class SectionSerializer(serializers.ModelSerializer):
     lectures = LectureSerializer(many=True, read_only=True)
-    lecture_count = serializers.SerializerMethodField()
-    total_duration = serializers.SerializerMethodField()
     
     class Meta:
         model = Section
         fields = '__all__'
-    
-    def get_lecture_count(self, obj):
-        return obj.lectures.count()
-    
-    def get_total_duration(self, obj):
-        return sum([lecture.video_duration for lecture in obj.lectures.all()])
+        # Maintained by courses.curriculum
+        read_only_fields = ('lecture_count', 'total_duration')
 
 class CourseListSerializer(serializers.ModelSerializer):
     instructor_name = serializers.CharField(source='instructor.get_full_name', read_only=True)
@@ -61,8 +55,13 @@ class CourseDetailSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Course
-        fields = '__all__'
-        read_only_fields = ('id', 'created_at', 'updated_at', 'published_at')
+        # Served to anonymous users; revenue stays with the instructor views
+        exclude = ('completed_revenue',)
+        read_only_fields = (
+            'id', 'created_at', 'updated_at', 'published_at',
+            'total_duration', 'total_duration_seconds', 'total_lectures',
+            'rating_sum', 'rating_count', 'enrollment_count',
+        )
     
     def get_reviews_count(self, obj):
         return obj.reviews.count()
@@ -71,7 +70,11 @@ class CourseCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Course
         fields = '__all__'
-        read_only_fields = ('id', 'instructor', 'created_at', 'updated_at', 'published_at')
+        read_only_fields = (
+            'id', 'instructor', 'created_at', 'updated_at', 'published_at',
+            'total_duration', 'total_duration_seconds', 'total_lectures',
+            'rating_sum', 'rating_count', 'enrollment_count', 'completed_revenue',
+        )
     
     def create(self, validated_data):
         validated_data['instructor'] = self.context['request'].user
@@ -122,3 +125,13 @@ class QuizSerializer(serializers.ModelSerializer):
     class Meta:
         model = Quiz
         fields = '__all__'
+
+class CurriculumOrderSerializer(serializers.Serializer):
+    sections = serializers.ListField(child=serializers.IntegerField(), required=False)
+    lectures = serializers.DictField(child=serializers.ListField(child=serializers.UUIDField()), required=False)
+    
+    def validate_lectures(self, value):
+        try:
+            return {int(section_id): lecture_ids for section_id, lecture_ids in value.items()}
+        except ValueError:
+            raise serializers.ValidationError("Keys must be section ids")
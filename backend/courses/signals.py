@@ -0,0 +1,207 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import detail_cache
+from .counters import (
+    ENROLLMENT_TRACKED_FIELDS, REVIEW_TRACKED_FIELDS,
+    apply_transition, enrollment_contribution, review_contribution,
+)
+from .curriculum import LECTURE_TRACKED_FIELDS, apply_lecture_transition, apply_section_move
+from .models import Category, Course, Enrollment, Lecture, Review, Section
+from .search import (
+    INDEXED_CATEGORY_FIELDS, INDEXED_COURSE_FIELDS, INDEXED_INSTRUCTOR_FIELDS, index_course, index_courses,
+)
+
+User = get_user_model()
+
+TRACKED = {
+    Review: (REVIEW_TRACKED_FIELDS, review_contribution),
+    Enrollment: (ENROLLMENT_TRACKED_FIELDS, enrollment_contribution),
+}
+
+
+def _current_values(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+def _stored_values(instance, fields):
+    """Values the row currently has in the database, or None for new rows"""
+    if instance._state.adding:
+        return None
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(field in loaded for field in fields):
+        return {field: loaded[field] for field in fields}
+    return type(instance)._base_manager.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(pre_save, sender=Review)
+@receiver(pre_save, sender=Enrollment)
+def remember_counter_state(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    fields, _ = TRACKED[sender]
+    instance._counter_previous = _stored_values(instance, fields)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=Enrollment)
+def update_counters_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    fields, contribution = TRACKED[sender]
+    previous = getattr(instance, '_counter_previous', None)
+    current = _current_values(instance, fields)
+    
+    apply_transition(
+        contribution(previous) if previous else None,
+        contribution(current),
+    )
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **current}
+
+
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Enrollment)
+def update_counters_on_delete(sender, instance, **kwargs):
+    fields, contribution = TRACKED[sender]
+    loaded = getattr(instance, '_loaded_values', {})
+    values = {field: loaded.get(field, getattr(instance, field)) for field in fields}
+    apply_transition(contribution(values), None)
+
+
+@receiver(post_save, sender=Course)
+def index_course_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    changed = created or any(
+        field not in loaded or loaded[field] != getattr(instance, field)
+        for field in INDEXED_COURSE_FIELDS
+    )
+    if changed:
+        index_course(instance)
+        instance._loaded_values = {
+            **loaded, **{field: getattr(instance, field) for field in INDEXED_COURSE_FIELDS}
+        }
+
+
+INDEXED_RELATED_FIELDS = {
+    Category: INDEXED_CATEGORY_FIELDS,
+    User: INDEXED_INSTRUCTOR_FIELDS,
+}
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=User)
+def remember_indexed_names(sender, instance, raw=False, update_fields=None, **kwargs):
+    fields = INDEXED_RELATED_FIELDS[sender]
+    if raw or (update_fields is not None and not set(fields) & set(update_fields)):
+        instance._search_previous = None
+        return
+    instance._search_previous = _stored_values(instance, fields)
+
+
+def _indexed_names_changed(instance):
+    previous = getattr(instance, '_search_previous', None)
+    instance._search_previous = None
+    return previous is not None and previous != _current_values(instance, previous)
+
+
+@receiver(post_save, sender=Category)
+def index_category_courses_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw or created or not _indexed_names_changed(instance):
+        return
+    index_courses(Course.objects.filter(category=instance))
+
+
+@receiver(post_save, sender=User)
+def index_instructor_courses_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw or created or not _indexed_names_changed(instance):
+        return
+    courses = Course.objects.filter(instructor=instance)
+    if courses.exists():
+        index_courses(courses)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_detail(sender, instance, raw=False, **kwargs):
+    if not raw:
+        detail_cache.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_parent_course_detail(sender, instance, raw=False, **kwargs):
+    if not raw:
+        detail_cache.invalidate([instance.course_id])
+
+
+@receiver(post_save, sender=Lecture)
+@receiver(post_delete, sender=Lecture)
+def invalidate_lecture_course_detail(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    detail_cache.invalidate(Section.objects.filter(pk=instance.section_id).values_list('course_id', flat=True))
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_course_details(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    detail_cache.invalidate(Course.objects.filter(category=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def invalidate_instructor_course_details(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or created:
+        return
+    # The detail payload shows the instructor as "Full Name (email)"
+    if update_fields is not None and not {'first_name', 'last_name', 'email'} & set(update_fields):
+        return
+    detail_cache.invalidate(Course.objects.filter(instructor=instance).values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=Lecture)
+def remember_lecture_totals(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._curriculum_previous = _stored_values(instance, LECTURE_TRACKED_FIELDS)
+
+
+@receiver(post_save, sender=Lecture)
+def update_curriculum_on_lecture_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = _current_values(instance, LECTURE_TRACKED_FIELDS)
+    apply_lecture_transition(getattr(instance, '_curriculum_previous', None), current)
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **current}
+
+
+@receiver(post_delete, sender=Lecture)
+def update_curriculum_on_lecture_delete(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    apply_lecture_transition(
+        {field: loaded.get(field, getattr(instance, field)) for field in LECTURE_TRACKED_FIELDS}, None
+    )
+
+
+@receiver(pre_save, sender=Section)
+def remember_section_course(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Totals are left out of the save (Section.derived_fields) and moved by
+    # move_section_totals if the course changes
+    instance._curriculum_previous = _stored_values(instance, ('course_id',))
+
+
+@receiver(post_save, sender=Section)
+def move_section_totals(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_curriculum_previous', None)
+    if previous and previous['course_id'] != instance.course_id:
+        apply_section_move(instance, previous['course_id'])
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), 'course_id': instance.course_id}
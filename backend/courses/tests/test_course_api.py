@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from courses.models import Category, Course
+
+User = get_user_model()
+
+COUNTERS = {'rating_sum': 50, 'rating_count': 10, 'enrollment_count': 999, 'completed_revenue': '99999.00'}
+
+
+class CourseCounterFieldTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user(
+            email='instructor@example.com', username='instructor', password='x', user_type='instructor'
+        )
+        cls.category = Category.objects.create(name='Data', slug='data')
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.instructor)
+    
+    def test_counters_cannot_be_set_on_create(self):
+        response = self.client.post('/api/courses/instructor/courses/', {
+            'title': 'SQL', 'description': 'd', 'category': self.category.pk, 'price': '10.00', **COUNTERS,
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 201, response.content)
+        course = Course.objects.get()
+        self.assertEqual(
+            (course.rating_sum, course.rating_count, course.enrollment_count, course.completed_revenue),
+            (0, 0, 0, Decimal('0.00')),
+        )
+    
+    def test_counters_cannot_be_set_on_update(self):
+        course = Course.objects.create(
+            title='SQL', description='d', instructor=self.instructor, category=self.category, price=10
+        )
+        
+        response = self.client.patch(f'/api/courses/instructor/courses/{course.pk}/', COUNTERS, format='json')
+        
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.data['rating_count'], response.data['enrollment_count']), (0, 0))
+        course.refresh_from_db()
+        self.assertEqual((course.rating_count, course.enrollment_count), (0, 0))
+    
+    def test_public_detail_leaves_out_revenue(self):
+        course = Course.objects.create(
+            title='SQL', description='d', instructor=self.instructor, category=self.category,
+            price=10, status='published',
+        )
+        Course.objects.filter(pk=course.pk).update(completed_revenue=Decimal('500.00'))
+        
+        response = APIClient().get(f'/api/courses/{course.pk}/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('completed_revenue', response.json())
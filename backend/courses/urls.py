@@ -24,5 +24,6 @@ urlpatterns = [
     path('instructor/courses/', views.InstructorCourseListView.as_view(), name='instructor-courses'),
     path('instructor/courses/<uuid:id>/', views.InstructorCourseDetailView.as_view(), name='instructor-course-detail'),
     path('instructor/courses/<uuid:course_id>/sections/', views.SectionListCreateView.as_view(), name='course-sections'),
+    path('instructor/courses/<uuid:course_id>/curriculum/reorder/', views.reorder_curriculum, name='reorder-curriculum'),
     path('instructor/sections/<int:section_id>/lectures/', views.LectureListCreateView.as_view(), name='section-lectures'),
 ]
@@ -1,8 +1,10 @@
 from rest_framework import generics, permissions, status, filters
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Avg, Count
+from django.db.models import Avg
 from django.utils import timezone
 from .models import (
     Category, Course, Section, Lecture, Enrollment, 
@@ -11,9 +13,12 @@ from .models import (
 from .serializers import (
     CategorySerializer, CourseListSerializer, CourseDetailSerializer,
     CourseCreateSerializer, EnrollmentSerializer, LectureProgressSerializer,
-    ReviewSerializer, QuizSerializer, SectionSerializer, LectureSerializer
+    ReviewSerializer, QuizSerializer, SectionSerializer, LectureSerializer,
+    CurriculumOrderSerializer
 )
-from .filters import CourseFilter
+from . import curriculum, detail_cache
+from .filters import CourseFilter, CourseSearchFilter
+from .search import search_courses
 
 class CategoryListView(generics.ListAPIView):
     queryset = Category.objects.filter(is_active=True)
@@ -23,10 +28,10 @@ class CategoryListView(generics.ListAPIView):
 class CourseListView(generics.ListAPIView):
     serializer_class = CourseListSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # Search runs last so it can rank results unless ?ordering= was given
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, CourseSearchFilter]
     filterset_class = CourseFilter
-    search_fields = ['title', 'description', 'instructor__first_name', 'instructor__last_name']
-    ordering_fields = ['created_at', 'price', 'total_students']
+    ordering_fields = ['created_at', 'price', 'enrollment_count', 'rating_count']
     ordering = ['-created_at']
     
     def get_queryset(self):
@@ -39,6 +44,18 @@ class CourseDetailView(generics.RetrieveAPIView):
     
     def get_queryset(self):
         return Course.objects.filter(status='published').select_related('instructor', 'category').prefetch_related('sections__lectures')
+    
+    def retrieve(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().retrieve(request, *args, **kwargs)
+        
+        # Rendered once per content version, see detail_cache.py
+        key = detail_cache.payload_key(kwargs[self.lookup_field], request)
+        entry = detail_cache.get_payload(key)
+        if entry is None:
+            serializer = self.get_serializer(self.get_object())
+            entry = detail_cache.store_payload(key, JSONRenderer().render(serializer.data))
+        return detail_cache.respond(request, entry)
 
 class InstructorCourseListView(generics.ListCreateAPIView):
     serializer_class = CourseListSerializer
@@ -125,6 +142,29 @@ class LectureListCreateView(generics.ListCreateAPIView):
         section = Section.objects.get(id=section_id, course__instructor=self.request.user)
         serializer.save(section=section)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def reorder_curriculum(request, course_id):
+    """Reorder sections and lectures, and move lectures between sections, in bulk"""
+    try:
+        course = Course.objects.get(id=course_id, instructor=request.user)
+    except Course.DoesNotExist:
+        return Response({'error': 'Course not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    serializer = CurriculumOrderSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    try:
+        curriculum.reorder(
+            course,
+            section_ids=serializer.validated_data.get('sections'),
+            lectures=serializer.validated_data.get('lectures'),
+        )
+    except curriculum.ReorderError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    sections = Section.objects.filter(course=course).prefetch_related('lectures')
+    return Response(SectionSerializer(sections, many=True, context={'request': request}).data)
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def featured_courses(request):
@@ -141,9 +181,7 @@ def featured_courses(request):
 def popular_courses(request):
     courses = Course.objects.filter(
         status='published'
-    ).annotate(
-        student_count=Count('enrollments')
-    ).order_by('-student_count')[:6]
+    ).select_related('instructor', 'category').order_by('-enrollment_count')[:6]
     
     serializer = CourseListSerializer(courses, many=True)
     return Response(serializer.data)
@@ -186,15 +224,7 @@ def course_search(request):
     level = request.GET.get('level', '')
     price_range = request.GET.get('price_range', '')
     
-    courses = Course.objects.filter(status='published')
-    
-    if query:
-        courses = courses.filter(
-            Q(title__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(instructor__first_name__icontains=query) |
-            Q(instructor__last_name__icontains=query)
-        )
+    courses = Course.objects.filter(status='published').select_related('instructor', 'category')
     
     if category:
         courses = courses.filter(category__slug=category)
@@ -207,5 +237,10 @@ def course_search(request):
     elif price_range == 'paid':
         courses = courses.filter(is_free=False)
     
-    serializer = CourseListSerializer(courses, many=True)
-    return Response(serializer.data)
+    if query.strip():
+        courses = search_courses(courses, query).order_by('-search_rank', '-created_at')
+    
+    paginator = PageNumberPagination()
+    page = paginator.paginate_queryset(courses, request)
+    serializer = CourseListSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
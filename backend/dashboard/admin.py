@@ -1,16 +1,11 @@
 from django.contrib import admin
 from django.urls import path
 from django.shortcuts import render
-from django.db.models import Count, Sum, Avg
 from django.utils import timezone
-from datetime import timedelta, date
-import json
 
+from .metrics import METRIC_FIELDS, compute_metrics
+from .snapshots import get_widgets
 from .models import DashboardWidget, SystemMetrics, UserActivity
-from accounts.models import User
-from courses.models import Course, Enrollment
-from payments.models import Payment
-from mobile_payments.models import MobileMoneyTransaction
 
 @admin.register(DashboardWidget)
 class DashboardWidgetAdmin(admin.ModelAdmin):
@@ -32,9 +27,14 @@ class SystemMetricsAdmin(admin.ModelAdmin):
     actions = ['recalculate_metrics']
     
     def recalculate_metrics(self, request, queryset):
-        for metric in queryset:
-            metric.calculate_metrics()
-        self.message_user(request, f'Recalculated metrics for {queryset.count()} days.')
+        dates = sorted(queryset.values_list('date', flat=True))
+        computed = compute_metrics(dates)
+        metrics = list(queryset)
+        for metric in metrics:
+            for name, value in computed[metric.date].items():
+                setattr(metric, name, value)
+        SystemMetrics.objects.bulk_update(metrics, METRIC_FIELDS)
+        self.message_user(request, f'Recalculated metrics for {len(metrics)} days.')
     recalculate_metrics.short_description = "Recalculate selected metrics"
 
 @admin.register(UserActivity)
@@ -68,104 +68,19 @@ class DashboardAdminMixin:
     
     def get_dashboard_context(self, request):
         """Get context data for dashboard"""
-        today = timezone.now().date()
-        last_30_days = today - timedelta(days=30)
+        today = timezone.localdate()
         
-        # Get or create today's metrics
-        today_metrics = SystemMetrics.get_or_create_today()
+        # Today's metrics are kept current by dashboard.tasks.refresh_system_metrics
+        today_metrics = SystemMetrics.objects.filter(date=today).first()
         
-        # User statistics
-        total_users = User.objects.count()
-        new_users_today = User.objects.filter(created_at__date=today).count()
-        active_users = User.objects.filter(last_login__gte=timezone.now() - timedelta(days=7)).count()
-        
-        # Course statistics
-        total_courses = Course.objects.count()
-        published_courses = Course.objects.filter(status='published').count()
-        draft_courses = Course.objects.filter(status='draft').count()
-        
-        # Enrollment statistics
-        total_enrollments = Enrollment.objects.count()
-        new_enrollments_today = Enrollment.objects.filter(enrolled_at__date=today).count()
-        completed_today = Enrollment.objects.filter(completed=True, completed_at__date=today).count()
-        
-        # Revenue statistics
-        total_revenue = Payment.objects.filter(payment_status='completed').aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-        
-        revenue_today = Payment.objects.filter(
-            payment_status='completed',
-            completed_at__date=today
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Mobile money statistics
-        mobile_payments_today = MobileMoneyTransaction.objects.filter(
-            status='confirmed',
-            confirmed_at__date=today
-        ).count()
-        
-        mobile_revenue_today = MobileMoneyTransaction.objects.filter(
-            status='confirmed',
-            confirmed_at__date=today
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Chart data for last 30 days
-        daily_metrics = SystemMetrics.objects.filter(
-            date__gte=last_30_days
-        ).order_by('date')
-        
-        chart_data = {
-            'dates': [m.date.strftime('%Y-%m-%d') for m in daily_metrics],
-            'new_users': [m.new_users_today for m in daily_metrics],
-            'new_enrollments': [m.new_enrollments_today for m in daily_metrics],
-            'revenue': [float(m.revenue_today) for m in daily_metrics],
-            'mobile_revenue': [float(m.mobile_revenue_today) for m in daily_metrics],
-        }
-        
-        # User type distribution
-        user_types = User.objects.values('user_type').annotate(count=Count('id'))
-        user_type_data = {
-            'labels': [ut['user_type'].title() for ut in user_types],
-            'data': [ut['count'] for ut in user_types]
-        }
-        
-        # Course category distribution
-        course_categories = Course.objects.filter(status='published').values(
-            'category__name'
-        ).annotate(count=Count('id'))
-        
-        category_data = {
-            'labels': [cc['category__name'] for cc in course_categories],
-            'data': [cc['count'] for cc in course_categories]
-        }
-        
-        # Recent activities
-        recent_activities = UserActivity.objects.select_related('user')[:10]
+        # Widgets are served from cached snapshots, see dashboard/snapshots.py
+        widgets = get_widgets()
         
         return {
             'title': 'Dashboard',
             'user': request.user,
             'today_metrics': today_metrics,
-            'stats': {
-                'total_users': total_users,
-                'new_users_today': new_users_today,
-                'active_users': active_users,
-                'total_courses': total_courses,
-                'published_courses': published_courses,
-                'draft_courses': draft_courses,
-                'total_enrollments': total_enrollments,
-                'new_enrollments_today': new_enrollments_today,
-                'completed_today': completed_today,
-                'total_revenue': total_revenue,
-                'revenue_today': revenue_today,
-                'mobile_payments_today': mobile_payments_today,
-                'mobile_revenue_today': mobile_revenue_today,
-            },
-            'chart_data': json.dumps(chart_data),
-            'user_type_data': json.dumps(user_type_data),
-            'category_data': json.dumps(category_data),
-            'recent_activities': recent_activities,
+            **widgets,
         }
     
     def get_analytics_context(self, request):
@@ -0,0 +1,49 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+from django.utils import timezone
+from accounts.models import User
+from courses.models import Course
+from dashboard.metrics import DAYS_PER_QUERY, store_metrics
+
+class Command(BaseCommand):
+    help = 'Backfill SystemMetrics for a range of days using batched aggregate queries'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to compute (YYYY-MM-DD), defaults to the first user signup')
+        parser.add_argument('--end', help='Last day to compute (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--chunk-days', type=int, default=DAYS_PER_QUERY, help='Days written per transaction')
+    
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else self.oldest_day()
+            end = date.fromisoformat(options['end']) if options['end'] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        if start is None:
+            self.stdout.write(self.style.WARNING('No history to backfill'))
+            return
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be at least 1')
+        
+        # Courses published before published_at was recorded count from creation
+        stamped = Course.objects.filter(status='published', published_at__isnull=True).update(
+            published_at=F('created_at')
+        )
+        if stamped:
+            self.stdout.write(f'Set published_at on {stamped} courses')
+        
+        written = 0
+        day = start
+        while day <= end:
+            chunk_end = min(day + timedelta(days=options['chunk_days'] - 1), end)
+            written += store_metrics(day, chunk_end)
+            self.stdout.write(f'Computed {day} to {chunk_end}')
+            day = chunk_end + timedelta(days=1)
+        
+        self.stdout.write(self.style.SUCCESS(f'Stored metrics for {written} days'))
+    
+    def oldest_day(self):
+        first = User.objects.order_by('created_at').values_list('created_at', flat=True).first()
+        return timezone.localtime(first).date() if first else None
@@ -0,0 +1,131 @@
+"""
+Batch computation of SystemMetrics.
+
+Each source table is read with a single conditional-aggregation query that
+produces every figure for every requested day at once (``COUNT(...) FILTER``
+/ ``SUM(CASE ...)`` per day), so computing one day or backfilling a month
+costs the same number of queries: one per table per chunk of
+``DAYS_PER_QUERY`` days. Totals are "as of the end of that day", which for
+today matches the live table counts. Published courses are counted by
+``published_at``, so a course unpublished later still counts on the days it
+was live before.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+# Upper bound on days folded into one query, keeping the SELECT list narrow
+DAYS_PER_QUERY = 31
+
+METRIC_FIELDS = (
+    'total_users', 'new_users_today', 'active_users_today',
+    'total_courses', 'new_courses_today', 'published_courses',
+    'total_enrollments', 'new_enrollments_today', 'completed_courses_today',
+    'total_revenue', 'revenue_today',
+    'mobile_payments_today', 'mobile_revenue_today',
+)
+
+
+def _day_range(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _aggregate_per_day(queryset, days, build):
+    """
+    Run one aggregate query over ``queryset`` for all ``days``.
+    
+    ``build(start, end)`` returns ``{name: aggregate}`` for a single day; the
+    result maps each day to ``{name: value}``.
+    """
+    aggregates = {}
+    for index, day in enumerate(days):
+        start, end = _day_range(day)
+        for name, aggregate in build(start, end).items():
+            aggregates[f'd{index}__{name}'] = aggregate
+    
+    values = queryset.aggregate(**aggregates)
+    
+    results = {day: {} for day in days}
+    for key, value in values.items():
+        index, name = key[1:].split('__', 1)
+        results[days[int(index)]][name] = value
+    return results
+
+
+def compute_metrics(days):
+    """Map each date in ``days`` to its SystemMetrics field values"""
+    from accounts.models import User
+    from courses.models import Course, Enrollment
+    from payments.models import Payment
+    from mobile_payments.models import MobileMoneyTransaction
+    
+    days = sorted(set(days))
+    results = {day: dict.fromkeys(METRIC_FIELDS, 0) for day in days}
+    
+    sources = (
+        (User.objects.all(), lambda start, end: {
+            'total_users': Count('id', filter=Q(created_at__lt=end)),
+            'new_users_today': Count('id', filter=Q(created_at__gte=start, created_at__lt=end)),
+            'active_users_today': Count('id', filter=Q(last_login__gte=start, last_login__lt=end)),
+        }),
+        (Course.objects.all(), lambda start, end: {
+            'total_courses': Count('id', filter=Q(created_at__lt=end)),
+            'new_courses_today': Count('id', filter=Q(created_at__gte=start, created_at__lt=end)),
+            'published_courses': Count('id', filter=Q(published_at__lt=end)),
+        }),
+        (Enrollment.objects.all(), lambda start, end: {
+            'total_enrollments': Count('id', filter=Q(enrolled_at__lt=end)),
+            'new_enrollments_today': Count('id', filter=Q(enrolled_at__gte=start, enrolled_at__lt=end)),
+            'completed_courses_today': Count('id', filter=Q(
+                completed=True, completed_at__gte=start, completed_at__lt=end
+            )),
+        }),
+        (Payment.objects.filter(payment_status='completed'), lambda start, end: {
+            'total_revenue': Sum('amount', filter=Q(completed_at__lt=end)),
+            'revenue_today': Sum('amount', filter=Q(completed_at__gte=start, completed_at__lt=end)),
+        }),
+        (MobileMoneyTransaction.objects.filter(status='confirmed'), lambda start, end: {
+            'mobile_payments_today': Count('id', filter=Q(confirmed_at__gte=start, confirmed_at__lt=end)),
+            'mobile_revenue_today': Sum('amount', filter=Q(confirmed_at__gte=start, confirmed_at__lt=end)),
+        }),
+    )
+    
+    for offset in range(0, len(days), DAYS_PER_QUERY):
+        chunk = days[offset:offset + DAYS_PER_QUERY]
+        for queryset, build in sources:
+            for day, values in _aggregate_per_day(queryset, chunk, build).items():
+                results[day].update({name: value or 0 for name, value in values.items()})
+    
+    for values in results.values():
+        for name in ('total_revenue', 'revenue_today', 'mobile_revenue_today'):
+            values[name] = Decimal(values[name])
+    return results
+
+
+def store_metrics(start_date, end_date):
+    """
+    Compute and upsert SystemMetrics for every day in [start_date, end_date].
+    
+    Returns the number of days written.
+    """
+    from .models import SystemMetrics
+    
+    days = [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+    computed = compute_metrics(days)
+    
+    with transaction.atomic():
+        existing = {m.date: m for m in SystemMetrics.objects.filter(date__in=days)}
+        to_create, to_update = [], []
+        for day, values in computed.items():
+            metrics = existing.get(day) or SystemMetrics(date=day)
+            for name, value in values.items():
+                setattr(metrics, name, value)
+            (to_update if metrics.pk else to_create).append(metrics)
+        
+        SystemMetrics.objects.bulk_create(to_create)
+        SystemMetrics.objects.bulk_update(to_update, METRIC_FIELDS)
+    return len(days)
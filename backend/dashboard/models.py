@@ -78,7 +78,7 @@ class SystemMetrics(models.Model):
     @classmethod
     def get_or_create_today(cls):
         """Get or create metrics for today"""
-        today = timezone.now().date()
+        today = timezone.localdate()
         metrics, created = cls.objects.get_or_create(date=today)
         
         if created:
@@ -88,43 +88,10 @@ class SystemMetrics(models.Model):
     
     def calculate_metrics(self):
         """Calculate all metrics for this date"""
-        from accounts.models import User
-        from courses.models import Course, Enrollment
-        from payments.models import Payment
-        from mobile_payments.models import MobileMoneyTransaction
+        from .metrics import compute_metrics
         
-        # User metrics
-        self.total_users = User.objects.count()
-        self.new_users_today = User.objects.filter(created_at__date=self.date).count()
-        self.active_users_today = User.objects.filter(last_login__date=self.date).count()
-        
-        # Course metrics
-        self.total_courses = Course.objects.count()
-        self.new_courses_today = Course.objects.filter(created_at__date=self.date).count()
-        self.published_courses = Course.objects.filter(status='published').count()
-        
-        # Enrollment metrics
-        self.total_enrollments = Enrollment.objects.count()
-        self.new_enrollments_today = Enrollment.objects.filter(enrolled_at__date=self.date).count()
-        self.completed_courses_today = Enrollment.objects.filter(
-            completed=True, 
-            completed_at__date=self.date
-        ).count()
-        
-        # Revenue metrics
-        total_payments = Payment.objects.filter(payment_status='completed')
-        self.total_revenue = sum(p.amount for p in total_payments)
-        
-        today_payments = total_payments.filter(completed_at__date=self.date)
-        self.revenue_today = sum(p.amount for p in today_payments)
-        
-        # Mobile money metrics
-        mobile_transactions = MobileMoneyTransaction.objects.filter(
-            status='confirmed',
-            confirmed_at__date=self.date
-        )
-        self.mobile_payments_today = mobile_transactions.count()
-        self.mobile_revenue_today = sum(t.amount for t in mobile_transactions)
+        for name, value in compute_metrics([self.date])[self.date].items():
+            setattr(self, name, value)
         
         self.save()
 
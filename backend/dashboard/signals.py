@@ -0,0 +1,51 @@
+from datetime import datetime, time
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from courses.models import Enrollment
+from mobile_payments.models import MobileMoneyTransaction
+from mobile_payments.signals import payments_confirmed
+from payments.models import Payment
+from payments.signals import payments_completed
+
+from .snapshots import invalidate
+
+
+def _invalidate_on_commit(*names):
+    transaction.on_commit(lambda: invalidate(*names))
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, raw=False, **kwargs):
+    if not raw and instance.payment_status == 'completed':
+        _invalidate_on_commit('stats')
+
+
+@receiver(post_save, sender=MobileMoneyTransaction)
+def mobile_transaction_saved(sender, instance, raw=False, **kwargs):
+    if not raw and instance.status == 'confirmed':
+        _invalidate_on_commit('stats')
+
+
+@receiver(payments_confirmed)
+@receiver(payments_completed)
+def payments_settled(sender, **kwargs):
+    invalidate('stats')
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    today_start = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    if created or (instance.completed and instance.completed_at and instance.completed_at >= today_start):
+        _invalidate_on_commit('stats')
+
+
+@receiver(post_delete, sender=Enrollment)
+@receiver(post_delete, sender=Payment)
+def enrollment_or_payment_deleted(sender, instance, **kwargs):
+    _invalidate_on_commit('stats')
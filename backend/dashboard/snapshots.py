@@ -0,0 +1,198 @@
+"""
+Cached snapshots of the admin dashboard widgets.
+
+Every staff admin index load renders the dashboard, so each widget is kept
+in the Django cache for its own TTL (``settings.DASHBOARD_CACHE``). When a
+widget expires only the request that wins the recompute lock rebuilds it;
+concurrent requests serve the previous snapshot, or wait for the winner if
+there is none yet. Signals mark widgets stale as soon as payments or
+enrollments land, without waiting for the TTL.
+"""
+import json
+import time
+from datetime import datetime, time as dtime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+KEY_PREFIX = 'dashboard:snapshot'
+
+# Stale snapshots are kept this long so they can be served during a recompute
+RETENTION_SECONDS = 24 * 60 * 60
+
+POLL_INTERVAL = 0.1
+
+
+def _setting(name):
+    return settings.DASHBOARD_CACHE[name]
+
+
+def _today_start():
+    return timezone.make_aware(datetime.combine(timezone.localdate(), dtime.min))
+
+
+def build_stats():
+    from accounts.models import User
+    from courses.models import Course, Enrollment
+    from payments.models import Payment
+    from mobile_payments.models import MobileMoneyTransaction
+    
+    today_start = _today_start()
+    
+    users = User.objects.aggregate(
+        total_users=Count('id'),
+        new_users_today=Count('id', filter=Q(created_at__gte=today_start)),
+        active_users=Count('id', filter=Q(last_login__gte=timezone.now() - timedelta(days=7))),
+    )
+    courses = Course.objects.aggregate(
+        total_courses=Count('id'),
+        published_courses=Count('id', filter=Q(status='published')),
+        draft_courses=Count('id', filter=Q(status='draft')),
+    )
+    enrollments = Enrollment.objects.aggregate(
+        total_enrollments=Count('id'),
+        new_enrollments_today=Count('id', filter=Q(enrolled_at__gte=today_start)),
+        completed_today=Count('id', filter=Q(completed=True, completed_at__gte=today_start)),
+    )
+    revenue = Payment.objects.filter(payment_status='completed').aggregate(
+        total_revenue=Sum('amount'),
+        revenue_today=Sum('amount', filter=Q(completed_at__gte=today_start)),
+    )
+    mobile = MobileMoneyTransaction.objects.filter(
+        status='confirmed',
+        confirmed_at__gte=today_start,
+    ).aggregate(
+        mobile_payments_today=Count('id'),
+        mobile_revenue_today=Sum('amount'),
+    )
+    
+    stats = {**users, **courses, **enrollments, **revenue, **mobile}
+    return {name: value or 0 for name, value in stats.items()}
+
+
+def build_chart_data():
+    from .models import SystemMetrics
+    
+    daily_metrics = SystemMetrics.objects.filter(
+        date__gte=timezone.localdate() - timedelta(days=30)
+    ).order_by('date')
+    
+    return json.dumps({
+        'dates': [m.date.strftime('%Y-%m-%d') for m in daily_metrics],
+        'new_users': [m.new_users_today for m in daily_metrics],
+        'new_enrollments': [m.new_enrollments_today for m in daily_metrics],
+        'revenue': [float(m.revenue_today) for m in daily_metrics],
+        'mobile_revenue': [float(m.mobile_revenue_today) for m in daily_metrics],
+    })
+
+
+def build_user_type_data():
+    from accounts.models import User
+    
+    user_types = User.objects.values('user_type').annotate(count=Count('id'))
+    return json.dumps({
+        'labels': [ut['user_type'].title() for ut in user_types],
+        'data': [ut['count'] for ut in user_types]
+    })
+
+
+def build_category_data():
+    from courses.models import Course
+    
+    course_categories = Course.objects.filter(status='published').values(
+        'category__name'
+    ).annotate(count=Count('id'))
+    return json.dumps({
+        'labels': [cc['category__name'] for cc in course_categories],
+        'data': [cc['count'] for cc in course_categories]
+    })
+
+
+def build_recent_activities():
+    from .models import UserActivity
+    
+    return list(UserActivity.objects.select_related('user')[:10])
+
+
+WIDGETS = {
+    'stats': build_stats,
+    'chart_data': build_chart_data,
+    'user_type_data': build_user_type_data,
+    'category_data': build_category_data,
+    'recent_activities': build_recent_activities,
+}
+
+
+def _snapshot_key(name):
+    return f'{KEY_PREFIX}:{name}'
+
+
+def _invalidated_key(name):
+    return f'{KEY_PREFIX}:{name}:invalidated'
+
+
+def _lock_key(name):
+    return f'{KEY_PREFIX}:{name}:lock'
+
+
+def _compute(name):
+    started = time.time()
+    value = WIDGETS[name]()
+    cache.set(_snapshot_key(name), {
+        'value': value,
+        'computed_at': started,
+        'fresh_until': started + _setting('TIMEOUTS')[name],
+    }, RETENTION_SECONDS)
+    return value
+
+
+def _refresh(name, stale):
+    """Recompute ``name`` under a lock, so only one process does the work"""
+    lock_timeout = _setting('LOCK_TIMEOUT')
+    if cache.add(_lock_key(name), 1, lock_timeout):
+        try:
+            return _compute(name)
+        finally:
+            cache.delete(_lock_key(name))
+    
+    if stale is not None:
+        return stale['value']
+    
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(_snapshot_key(name))
+        if entry is not None:
+            return entry['value']
+    # The lock holder died without writing a snapshot
+    return _compute(name)
+
+
+def get_widgets(names=None):
+    """Return ``{name: value}`` for the requested widgets, recomputing stale ones"""
+    names = list(names or WIDGETS)
+    cached = cache.get_many(
+        [_snapshot_key(name) for name in names] + [_invalidated_key(name) for name in names]
+    )
+    
+    now = time.time()
+    widgets = {}
+    for name in names:
+        entry = cached.get(_snapshot_key(name))
+        invalidated_at = cached.get(_invalidated_key(name), 0)
+        if entry is not None and entry['fresh_until'] > now and entry['computed_at'] >= invalidated_at:
+            widgets[name] = entry['value']
+        else:
+            widgets[name] = _refresh(name, entry)
+    return widgets
+
+
+def invalidate(*names):
+    """Mark widgets stale; the next dashboard load recomputes them"""
+    now = time.time()
+    cache.set_many(
+        {_invalidated_key(name): now for name in (names or WIDGETS)},
+        RETENTION_SECONDS,
+    )
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from .metrics import store_metrics
+from .snapshots import invalidate
+
+
+@shared_task(ignore_result=True)
+def refresh_system_metrics():
+    """Recompute SystemMetrics for today and yesterday (to settle late events)"""
+    today = timezone.localdate()
+    written = store_metrics(today - timedelta(days=1), today)
+    invalidate('chart_data')
+    return written
@@ -1,52 +1,48 @@
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Count, Sum, Avg
+from django.db.models import Count, Avg
 from django.utils import timezone
 from datetime import timedelta
 import json
 
 from accounts.models import User
 from courses.models import Course, Enrollment
-from zambian_education.models import Province, School, Teacher, Student
+from zambian_education.geography import national_summary
+from zambian_education.models import GeographySummary, School
 from ecz_papers.models import ECZExaminationSession, ECZPaper
-from online_classes.models import LiveClassroom, EducationalVideo
+from online_classes.models import LiveClassroom
 from mobile_payments.models import MobileMoneyTransaction
 
 @staff_member_required
 def zambian_dashboard_view(request):
     """Enhanced Zambian Education Dashboard"""
     
+    # Area and video counts come from the materialized geography summary
+    national = national_summary()
+    
     # Basic statistics
     stats = {
-        'total_schools': School.objects.count(),
+        'total_schools': national.schools,
         'new_schools_today': School.objects.filter(created_at__date=timezone.now().date()).count(),
-        'total_students': Student.objects.count(),
-        'primary_students': Student.objects.filter(current_grade__phase='primary').count(),
-        'secondary_students': Student.objects.filter(current_grade__phase__in=['junior_secondary', 'senior_secondary']).count(),
-        'total_teachers': Teacher.objects.count(),
+        'total_students': national.students,
+        'primary_students': national.primary_students,
+        'secondary_students': national.secondary_students,
+        'total_teachers': national.teachers,
         'ecz_candidates': 245000,  # This would come from ECZ API
         'online_classes_today': LiveClassroom.objects.filter(
             scheduled_start__date=timezone.now().date(),
             status__in=['scheduled', 'live']
         ).count(),
         'active_students_online': 45000,  # This would be calculated from active sessions
-        'digital_resources': EducationalVideo.objects.filter(is_published=True).count(),
+        'digital_resources': national.published_videos,
     }
     
     # Video statistics
     video_stats = {
-        'total_videos': EducationalVideo.objects.filter(is_published=True).count(),
-        'primary_videos': EducationalVideo.objects.filter(
-            is_published=True,
-            grade__phase='primary'
-        ).count(),
-        'secondary_videos': EducationalVideo.objects.filter(
-            is_published=True,
-            grade__phase__in=['junior_secondary', 'senior_secondary']
-        ).count(),
-        'hours_watched': EducationalVideo.objects.filter(
-            is_published=True
-        ).aggregate(total=Sum('total_watch_time_hours'))['total'] or 0,
+        'total_videos': national.published_videos,
+        'primary_videos': national.primary_videos,
+        'secondary_videos': national.secondary_videos,
+        'hours_watched': national.video_watch_hours,
     }
     
     # ECZ statistics
@@ -59,17 +55,14 @@ def zambian_dashboard_view(request):
     }
     
     # Provincial statistics
-    provincial_stats = []
-    provinces = Province.objects.all()
-    for province in provinces:
-        schools_count = School.objects.filter(district__province=province).count()
-        students_count = Student.objects.filter(current_school__district__province=province).count()
-        
-        provincial_stats.append({
-            'name': province.get_name_display(),
-            'schools': schools_count,
-            'students': f"{students_count:,}",
-        })
+    provincial_stats = [
+        {
+            'name': summary.name,
+            'schools': summary.schools,
+            'students': f"{summary.students:,}",
+        }
+        for summary in GeographySummary.objects.filter(level='province').order_by('province_id')
+    ]
     
     # If no provinces in database, use default data
     if not provincial_stats:
@@ -3,6 +3,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import notifications.routing
+import mobile_payments.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'learnhub.settings')
 
@@ -11,6 +12,7 @@ application = ProtocolTypeRouter({
     "websocket": AuthMiddlewareStack(
         URLRouter(
             notifications.routing.websocket_urlpatterns
+            + mobile_payments.routing.websocket_urlpatterns
         )
     ),
 })
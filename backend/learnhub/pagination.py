@@ -0,0 +1,126 @@
+"""
+Keyset pagination for append-only feeds.
+
+``PageNumberPagination`` pays for an OFFSET scan plus a full COUNT(*) on every
+page. Feeds ordered by ``(created_at, id)`` can instead seek straight to the
+last row of the previous page using a composite index, so page 500 costs the
+same as page 1.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a composite ``(created_at, id)`` key, newest first.
+    
+    The cursor is an opaque token holding the key of the row the page starts
+    after and the direction of travel. No COUNT query is issued.
+    """
+    key_fields = ('created_at', 'id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request, queryset.model)
+        
+        reverse = bool(self.cursor and self.cursor['reverse'])
+        descending = [f'-{field}' for field in self.key_fields]
+        queryset = queryset.order_by(*(self.key_fields if reverse else descending))
+        
+        if self.cursor:
+            queryset = queryset.filter(self.seek_filter(self.cursor['key'], after=not reverse))
+        
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+        
+        # Moving backwards always leaves a following page; moving forwards
+        # from a cursor always leaves a preceding one.
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else self.cursor is not None
+        self.page = results
+        return results
+    
+    def seek_filter(self, key, after):
+        """Rows strictly past ``key`` in feed order (older when ``after``)"""
+        lookup = 'lt' if after else 'gt'
+        condition = Q()
+        for position, field in enumerate(self.key_fields):
+            prefix = {name: key[name] for name in self.key_fields[:position]}
+            condition |= Q(**prefix, **{f'{field}__{lookup}': key[field]})
+        return condition
+    
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(requested, self.max_page_size))
+    
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            key = {
+                field: model._meta.get_field(field).to_python(payload['k'][position])
+                for position, field in enumerate(self.key_fields)
+            }
+            return {'key': key, 'reverse': bool(payload.get('r'))}
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+    
+    def encode_cursor(self, obj, reverse):
+        key = []
+        for field in self.key_fields:
+            value = getattr(obj, field)
+            key.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        payload = json.dumps({'k': key, 'r': int(reverse)}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+    
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+    
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+    
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+    
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -1,5 +1,7 @@
 import os
+from datetime import timedelta
 from pathlib import Path
+from celery.schedules import crontab
 from decouple import config
 import dj_database_url
 
@@ -163,7 +165,6 @@ REST_FRAMEWORK = {
 }
 
 # JWT Configuration
-from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -205,6 +206,194 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 # Celery Configuration
 CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'flush-activity-buffer': {
+        'task': 'analytics.tasks.flush_activity_buffer',
+        'schedule': config('ACTIVITY_FLUSH_INTERVAL_SECONDS', default=5, cast=int),
+    },
+    'rollup-course-analytics': {
+        'task': 'analytics.tasks.rollup_course_analytics',
+        'schedule': timedelta(minutes=15),
+    },
+    'reset-lapsed-streaks': {
+        'task': 'analytics.tasks.reset_lapsed_streaks',
+        'schedule': crontab(hour=0, minute=5),
+    },
+    'refresh-system-metrics': {
+        'task': 'dashboard.tasks.refresh_system_metrics',
+        'schedule': timedelta(minutes=10),
+    },
+    'refresh-geography-summary': {
+        'task': 'zambian_education.tasks.refresh_geography_summary',
+        'schedule': timedelta(hours=1),
+    },
+    'resume-stalled-broadcasts': {
+        'task': 'notifications.tasks.resume_stalled_broadcasts',
+        'schedule': timedelta(minutes=5),
+    },
+    'reconcile-unread-counts': {
+        'task': 'notifications.tasks.reconcile_unread_counts',
+        'schedule': timedelta(minutes=30),
+    },
+    'process-stripe-events': {
+        'task': 'payments.tasks.process_stripe_events',
+        'schedule': timedelta(seconds=30),
+    },
+    'release-stale-coupon-reservations': {
+        'task': 'payments.tasks.release_stale_coupon_reservations',
+        'schedule': timedelta(minutes=15),
+    },
+    'generate-monthly-payouts': {
+        'task': 'payments.tasks.generate_monthly_payouts',
+        'schedule': crontab(day_of_month=1, hour=2, minute=0),
+    },
+    'dispatch-sms': {
+        'task': 'mobile_payments.tasks.dispatch_sms',
+        'schedule': timedelta(seconds=15),
+    },
+    'process-inbound-sms': {
+        'task': 'mobile_payments.tasks.process_inbound_sms',
+        'schedule': timedelta(seconds=30),
+    },
+    'process-payment-deadlines': {
+        'task': 'mobile_payments.tasks.process_payment_deadlines',
+        'schedule': timedelta(seconds=5),
+    },
+    'recover-payment-deadlines': {
+        'task': 'mobile_payments.tasks.recover_payment_deadlines',
+        'schedule': timedelta(minutes=10),
+    },
+}
+
+# Days re-rolled by each scheduled analytics rollup (see analytics/rollups.py)
+ANALYTICS_ROLLUP_LOOKBACK_DAYS = config('ANALYTICS_ROLLUP_LOOKBACK_DAYS', default=2, cast=int)
+
+# Analytics activity ingestion (see analytics/ingestion.py)
+ACTIVITY_INGESTION = {
+    # 'redis' buffers events for the Celery flush task, 'memory' flushes
+    # in-process and is only meant for single-process development servers
+    'BACKEND': config('ACTIVITY_BUFFER_BACKEND', default='redis'),
+    'REDIS_URL': config('REDIS_URL', default='redis://localhost:6379/0'),
+    'BATCH_SIZE': config('ACTIVITY_BATCH_SIZE', default=2000, cast=int),
+    'FLUSH_INTERVAL_SECONDS': config('ACTIVITY_FLUSH_INTERVAL_SECONDS', default=5, cast=int),
+    'MAX_PENDING': config('ACTIVITY_MAX_PENDING', default=500000, cast=int),
+    'MAX_EVENTS_PER_REQUEST': config('ACTIVITY_MAX_EVENTS_PER_REQUEST', default=500, cast=int),
+    'SPILL_DIR': BASE_DIR / 'spool' / 'activities',
+}
+
+# Notification fan-out (see notifications/fanout.py)
+NOTIFICATION_FANOUT = {
+    'CHUNK_SIZE': config('NOTIFICATION_FANOUT_CHUNK_SIZE', default=1000, cast=int),
+    # Unfinished broadcasts untouched for this long are re-queued
+    'STALL_SECONDS': config('NOTIFICATION_FANOUT_STALL_SECONDS', default=300, cast=int),
+}
+
+# Unread notification counters (see notifications/unread.py)
+NOTIFICATION_UNREAD_COUNTERS = {
+    # 'redis' keeps counters in a Redis hash, 'db' counts from the table
+    'BACKEND': config('NOTIFICATION_UNREAD_BACKEND', default='redis'),
+    'REDIS_URL': config('REDIS_URL', default='redis://localhost:6379/0'),
+    'RECONCILE_BATCH_SIZE': config('NOTIFICATION_UNREAD_RECONCILE_BATCH_SIZE', default=1000, cast=int),
+}
+
+# Cached announcement audiences (see notifications/audience.py)
+ANNOUNCEMENT_AUDIENCE_CACHE = {
+    # Upper bound on index age; it also expires at the next start/end date
+    'MAX_AGE': config('ANNOUNCEMENT_AUDIENCE_MAX_AGE', default=3600, cast=int),
+}
+
+# Outbound SMS queue (see mobile_payments/sms.py)
+SMS_DISPATCH = {
+    'GATEWAY': config('SMS_GATEWAY', default='simulator'),
+    'GATEWAYS': {
+        # RATE is messages per second, BURST the bucket size
+        'simulator': {
+            'CLASS': 'mobile_payments.sms.SimulatedGateway',
+            'RATE': config('SMS_SIMULATOR_RATE', default=50, cast=float),
+            'BURST': config('SMS_SIMULATOR_BURST', default=100, cast=int),
+            'LATENCY_MS': config('SMS_SIMULATOR_LATENCY_MS', default=0, cast=int),
+            'FAILURE_RATE': config('SMS_SIMULATOR_FAILURE_RATE', default=0.0, cast=float),
+        },
+    },
+    # 'redis' shares token buckets between workers, 'memory' is per process
+    'RATE_LIMITER': config('SMS_RATE_LIMITER', default='redis'),
+    'REDIS_URL': config('REDIS_URL', default='redis://localhost:6379/0'),
+    'BATCH_SIZE': config('SMS_BATCH_SIZE', default=100, cast=int),
+    'MAX_ATTEMPTS': config('SMS_MAX_ATTEMPTS', default=5, cast=int),
+    'RETRY_BACKOFF_SECONDS': 30,
+    'RETRY_BACKOFF_MAX_SECONDS': 3600,
+    # Rows left 'sending' this long by a crashed worker are claimed again
+    'CLAIM_TIMEOUT': 300,
+    'MAX_RUN_SECONDS': 60,
+}
+
+REFERENCE_CODES = {
+    # Counter values each process reserves at a time
+    'BLOCK_SIZE': config('REFERENCE_CODE_BLOCK_SIZE', default=100, cast=int),
+    # Required and secret: anyone holding it can list the issued codes. Never
+    # change it once codes have been issued, see mobile_payments/reference_codes.py
+    'PERMUTATION_KEY': config('REFERENCE_CODE_KEY'),
+}
+
+SMS_INBOUND = {
+    'BATCH_SIZE': config('SMS_INBOUND_BATCH_SIZE', default=200, cast=int),
+    # Largest 'messages' batch the unauthenticated webhook accepts
+    'MAX_WEBHOOK_MESSAGES': 100,
+    'MAX_ATTEMPTS': 5,
+    'MAX_RUN_SECONDS': 60,
+}
+
+PAYMENT_STATUS_PUSH = {
+    'CACHE_TIMEOUT': 300,
+    # Longest a long-poll request on status/<reference_code>/wait/ is held
+    'MAX_WAIT_SECONDS': 25,
+}
+
+PAYMENT_DEADLINES = {
+    # 'redis' schedules reminders/expiries in sorted sets, 'db' polls the table
+    'BACKEND': config('PAYMENT_DEADLINES_BACKEND', default='redis'),
+    'REDIS_URL': config('REDIS_URL', default='redis://localhost:6379/0'),
+    'REMINDER_LEAD_SECONDS': config('PAYMENT_REMINDER_LEAD_SECONDS', default=600, cast=int),
+    'BATCH_SIZE': 500,
+}
+
+# Cache Configuration ('locmem' keeps everything in-process, for development)
+if config('CACHE_BACKEND', default='redis') == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('REDIS_URL', default='redis://localhost:6379/0'),
+            'KEY_PREFIX': 'learnhub',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'learnhub',
+        },
+    }
+
+# Rendered course detail payloads (see courses/detail_cache.py)
+COURSE_DETAIL_CACHE = {
+    # Payloads are replaced on change; this only bounds memory for cold courses
+    'TIMEOUT': config('COURSE_DETAIL_CACHE_TIMEOUT', default=3600, cast=int),
+}
+
+# Admin dashboard snapshot cache (see dashboard/snapshots.py)
+DASHBOARD_CACHE = {
+    # Seconds each widget is served before it is recomputed
+    'TIMEOUTS': {
+        'stats': 60,
+        'chart_data': 900,
+        'user_type_data': 900,
+        'category_data': 900,
+        'recent_activities': 30,
+    },
+    # Longest a recompute may hold the lock; also how long waiters poll for it
+    'LOCK_TIMEOUT': 30,
+}
 
 # Channels Configuration
 CHANNEL_LAYERS = {
@@ -230,6 +419,29 @@ STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
 
+# Webhook event processing, see payments/stripe_events.py
+STRIPE_EVENTS = {
+    'BATCH_SIZE': config('STRIPE_EVENTS_BATCH_SIZE', default=200, cast=int),
+    'MAX_ATTEMPTS': 5,
+    'MAX_RUN_SECONDS': 60,
+}
+
+# Coupon uses reserved at checkout, see payments/coupons.py
+COUPON_RESERVATIONS = {
+    'MAX_AGE_HOURS': config('COUPON_RESERVATION_MAX_AGE_HOURS', default=2, cast=int),
+}
+
+# Instructor revenue ledger, see payments/ledger.py
+REVENUE_LEDGER = {
+    'PLATFORM_FEE_PERCENT': config('PLATFORM_FEE_PERCENT', default='30'),
+}
+
+# Batch instructor payouts, see payments/payouts.py
+PAYOUTS = {
+    'MINIMUM_AMOUNT': config('PAYOUT_MINIMUM_AMOUNT', default='10'),
+    'CHUNK_SIZE': 500,
+}
+
 # Mobile Money Configuration
 MOBILE_MONEY_SETTINGS = {
     'AIRTEL_MERCHANT_CODE': config('AIRTEL_MERCHANT_CODE', default='LEARNHUB001'),
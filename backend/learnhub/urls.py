@@ -14,6 +14,7 @@ urlpatterns = [
     path('api/mobile-payments/', include('mobile_payments.urls')),
     path('api/analytics/', include('analytics.urls')),
     path('api/notifications/', include('notifications.urls')),
+    path('api/education/', include('zambian_education.urls')),
 ]
 
 # Debug toolbar
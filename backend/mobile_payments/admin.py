@@ -1,12 +1,12 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from django.utils import timezone
 from .models import (
     MobileMoneyProvider, 
     MobileMoneyTransaction, 
     PaymentVerification, 
     SMSNotification,
+    InboundSMS,
     PaymentSettings
 )
 
@@ -25,7 +25,7 @@ class PaymentVerificationInline(admin.TabularInline):
 class SMSNotificationInline(admin.TabularInline):
     model = SMSNotification
     extra = 0
-    readonly_fields = ['sent_at']
+    readonly_fields = ['status', 'attempts', 'created_at', 'sent_at']
 
 @admin.register(MobileMoneyTransaction)
 class MobileMoneyTransactionAdmin(admin.ModelAdmin):
@@ -80,27 +80,22 @@ class MobileMoneyTransactionAdmin(admin.ModelAdmin):
     action_buttons.short_description = 'Actions'
     
     def confirm_payments(self, request, queryset):
-        updated = 0
-        for transaction in queryset.filter(status='pending'):
-            transaction.status = 'confirmed'
-            transaction.confirmed_at = timezone.now()
-            transaction.save()
-            
-            # Create verification record
-            PaymentVerification.objects.create(
-                transaction=transaction,
-                method='admin',
-                verified_by=request.user,
-                is_successful=True,
-                notes=f"Confirmed by admin: {request.user.email}"
-            )
-            updated += 1
+        from .services import PaymentProcessor
+        pending = list(queryset.filter(status='pending').select_related('course'))
+        confirmed = PaymentProcessor().confirm_payments(
+            pending,
+            verification_method='admin',
+            verified_by=request.user,
+            notes={t.id: f"Confirmed by admin: {request.user.email}" for t in pending}
+        )
+        updated = len(confirmed)
         
         self.message_user(request, f'{updated} payments confirmed successfully.')
     confirm_payments.short_description = "Confirm selected payments"
     
     def cancel_payments(self, request, queryset):
-        updated = queryset.filter(status__in=['initiated', 'pending']).update(status='cancelled')
+        from .services import close_transactions
+        updated = close_transactions(queryset.filter(status__in=['initiated', 'pending']), 'cancelled')
         self.message_user(request, f'{updated} payments cancelled.')
     cancel_payments.short_description = "Cancel selected payments"
     
@@ -129,10 +124,18 @@ class PaymentVerificationAdmin(admin.ModelAdmin):
 
 @admin.register(SMSNotification)
 class SMSNotificationAdmin(admin.ModelAdmin):
-    list_display = ['phone_number', 'notification_type', 'delivered', 'sent_at']
-    list_filter = ['notification_type', 'delivered', 'sent_at']
-    search_fields = ['phone_number', 'message']
-    readonly_fields = ['sent_at']
+    list_display = ['phone_number', 'notification_type', 'status', 'attempts', 'delivered', 'created_at', 'sent_at']
+    list_filter = ['notification_type', 'status', 'gateway', 'delivered', 'created_at']
+    search_fields = ['phone_number', 'message', 'provider_message_id']
+    readonly_fields = ['gateway', 'provider_message_id', 'attempts', 'last_error', 'created_at', 'sent_at']
+
+@admin.register(InboundSMS)
+class InboundSMSAdmin(admin.ModelAdmin):
+    list_display = ['sender', 'provider', 'reference_code', 'amount', 'status', 'received_at', 'processed_at']
+    list_filter = ['status', 'provider', 'received_at']
+    search_fields = ['message_id', 'sender', 'reference_code', 'provider_transaction_id', 'message']
+    readonly_fields = ['message_id', 'received_at', 'processed_at']
+    raw_id_fields = ['transaction']
 
 @admin.register(PaymentSettings)
 class PaymentSettingsAdmin(admin.ModelAdmin):
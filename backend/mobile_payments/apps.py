@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class MobilePaymentsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'mobile_payments'
+    verbose_name = 'Mobile Payments'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
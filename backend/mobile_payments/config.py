@@ -0,0 +1,92 @@
+"""
+In-process cache of payment configuration.
+
+PaymentSettings, the active MobileMoneyProviders and the SMS templates are
+loaded once per process into a snapshot and reused by every request, so
+initiating a payment issues no configuration queries. Admin edits bump a
+version number kept in the shared Django cache (via signals); each process
+compares its snapshot with that version at most every
+``VERSION_CHECK_SECONDS`` and reloads when it moved. Edits made in the same
+process are visible immediately.
+
+Snapshot objects are shared between threads and must be treated as read-only.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+from .models import MobileMoneyProvider, PaymentSettings
+
+VERSION_KEY = 'mobile_payments:config-version'
+
+VERSION_CHECK_SECONDS = 5
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+class ConfigSnapshot:
+    def __init__(self, version):
+        self.version = version
+        self.checked_at = time.monotonic()
+        
+        self.settings = PaymentSettings.objects.first() or PaymentSettings.objects.create()
+        self.providers = {
+            provider.name: provider
+            for provider in MobileMoneyProvider.objects.filter(is_active=True).order_by('id')
+        }
+        self.sms_templates = {
+            'payment_instructions': self.settings.payment_instructions_template,
+            'payment_confirmed': self.settings.payment_confirmed_template,
+            'payment_reminder': self.settings.payment_reminder_template,
+        }
+
+
+def current_version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def get_snapshot():
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - snapshot.checked_at < VERSION_CHECK_SECONDS:
+        return snapshot
+    
+    with _lock:
+        version = current_version()
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = ConfigSnapshot(version)
+        else:
+            _snapshot.checked_at = time.monotonic()
+        return _snapshot
+
+
+def invalidate():
+    """Make every process reload its configuration snapshot"""
+    global _snapshot
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    _snapshot = None
+
+
+def get_payment_settings():
+    return get_snapshot().settings
+
+
+def get_provider(name):
+    """The active provider called ``name``; raises MobileMoneyProvider.DoesNotExist"""
+    try:
+        return get_snapshot().providers[name]
+    except KeyError:
+        raise MobileMoneyProvider.DoesNotExist(f'No active provider {name!r}')
+
+
+def active_providers():
+    return list(get_snapshot().providers.values())
+
+
+def render_sms(template_name, **context):
+    return get_snapshot().sms_templates[template_name].format(**context)
@@ -0,0 +1,35 @@
+import json
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+
+from . import live
+
+class PaymentStatusConsumer(AsyncWebsocketConsumer):
+    """Pushes status changes of one of the user's payments, see live.py"""
+    
+    async def connect(self):
+        self.reference_code = self.scope['url_route']['kwargs']['reference_code']
+        self.group_name = live.status_group(self.reference_code)
+        
+        user = self.scope.get('user')
+        entry = await database_sync_to_async(live.get_status)(self.reference_code)
+        if entry is None or not user or not user.is_authenticated or entry['user_id'] != str(user.pk):
+            await self.close()
+            return
+        
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        
+        # Current status; later changes arrive as payment_status events
+        await self.payment_status({'payment': live.current_status(entry)})
+    
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+    
+    async def payment_status(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'payment_status',
+            'payment': event['payment'],
+        }))
+        if event['payment']['status'] not in live.OPEN_STATUSES:
+            await self.close()
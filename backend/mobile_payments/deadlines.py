@@ -0,0 +1,188 @@
+"""
+Reminder and expiry scheduling for pending mobile money payments.
+
+Pending transactions are tracked in two Redis sorted sets scored by when
+they are due: the reminder (``REMINDER_LEAD_SECONDS`` before ``expires_at``)
+and the expiry itself. The ``process_payment_deadlines`` task, run every few
+seconds, pops everything due from each set with one Lua call per batch and
+handles the batch with set-based queries:
+
+* reminders are queued as SMS in one INSERT, once per transaction
+  (guarded by ``reminder_sent_at``)
+* expiries are a single conditional UPDATE to ``expired``, published to
+  waiting checkouts by ``live.py``
+
+Firing is idempotent and always re-checks the row, so stale entries (paid or
+cancelled transactions) are simply dropped. The sets are rebuilt from the
+``(status, expires_at)`` index by ``recover``, which also catches anything
+popped by a worker that crashed before finishing. With ``BACKEND='db'`` the
+same index is queried directly instead of using Redis.
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MobileMoneyTransaction, SMSNotification
+
+# Pop up to ARGV[2] members scored at or before ARGV[1]
+POP_DUE_SCRIPT = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #members > 0 then
+    redis.call('ZREM', KEYS[1], unpack(members))
+end
+return members
+"""
+
+
+def deadline_settings():
+    return settings.PAYMENT_DEADLINES
+
+
+def reminder_due_at(transaction_obj):
+    return transaction_obj.expires_at - timedelta(seconds=deadline_settings()['REMINDER_LEAD_SECONDS'])
+
+
+def send_reminders(transaction_ids, now):
+    """Queue reminder SMS for still-pending transactions that have not had one"""
+    from .services import SMSService
+    
+    with transaction.atomic():
+        due = list(
+            MobileMoneyTransaction.objects.select_for_update().filter(
+                id__in=transaction_ids,
+                status='pending',
+                reminder_sent_at__isnull=True,
+                expires_at__gt=now,
+            ).select_related('course')
+        )
+        if not due:
+            return 0
+        
+        MobileMoneyTransaction.objects.filter(id__in=[t.id for t in due]).update(reminder_sent_at=now)
+        from . import sms
+        sms.enqueue_many([
+            SMSNotification(
+                transaction=t,
+                phone_number=t.phone_number,
+                message=SMSService.payment_reminder_message(t),
+                notification_type='payment_reminder',
+            )
+            for t in due
+        ])
+    return len(due)
+
+
+def expire(transaction_ids, now):
+    from .services import close_transactions
+    
+    return close_transactions(
+        MobileMoneyTransaction.objects.filter(id__in=transaction_ids, status='pending', expires_at__lte=now),
+        'expired'
+    )
+
+
+class DatabaseDeadlines:
+    """Finds due work straight from the (status, expires_at) index"""
+    
+    def __init__(self, options):
+        self.options = options
+    
+    def schedule(self, transaction_obj):
+        pass
+    
+    def due_reminders(self, now, limit):
+        lead = timedelta(seconds=self.options['REMINDER_LEAD_SECONDS'])
+        return list(MobileMoneyTransaction.objects.filter(
+            status='pending', expires_at__gt=now, expires_at__lte=now + lead, reminder_sent_at__isnull=True,
+        ).order_by('expires_at').values_list('id', flat=True)[:limit])
+    
+    def due_expiries(self, now, limit):
+        return list(MobileMoneyTransaction.objects.filter(
+            status='pending', expires_at__lte=now,
+        ).order_by('expires_at').values_list('id', flat=True)[:limit])
+    
+    def recover(self):
+        return 0
+
+
+class RedisDeadlines(DatabaseDeadlines):
+    reminders_key = 'mobile_payments:deadlines:reminders'
+    expiries_key = 'mobile_payments:deadlines:expiries'
+    
+    def __init__(self, options):
+        import redis
+        
+        super().__init__(options)
+        self.client = redis.Redis.from_url(options['REDIS_URL'])
+        self.pop_due = self.client.register_script(POP_DUE_SCRIPT)
+    
+    def schedule(self, transaction_obj):
+        member = str(transaction_obj.id)
+        pipe = self.client.pipeline(transaction=False)
+        if not transaction_obj.reminder_sent_at:
+            pipe.zadd(self.reminders_key, {member: reminder_due_at(transaction_obj).timestamp()})
+        pipe.zadd(self.expiries_key, {member: transaction_obj.expires_at.timestamp()})
+        pipe.execute()
+    
+    def _pop(self, key, now, limit):
+        return [member.decode() for member in self.pop_due(keys=[key], args=[now.timestamp(), limit])]
+    
+    def due_reminders(self, now, limit):
+        return self._pop(self.reminders_key, now, limit)
+    
+    def due_expiries(self, now, limit):
+        return self._pop(self.expiries_key, now, limit)
+    
+    def recover(self):
+        """Re-add every pending transaction to the sets"""
+        scheduled = 0
+        pending = MobileMoneyTransaction.objects.filter(status='pending').only(
+            'id', 'expires_at', 'reminder_sent_at'
+        )
+        for transaction_obj in pending.iterator(chunk_size=self.options['BATCH_SIZE']):
+            self.schedule(transaction_obj)
+            scheduled += 1
+        return scheduled
+
+
+DEADLINE_BACKENDS = {
+    'redis': RedisDeadlines,
+    'db': DatabaseDeadlines,
+}
+
+_deadlines = None
+_deadlines_lock = threading.Lock()
+
+
+def get_deadlines():
+    """Process-wide scheduler for the configured backend"""
+    global _deadlines
+    if _deadlines is None:
+        with _deadlines_lock:
+            if _deadlines is None:
+                options = deadline_settings()
+                _deadlines = DEADLINE_BACKENDS[options['BACKEND']](options)
+    return _deadlines
+
+
+def process_due(now=None):
+    """Fire every due reminder and expiry, batch by batch; returns (reminded, expired)"""
+    now = now or timezone.now()
+    deadlines = get_deadlines()
+    batch_size = deadline_settings()['BATCH_SIZE']
+    
+    reminded = expired = 0
+    while True:
+        ids = deadlines.due_reminders(now, batch_size)
+        if not ids:
+            break
+        reminded += send_reminders(ids, now)
+    while True:
+        ids = deadlines.due_expiries(now, batch_size)
+        if not ids:
+            break
+        expired += expire(ids, now)
+    return reminded, expired
@@ -0,0 +1,292 @@
+"""
+Inbound payment confirmation SMS.
+
+The ``sms_webhook`` view only stores what the gateway posts: each message is
+inserted into ``InboundSMS`` keyed by the gateway's message id (or a hash of
+sender and text when there is none), with ``ON CONFLICT DO NOTHING`` so
+gateway retries are dropped, and the view answers straight away.
+
+The ``process_inbound_sms`` task then claims received rows with
+``SELECT ... FOR UPDATE SKIP LOCKED`` and handles each batch in one
+transaction (if it fails, the batch is retried one message at a time and a
+message that keeps failing is marked ``failed`` after ``MAX_ATTEMPTS``):
+
+* every message is parsed by its provider's grammar; the patterns are
+  compiled once at import, and the sender id picks which grammar is tried
+  first
+* the referenced transactions are loaded with one query
+* pending ones are confirmed together by ``PaymentProcessor.confirm_payments``
+  when the message was parsed by their provider's grammar and pays at
+  least their amount
+* the messages are marked with the outcome in one ``bulk_update``
+"""
+import hashlib
+import logging
+import re
+import time
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import InboundSMS, MobileMoneyTransaction
+
+logger = logging.getLogger(__name__)
+
+AMOUNT = r'(?:ZMW|K)\s?(?P<amount>[\d,]+(?:\.\d{1,2})?)'
+# Legacy codes have 8 digits, allocated ones 9 (see reference_codes.py)
+REFERENCE = r'(?P<reference>\d{8,9})\b'
+
+SUCCESS_KEYWORDS = re.compile(r'\b(?:successful|confirmed|completed|received)\b', re.IGNORECASE)
+
+
+@dataclass
+class ParsedSMS:
+    provider: str
+    reference_code: str
+    amount: Optional[Decimal] = None
+    provider_transaction_id: str = ''
+
+
+class ProviderGrammar:
+    """Confirmation SMS format of one mobile money provider"""
+    
+    def __init__(self, provider, senders, pattern):
+        self.provider = provider
+        self.senders = frozenset(senders)
+        self.pattern = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+    
+    def parse(self, text):
+        match = self.pattern.search(text)
+        if not match:
+            return None
+        groups = match.groupdict()
+        return ParsedSMS(
+            provider=self.provider,
+            reference_code=groups['reference'],
+            amount=parse_amount(groups.get('amount')),
+            provider_transaction_id=groups.get('txn_id') or '',
+        )
+
+
+class FallbackGrammar(ProviderGrammar):
+    """Any message with a reference code and a success keyword"""
+    
+    def __init__(self):
+        super().__init__('', [], r'Reference[:\s]+' + REFERENCE)
+    
+    def parse(self, text):
+        if not SUCCESS_KEYWORDS.search(text):
+            return None
+        return super().parse(text)
+
+
+GRAMMARS = [
+    # Trans. ID: MP240115.1234.C56789. You have received ZMW 150.00 from 0977123456 JOHN BANDA. Ref: 123456789.
+    ProviderGrammar(
+        'airtel', ['airtelmoney', 'airtel'],
+        r'Trans\.?\s*ID:\s*(?P<txn_id>\w+(?:\.\w+)*)\.?\s+You have received ' + AMOUNT + r'.*?\bRef:\s*' + REFERENCE,
+    ),
+    # You have received 150.00 ZMW from JOHN BANDA (260961234567) ... Reference: 123456789. Financial Transaction Id: 123456789.
+    ProviderGrammar(
+        'mtn', ['mtnmomo', 'momo', 'mtn'],
+        r'You have received (?P<amount>[\d,]+(?:\.\d{1,2})?)\s?ZMW.*?\bReference:\s*' + REFERENCE
+        + r'.*?Financial Transaction Id:\s*(?P<txn_id>\w+)',
+    ),
+    # Payment of K150.00 received from 0951234567 JOHN BANDA. Ref 123456789. Txn ID ZK12345678AB.
+    ProviderGrammar(
+        'zamtel', ['zamtelkwacha', 'zamtel', 'kwacha'],
+        r'Payment of ' + AMOUNT + r' received from .*?\bRef\s+' + REFERENCE + r'.*?Txn ID\s+(?P<txn_id>\w+)',
+    ),
+]
+
+FALLBACK_GRAMMAR = FallbackGrammar()
+
+GRAMMARS_BY_SENDER = {sender: grammar for grammar in GRAMMARS for sender in grammar.senders}
+GRAMMARS_BY_PROVIDER = {grammar.provider: grammar for grammar in GRAMMARS}
+
+NON_ALNUM = re.compile(r'[^a-z0-9]')
+
+
+def inbound_settings():
+    return settings.SMS_INBOUND
+
+
+def parse_amount(value):
+    if not value:
+        return None
+    try:
+        return Decimal(value.replace(',', ''))
+    except InvalidOperation:
+        return None
+
+
+def parse_sms(text, sender='', provider=''):
+    """Parse a confirmation SMS, trying the sender's provider grammar first"""
+    hinted = GRAMMARS_BY_PROVIDER.get(provider) or GRAMMARS_BY_SENDER.get(NON_ALNUM.sub('', sender.lower()))
+    if hinted:
+        parsed = hinted.parse(text)
+        if parsed:
+            return parsed
+    for grammar in GRAMMARS:
+        if grammar is not hinted:
+            parsed = grammar.parse(text)
+            if parsed:
+                return parsed
+    return FALLBACK_GRAMMAR.parse(text)
+
+
+def message_id_for(sender, text, gateway_id=''):
+    if gateway_id:
+        return str(gateway_id)[:100]
+    return 'sha256:' + hashlib.sha256(f'{sender}\n{text}'.encode()).hexdigest()
+
+
+def accept(messages):
+    """
+    Store ``[{'id', 'from', 'message', 'provider'}]`` webhook messages.
+    
+    Messages already received are ignored. Processing is left to the
+    ``process_inbound_sms`` task.
+    """
+    rows = [
+        InboundSMS(
+            message_id=message_id_for(message['from'], message['message'], message.get('id')),
+            sender=message['from'][:30],
+            message=message['message'],
+            provider=message.get('provider', '')[:20],
+        )
+        for message in messages
+    ]
+    InboundSMS.objects.bulk_create(rows, ignore_conflicts=True)
+    
+    from .tasks import process_inbound_sms
+    transaction.on_commit(process_inbound_sms.delay)
+    return len(rows)
+
+
+def apply_messages(batch):
+    """Parse claimed messages, confirm the payments they match and mark them with the outcome"""
+    from .services import PaymentProcessor
+    
+    if not batch:
+        return
+    
+    parsed = {}
+    for inbound in batch:
+        result = parse_sms(inbound.message, inbound.sender, inbound.provider)
+        if result is None:
+            inbound.status = 'unparsed'
+            continue
+        parsed[inbound.pk] = result
+        inbound.provider = result.provider or inbound.provider
+        inbound.reference_code = result.reference_code
+        inbound.amount = result.amount
+        inbound.provider_transaction_id = result.provider_transaction_id
+    
+    transactions = {
+        t.reference_code: t
+        for t in MobileMoneyTransaction.objects.filter(
+            reference_code__in={result.reference_code for result in parsed.values()}
+        ).select_related('course', 'provider')
+    }
+    
+    to_confirm = {}
+    for inbound in batch:
+        if inbound.pk not in parsed:
+            continue
+        payment = transactions.get(inbound.reference_code)
+        inbound.transaction = payment
+        if payment is None:
+            inbound.status = 'unmatched'
+        elif payment.status != 'pending' or payment.id in to_confirm:
+            inbound.status = 'duplicate'
+        elif inbound.amount is None or parsed[inbound.pk].provider != payment.provider.name:
+            # The webhook is not authenticated, so a message must at
+            # least carry the provider's format and an amount
+            inbound.status = 'unverified'
+        elif inbound.amount < payment.amount:
+            inbound.status = 'underpaid'
+        else:
+            to_confirm[payment.id] = inbound
+    
+    confirmed = PaymentProcessor().confirm_payments(
+        [inbound.transaction for inbound in to_confirm.values()],
+        verification_method='sms',
+        notes={pk: f"SMS confirmation: {inbound.message[:100]}" for pk, inbound in to_confirm.items()},
+        verification_data={
+            pk: {
+                'inbound_sms_id': inbound.pk,
+                'sender': inbound.sender,
+                'provider': inbound.provider,
+                'provider_transaction_id': inbound.provider_transaction_id,
+                'amount': str(inbound.amount) if inbound.amount is not None else None,
+            }
+            for pk, inbound in to_confirm.items()
+        },
+    )
+    confirmed_ids = {payment.id for payment in confirmed}
+    for payment_id, inbound in to_confirm.items():
+        inbound.status = 'confirmed' if payment_id in confirmed_ids else 'duplicate'
+    
+    now = timezone.now()
+    for inbound in batch:
+        inbound.processed_at = now
+    InboundSMS.objects.bulk_update(batch, [
+        'status', 'provider', 'reference_code', 'amount', 'provider_transaction_id',
+        'transaction', 'processed_at',
+    ])
+
+
+def record_failure(message_ids, error):
+    InboundSMS.objects.filter(id__in=message_ids).update(attempts=F('attempts') + 1, last_error=str(error))
+    InboundSMS.objects.filter(
+        id__in=message_ids, attempts__gte=inbound_settings()['MAX_ATTEMPTS']
+    ).update(status='failed', processed_at=timezone.now())
+
+
+def process_batch(batch_size=None):
+    """Parse and apply one batch of received messages; returns how many were claimed"""
+    batch_size = batch_size or inbound_settings()['BATCH_SIZE']
+    claimed = []
+    try:
+        with transaction.atomic():
+            claimed = list(
+                InboundSMS.objects.select_for_update(skip_locked=True)
+                .filter(status='received')
+                .order_by('received_at')[:batch_size]
+            )
+            apply_messages(claimed)
+        return len(claimed)
+    except Exception:
+        if not claimed:
+            raise
+        logger.exception('Inbound SMS batch failed, retrying one message at a time')
+    
+    for message_id in [inbound.pk for inbound in claimed]:
+        try:
+            with transaction.atomic():
+                apply_messages(list(
+                    InboundSMS.objects.select_for_update(skip_locked=True).filter(pk=message_id, status='received')
+                ))
+        except Exception as e:
+            logger.exception('Inbound SMS %s failed', message_id)
+            record_failure([message_id], e)
+    return len(claimed)
+
+
+def process_pending(max_seconds=None):
+    """Process received messages batch by batch until none are left or the time is up"""
+    max_seconds = max_seconds or inbound_settings()['MAX_RUN_SECONDS']
+    deadline = time.monotonic() + max_seconds
+    total = 0
+    while time.monotonic() < deadline:
+        claimed = process_batch()
+        total += claimed
+        if not claimed:
+            break
+    return total
@@ -0,0 +1,145 @@
+"""
+Pushed payment status.
+
+Checkout pages used to poll ``payment_status`` every few seconds while the
+user completed the USSD flow, and every poll loaded the transaction, its
+provider and its course. Now:
+
+* the status payload of each transaction is cached under its reference code
+  and rewritten whenever the status changes, so status reads are cache hits
+* every change is sent to the ``payment_status_<reference_code>`` channel
+  group; ``PaymentStatusConsumer`` relays it to websocket clients
+* ``wait_for_change`` backs the long-poll fallback: the request joins the
+  same group with a channel of its own and awaits one message, so a waiting
+  client holds neither a thread nor a database connection
+
+Changes are published after commit from ``post_save`` (initiation,
+cancellation), the ``payments_confirmed`` signal and the bulk expiry and
+cancellation paths.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from notifications.realtime import send_to_groups
+
+from . import reference_codes
+from .models import MobileMoneyTransaction
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = ('initiated', 'pending')
+
+
+def push_settings():
+    return settings.PAYMENT_STATUS_PUSH
+
+
+def status_group(reference_code):
+    return f'payment_status_{reference_code}'
+
+
+def cache_key(reference_code):
+    return f'mobile_payments:status:{reference_code}'
+
+
+def status_entry(transaction):
+    """What is cached per transaction: the owner, expiry and status payload"""
+    return {
+        'user_id': str(transaction.user_id),
+        'expires_at': transaction.expires_at,
+        'payment': {
+            'reference_code': transaction.reference_code,
+            'status': transaction.status,
+            'amount': float(transaction.amount),
+            'currency': transaction.currency,
+            'provider': transaction.provider.display_name,
+            'course_title': transaction.course.title,
+            'expires_at': transaction.expires_at.isoformat(),
+            'created_at': transaction.created_at.isoformat(),
+        },
+    }
+
+
+def current_status(entry):
+    """Status payload of a cached entry, with ``is_expired`` as of now"""
+    return {
+        **entry['payment'],
+        'is_expired': entry['payment']['status'] in OPEN_STATUSES and timezone.now() > entry['expires_at'],
+    }
+
+
+def get_status(reference_code):
+    """Cached entry for a transaction, loading it on a miss; None if it does not exist"""
+    if not reference_codes.is_plausible(reference_code):
+        return None
+    
+    key = cache_key(reference_code)
+    entry = cache.get(key)
+    if entry is None:
+        transaction = MobileMoneyTransaction.objects.select_related('provider', 'course').filter(
+            reference_code=reference_code
+        ).first()
+        if transaction is None:
+            return None
+        entry = status_entry(transaction)
+        cache.set(key, entry, push_settings()['CACHE_TIMEOUT'])
+    return entry
+
+
+def publish(transactions):
+    """Cache and push the current status of the given transactions"""
+    entries = {transaction.reference_code: status_entry(transaction) for transaction in transactions}
+    if not entries:
+        return
+    try:
+        cache.set_many(
+            {cache_key(reference_code): entry for reference_code, entry in entries.items()},
+            push_settings()['CACHE_TIMEOUT'],
+        )
+    except Exception:
+        # Stale entries age out after CACHE_TIMEOUT
+        logger.warning('Could not cache status of %d payments', len(entries), exc_info=True)
+    
+    send_to_groups([
+        (status_group(reference_code), {'type': 'payment_status', 'payment': current_status(entry)})
+        for reference_code, entry in entries.items()
+    ])
+
+
+def publish_ids(transaction_ids):
+    """Publish transactions changed by bulk UPDATEs, loading them in one query"""
+    publish(MobileMoneyTransaction.objects.filter(id__in=list(transaction_ids)).select_related('provider', 'course'))
+
+
+async def wait_for_change(reference_code, known_status, timeout):
+    """
+    Wait up to ``timeout`` seconds for the status to differ from
+    ``known_status``; returns the new payload, or None on timeout.
+    """
+    channel_layer = get_channel_layer()
+    group = status_group(reference_code)
+    channel = await channel_layer.new_channel()
+    await channel_layer.group_add(group, channel)
+    try:
+        # Subscribed first, so a change published meanwhile is not missed
+        entry = await sync_to_async(get_status)(reference_code)
+        if entry is not None and entry['payment']['status'] != known_status:
+            return current_status(entry)
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                message = await asyncio.wait_for(channel_layer.receive(channel), deadline - loop.time())
+            except asyncio.TimeoutError:
+                return None
+            if message['payment']['status'] != known_status:
+                return message['payment']
+    finally:
+        await channel_layer.group_discard(group, channel)
@@ -0,0 +1,41 @@
+import os
+from dataclasses import asdict
+from django.core.management.base import BaseCommand, CommandError
+from mobile_payments.models import MobileMoneyProvider
+from mobile_payments.reconciliation import reconcile
+
+class Command(BaseCommand):
+    help = 'Confirm pending mobile money payments from a provider settlement statement'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('statement', help='CSV file, or JSON file with one object per line')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Defaults to the file extension')
+        parser.add_argument('--provider', choices=[name for name, _ in MobileMoneyProvider.PROVIDER_CHOICES],
+                            help='Only match transactions of this provider')
+        parser.add_argument('--report', help='Write the lines that were not confirmed to this CSV file')
+        parser.add_argument('--dry-run', action='store_true', help='Match without changing anything')
+    
+    def handle(self, *args, **options):
+        path = options['statement']
+        statement_format = options['format'] or ('json' if path.endswith(('.json', '.jsonl')) else 'csv')
+        
+        report = open(options['report'], 'w', newline='') if options['report'] else None
+        try:
+            with open(path, newline='') as stream:
+                result = reconcile(
+                    stream,
+                    os.path.basename(path),
+                    statement_format,
+                    provider=options['provider'],
+                    report=report,
+                    dry_run=options['dry_run'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        finally:
+            if report:
+                report.close()
+        
+        for outcome, count in asdict(result).items():
+            self.stdout.write(f'{outcome}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Confirmed {result.confirmed} payments'))
@@ -3,8 +3,6 @@ from django.contrib.auth import get_user_model
 from courses.models import Course
 import uuid
 from django.utils import timezone
-import secrets
-import string
 
 User = get_user_model()
 
@@ -59,6 +57,7 @@ class MobileMoneyTransaction(models.Model):
     
     expires_at = models.DateTimeField()
     confirmed_at = models.DateTimeField(blank=True, null=True)
+    reminder_sent_at = models.DateTimeField(blank=True, null=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -68,7 +67,8 @@ class MobileMoneyTransaction(models.Model):
         indexes = [
             models.Index(fields=['reference_code']),
             models.Index(fields=['phone_number']),
-            models.Index(fields=['status']),
+            models.Index(fields=['status', 'expires_at']),
+            models.Index(fields=['user', '-created_at', '-id']),
         ]
     
     def save(self, *args, **kwargs):
@@ -79,11 +79,9 @@ class MobileMoneyTransaction(models.Model):
         super().save(*args, **kwargs)
     
     def generate_reference_code(self):
-        """Generate a unique 8-digit reference code"""
-        while True:
-            code = ''.join(secrets.choice(string.digits) for _ in range(8))
-            if not MobileMoneyTransaction.objects.filter(reference_code=code).exists():
-                return code
+        """Allocate a unique 9-digit reference code, see reference_codes.py"""
+        from .reference_codes import allocate
+        return allocate()
     
     @property
     def is_expired(self):
@@ -92,12 +90,21 @@ class MobileMoneyTransaction(models.Model):
     def __str__(self):
         return f"{self.provider.display_name} - {self.reference_code} - {self.amount} {self.currency}"
 
+class ReferenceSequence(models.Model):
+    """Counter that reference code blocks are reserved from"""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
 class PaymentVerification(models.Model):
     VERIFICATION_METHODS = [
         ('sms', 'SMS Confirmation'),
         ('manual', 'Manual Verification'),
         ('webhook', 'Webhook Callback'),
         ('admin', 'Admin Confirmation'),
+        ('statement', 'Statement Reconciliation'),
     ]
     
     transaction = models.ForeignKey(MobileMoneyTransaction, on_delete=models.CASCADE, related_name='verifications')
@@ -121,18 +128,83 @@ class SMSNotification(models.Model):
         ('payment_failed', 'Payment Failed'),
     ]
     
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('delivered', 'Delivered'),
+        ('failed', 'Failed'),
+    ]
+    
     transaction = models.ForeignKey(MobileMoneyTransaction, on_delete=models.CASCADE, related_name='sms_notifications')
     phone_number = models.CharField(max_length=15)
     message = models.TextField()
     notification_type = models.CharField(max_length=30, choices=NOTIFICATION_TYPES)
     
-    sent_at = models.DateTimeField(auto_now_add=True)
+    # Outbound queue state, see mobile_payments/sms.py
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    gateway = models.CharField(max_length=50, blank=True)
+    provider_message_id = models.CharField(max_length=100, blank=True, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
     delivered = models.BooleanField(default=False)
     delivery_status = models.CharField(max_length=50, blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
     def __str__(self):
         return f"SMS to {self.phone_number} - {self.notification_type}"
 
+class InboundSMS(models.Model):
+    """Payment confirmation SMS received on the webhook, see inbound.py"""
+    STATUS_CHOICES = [
+        ('received', 'Received'),
+        ('confirmed', 'Payment Confirmed'),
+        ('duplicate', 'Already Confirmed'),
+        ('underpaid', 'Amount Too Low'),
+        ('unverified', 'Provider or Amount Not Verified'),
+        ('unmatched', 'No Matching Payment'),
+        ('unparsed', 'Not a Payment Confirmation'),
+        ('failed', 'Processing Failed'),
+    ]
+    
+    # Gateway message id, or a hash of sender and text when it sends none
+    message_id = models.CharField(max_length=100, unique=True)
+    sender = models.CharField(max_length=30, blank=True)
+    message = models.TextField()
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='received')
+    provider = models.CharField(max_length=20, blank=True)
+    reference_code = models.CharField(max_length=10, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    provider_transaction_id = models.CharField(max_length=100, blank=True)
+    transaction = models.ForeignKey(
+        MobileMoneyTransaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='inbound_sms'
+    )
+    
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        verbose_name = "Inbound SMS"
+        verbose_name_plural = "Inbound SMS"
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+    
+    def __str__(self):
+        return f"SMS from {self.sender} - {self.status}"
+
 class PaymentSettings(models.Model):
     """Global settings for mobile money payments"""
     payment_timeout_minutes = models.PositiveIntegerField(default=30)
@@ -149,6 +221,10 @@ class PaymentSettings(models.Model):
         default="Payment confirmed! You now have access to {course_title}. "
                 "Reference: {reference_code}"
     )
+    payment_reminder_template = models.TextField(
+        default="Reminder: Complete your payment of {amount} {currency} for {course_title}. "
+                "Reference: {reference_code}. Payment expires in {minutes_left} minutes."
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
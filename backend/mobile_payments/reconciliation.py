@@ -0,0 +1,317 @@
+"""
+Reconciliation of provider settlement statements.
+
+Statements are read line by line (CSV, or JSON with one object per line),
+so files of any size run in constant memory apart from the index. The index
+maps the ``reference_code`` and ``external_reference`` of every pending
+transaction to its id and amount and is built with one query up front; each
+line is matched against it in memory.
+
+Matches are collected into chunks of ``CHUNK_SIZE`` and confirmed through
+``PaymentProcessor.confirm_payments``, so each chunk costs a handful of
+queries however many lines it holds. Lines for the same payment are added
+up, so a short payment topped up later in the statement is confirmed once
+the total covers it; payments still short at the end of the statement get a
+failed ``PaymentVerification`` instead. Lines that match nothing pending are
+looked up in chunks to tell payments confirmed earlier from unknown
+references, and are written to the unmatched report.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+from .models import MobileMoneyTransaction, PaymentVerification
+
+CHUNK_SIZE = 1000
+
+COLUMN_ALIASES = {
+    'reference': ['reference', 'reference_code', 'ref', 'merchant_reference'],
+    'external_reference': [
+        'external_reference', 'transaction_id', 'txn_id', 'financial_transaction_id', 'receipt', 'receipt_number',
+    ],
+    'amount': ['amount', 'credit', 'paid_amount'],
+}
+
+REPORT_FIELDS = ['line', 'outcome', 'reference', 'external_reference', 'amount', 'expected_amount']
+
+
+@dataclass
+class StatementLine:
+    line: int
+    reference: str
+    external_reference: str
+    amount: Optional[Decimal]
+
+
+@dataclass
+class PendingPayment:
+    id: object
+    reference_code: str
+    external_reference: str
+    amount: Decimal
+    paid: Decimal = Decimal('0')
+    lines: list = field(default_factory=list)  # statement lines paying it so far
+
+
+@dataclass
+class ReconciliationResult:
+    lines: int = 0
+    confirmed: int = 0
+    mismatched: int = 0
+    already_confirmed: int = 0
+    duplicate: int = 0
+    unmatched: int = 0
+    invalid: int = 0
+
+
+def normalise_header(name):
+    return name.strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def parse_amount(value):
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(str(value).replace(',', '').strip())
+    except InvalidOperation:
+        return None
+
+
+def statement_line(number, row):
+    """Pick the known columns out of a statement row"""
+    row = {normalise_header(key): value for key, value in row.items() if key}
+    values = {}
+    for name, aliases in COLUMN_ALIASES.items():
+        values[name] = next((row[alias] for alias in aliases if row.get(alias) not in (None, '')), '')
+    return StatementLine(
+        line=number,
+        reference=str(values['reference']).strip(),
+        external_reference=str(values['external_reference']).strip(),
+        amount=parse_amount(values['amount']),
+    )
+
+
+def read_statement(stream, statement_format='csv'):
+    """Yield the lines of an open statement file"""
+    if statement_format == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=2):
+            yield statement_line(number, row)
+    elif statement_format == 'json':
+        for number, text in enumerate(stream, start=1):
+            if text.strip():
+                yield statement_line(number, json.loads(text))
+    else:
+        raise ValueError(f"Unknown statement format: {statement_format}")
+
+
+class PendingIndex:
+    """Pending transactions of a provider keyed by reference and external reference"""
+    
+    def __init__(self, provider=None):
+        pending = MobileMoneyTransaction.objects.filter(status='pending')
+        if provider:
+            pending = pending.filter(provider__name=provider)
+        
+        self.by_reference = {}
+        self.by_external_reference = {}
+        self.matched = {}
+        rows = pending.values_list('id', 'reference_code', 'external_reference', 'amount')
+        for transaction_id, reference_code, external_reference, amount in rows.iterator(chunk_size=CHUNK_SIZE):
+            payment = PendingPayment(transaction_id, reference_code, external_reference, amount)
+            self.by_reference[reference_code] = payment
+            if external_reference:
+                self.by_external_reference[external_reference] = payment
+    
+    def __len__(self):
+        return len(self.by_reference)
+    
+    def find(self, line):
+        return (
+            self.by_reference.get(line.reference)
+            or self.by_external_reference.get(line.external_reference)
+            or self.by_reference.get(line.external_reference)
+        )
+    
+    def seen(self, line):
+        """Whether an earlier line of the statement matched the same payment"""
+        return line.reference in self.matched or line.external_reference in self.matched
+    
+    def take(self, payment):
+        """Remove a matched payment so later lines for it count as duplicates"""
+        del self.by_reference[payment.reference_code]
+        self.matched[payment.reference_code] = payment
+        if payment.external_reference:
+            self.by_external_reference.pop(payment.external_reference, None)
+            self.matched[payment.external_reference] = payment
+
+
+class Reconciler:
+    """Match statement lines against pending transactions and apply the results"""
+    
+    def __init__(self, statement_name, provider=None, verified_by=None, report=None, dry_run=False):
+        self.statement_name = statement_name
+        self.verified_by = verified_by
+        self.dry_run = dry_run
+        self.index = PendingIndex(provider)
+        self.result = ReconciliationResult()
+        self.report = csv.DictWriter(report, fieldnames=REPORT_FIELDS) if report else None
+        if self.report:
+            self.report.writeheader()
+        
+        self.matched = []
+        self.mismatched = []
+        self.unmatched = []
+        # Payments paid in part so far; a later line may top them up
+        self.short = {}
+    
+    def run(self, lines):
+        for line in lines:
+            self.result.lines += 1
+            self.add(line)
+            if max(len(self.matched), len(self.mismatched), len(self.unmatched)) >= CHUNK_SIZE:
+                self.flush()
+        self.mismatched.extend((payment.lines[-1], payment) for payment in self.short.values())
+        self.short = {}
+        self.flush()
+        return self.result
+    
+    def add(self, line):
+        if not (line.reference or line.external_reference) or line.amount is None:
+            self.record(line, 'invalid')
+            return
+        
+        payment = self.index.find(line)
+        if payment is None:
+            if self.index.seen(line):
+                self.record(line, 'duplicate')
+            else:
+                self.unmatched.append(line)
+            return
+        
+        payment.paid += line.amount
+        payment.lines.append(line)
+        if payment.paid < payment.amount:
+            self.short[payment.id] = payment
+            return
+        self.short.pop(payment.id, None)
+        self.index.take(payment)
+        self.matched.append((line, payment))
+    
+    def flush(self):
+        self.flush_matched()
+        self.flush_mismatched()
+        self.flush_unmatched()
+    
+    def flush_matched(self):
+        if not self.matched:
+            return
+        matched, self.matched = self.matched, []
+        if self.dry_run:
+            self.result.confirmed += len(matched)
+            return
+        
+        from .services import PaymentProcessor
+        
+        lines = {payment.id: line for line, payment in matched}
+        payments = {payment.id: payment for line, payment in matched}
+        transactions = MobileMoneyTransaction.objects.filter(id__in=list(lines)).select_related('course')
+        confirmed = PaymentProcessor().confirm_payments(
+            transactions,
+            verification_method='statement',
+            verified_by=self.verified_by,
+            notes={pk: self.describe(payment) for pk, payment in payments.items()},
+            verification_data={pk: self.verification_data(lines[pk], payment) for pk, payment in payments.items()},
+        )
+        
+        with_receipts = []
+        for transaction in confirmed:
+            external_reference = lines[transaction.id].external_reference
+            if external_reference and not transaction.external_reference:
+                transaction.external_reference = external_reference[:100]
+                with_receipts.append(transaction)
+        MobileMoneyTransaction.objects.bulk_update(with_receipts, ['external_reference'])
+        
+        self.result.confirmed += len(confirmed)
+        confirmed_ids = {transaction.id for transaction in confirmed}
+        for pk, line in lines.items():
+            if pk not in confirmed_ids:
+                # Confirmed by someone else since the index was built
+                self.record(line, 'already_confirmed')
+    
+    def flush_mismatched(self):
+        if not self.mismatched:
+            return
+        mismatched, self.mismatched = self.mismatched, []
+        self.result.mismatched += len(mismatched)
+        for line, payment in mismatched:
+            self.write_report(line, 'amount_mismatch', payment.amount)
+        if self.dry_run:
+            return
+        
+        PaymentVerification.objects.bulk_create([
+            PaymentVerification(
+                transaction_id=payment.id,
+                method='statement',
+                verified_by=self.verified_by,
+                is_successful=False,
+                notes=f"{self.describe(payment)}: paid {payment.paid}, expected {payment.amount}",
+                verification_data=self.verification_data(line, payment),
+            )
+            for line, payment in mismatched
+        ])
+    
+    def flush_unmatched(self):
+        if not self.unmatched:
+            return
+        unmatched, self.unmatched = self.unmatched, []
+        
+        references = {line.reference for line in unmatched if line.reference}
+        external_references = {line.external_reference for line in unmatched if line.external_reference}
+        confirmed = MobileMoneyTransaction.objects.filter(status='confirmed')
+        confirmed = set(
+            confirmed.filter(reference_code__in=references).values_list('reference_code', flat=True)
+        ) | set(
+            confirmed.filter(external_reference__in=external_references).values_list('external_reference', flat=True)
+        )
+        
+        for line in unmatched:
+            if line.reference in confirmed or line.external_reference in confirmed:
+                self.record(line, 'already_confirmed')
+            else:
+                self.record(line, 'unmatched')
+    
+    def record(self, line, outcome):
+        setattr(self.result, outcome, getattr(self.result, outcome) + 1)
+        self.write_report(line, outcome)
+    
+    def write_report(self, line, outcome, expected_amount=None):
+        if self.report:
+            self.report.writerow({
+                'line': line.line,
+                'outcome': outcome,
+                'reference': line.reference,
+                'external_reference': line.external_reference,
+                'amount': line.amount,
+                'expected_amount': expected_amount,
+            })
+    
+    def describe(self, payment):
+        numbers = ', '.join(str(line.line) for line in payment.lines)
+        return f"Statement {self.statement_name}, line{'s' if len(payment.lines) > 1 else ''} {numbers}"
+    
+    def verification_data(self, line, payment):
+        return {
+            'statement': self.statement_name,
+            'line': line.line,
+            'lines': [line.line for line in payment.lines],
+            'reference': line.reference,
+            'external_reference': line.external_reference,
+            'amount': str(payment.paid),
+        }
+
+
+def reconcile(stream, statement_name, statement_format='csv', **options):
+    """Reconcile an open statement file; see ``Reconciler`` for the options"""
+    return Reconciler(statement_name, **options).run(read_statement(stream, statement_format))
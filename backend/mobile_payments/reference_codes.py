@@ -0,0 +1,152 @@
+"""
+Reference code allocation.
+
+Codes used to be random 8-digit strings, each checked with an EXISTS query
+and retried on collision, which gets slower as the table fills and still
+races between the check and the INSERT. Codes are now derived from a
+counter instead:
+
+* each process reserves a block of ``BLOCK_SIZE`` counter values with one
+  locked UPDATE of its ``ReferenceSequence`` row, then hands them out from
+  memory, so allocating a code needs no query on the hot path
+* the counter value goes through a keyed 4-round Feistel network over
+  10^4 x 10^4, a bijection on 0..10^8-1, so consecutive payments get
+  unrelated-looking codes that can never repeat
+* a Luhn check digit is appended, catching mistyped digits and most
+  adjacent transpositions (not 09 <-> 90) before any lookup
+
+New codes have 9 digits, so they cannot clash with the legacy 8-digit ones.
+``PERMUTATION_KEY`` (``REFERENCE_CODE_KEY``, which has no default) must be
+kept secret, as it is all that is needed to list the issued codes, and must
+never change once codes have been issued.
+"""
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import ReferenceSequence
+
+HALF = 10 ** 4
+SPACE = HALF * HALF
+ROUNDS = 4
+SEQUENCE_NAME = 'mobile_money_transaction'
+LEGACY_LENGTH = 8
+
+
+class ReferenceCodesExhausted(Exception):
+    pass
+
+
+def code_settings():
+    return settings.REFERENCE_CODES
+
+
+def _round(key, number, value):
+    digest = hashlib.blake2b(f'{number}:{value}'.encode(), key=key, digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % HALF
+
+
+def permute(value, key):
+    """Map 0..10^8-1 onto itself, one to one"""
+    left, right = divmod(value, HALF)
+    for number in range(ROUNDS):
+        left, right = right, (left + _round(key, number, right)) % HALF
+    return left * HALF + right
+
+
+def luhn_digit(digits):
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+
+def encode(value, key):
+    digits = f'{permute(value, key):08d}'
+    return digits + luhn_digit(digits)
+
+
+def is_plausible(code):
+    """Whether ``code`` could have been issued: a legacy code or a 9-digit code with a valid check digit"""
+    if not code.isdigit():
+        return False
+    if len(code) == LEGACY_LENGTH:
+        return True
+    return len(code) == LEGACY_LENGTH + 1 and luhn_digit(code[:-1]) == code[-1]
+
+
+def reserve_block(size):
+    """
+    Reserve ``size`` counter values and return the first one.
+    
+    The reservation runs on a thread of its own, and so on its own database
+    connection, so it commits straight away: the caller's transaction may
+    still roll back, and the block must not be handed out again.
+    """
+    outcome = {}
+    
+    def reserve():
+        try:
+            outcome['start'] = _reserve_block(size)
+        except Exception as e:
+            outcome['error'] = e
+        finally:
+            connections.close_all()
+    
+    thread = threading.Thread(target=reserve, name='reference-code-block')
+    thread.start()
+    thread.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['start']
+
+
+def _reserve_block(size):
+    with transaction.atomic():
+        sequence, _ = ReferenceSequence.objects.select_for_update().get_or_create(name=SEQUENCE_NAME)
+        start = sequence.next_value
+        if start + size > SPACE:
+            raise ReferenceCodesExhausted(f"Reference code space used up at {start}")
+        sequence.next_value = start + size
+        sequence.save(update_fields=['next_value'])
+    return start
+
+
+class Allocator:
+    """Hands out codes from blocks reserved per process"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.next_value = self.end = 0
+    
+    def take(self):
+        options = code_settings()
+        key = hashlib.blake2b(options['PERMUTATION_KEY'].encode(), digest_size=32).digest()
+        with self.lock:
+            if self.pid != os.getpid():
+                # A block inherited through fork is also held by the parent
+                self.pid = os.getpid()
+                self.next_value = self.end = 0
+            if self.next_value >= self.end:
+                self.next_value = reserve_block(options['BLOCK_SIZE'])
+                self.end = self.next_value + options['BLOCK_SIZE']
+            value = self.next_value
+            self.next_value += 1
+        return encode(value, key)
+
+
+_allocator = Allocator()
+
+
+def allocate():
+    """A new, never issued reference code"""
+    return _allocator.take()
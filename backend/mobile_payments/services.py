@@ -1,9 +1,14 @@
+import logging
 import re
 from typing import Optional, Dict, Any
-from django.conf import settings
+from django.db import transaction as db_transaction
 from django.utils import timezone
-from .models import MobileMoneyTransaction, MobileMoneyProvider, SMSNotification, PaymentSettings
-from courses.models import Enrollment
+from . import config, sms
+from .models import MobileMoneyTransaction, MobileMoneyProvider
+from courses.enrollments import create_paid_enrollments
+from payments import ledger
+
+logger = logging.getLogger(__name__)
 
 class PhoneNumberValidator:
     """Validate and format Zambian phone numbers"""
@@ -108,14 +113,14 @@ class USSDInstructionGenerator:
 class SMSService:
     """Handle SMS notifications for payments"""
     
-    def __init__(self):
-        self.settings = PaymentSettings.objects.first()
-        if not self.settings:
-            self.settings = PaymentSettings.objects.create()
+    @property
+    def settings(self):
+        return config.get_payment_settings()
     
     def send_payment_instructions(self, transaction: MobileMoneyTransaction) -> bool:
         """Send payment instructions via SMS"""
-        message = self.settings.payment_instructions_template.format(
+        message = config.render_sms(
+            'payment_instructions',
             amount=transaction.amount,
             currency=transaction.currency,
             course_title=transaction.course.title,
@@ -132,55 +137,67 @@ class SMSService:
     
     def send_payment_confirmation(self, transaction: MobileMoneyTransaction) -> bool:
         """Send payment confirmation SMS"""
-        message = self.settings.payment_confirmed_template.format(
-            course_title=transaction.course.title,
-            reference_code=transaction.reference_code
-        )
-        
         return self._send_sms(
             transaction=transaction,
             phone_number=transaction.phone_number,
-            message=message,
+            message=self.payment_confirmed_message(transaction),
             notification_type='payment_confirmed'
         )
     
+    @staticmethod
+    def payment_confirmed_message(transaction: MobileMoneyTransaction) -> str:
+        return config.render_sms(
+            'payment_confirmed',
+            course_title=transaction.course.title,
+            reference_code=transaction.reference_code
+        )
+    
     def send_payment_reminder(self, transaction: MobileMoneyTransaction) -> bool:
         """Send payment reminder SMS"""
-        message = f"Reminder: Complete your payment of {transaction.amount} {transaction.currency} " \
-                 f"for {transaction.course.title}. Reference: {transaction.reference_code}. " \
-                 f"Payment expires in 30 minutes."
-        
         return self._send_sms(
             transaction=transaction,
             phone_number=transaction.phone_number,
-            message=message,
+            message=self.payment_reminder_message(transaction),
             notification_type='payment_reminder'
         )
     
+    @staticmethod
+    def payment_reminder_message(transaction: MobileMoneyTransaction) -> str:
+        seconds_left = (transaction.expires_at - timezone.now()).total_seconds()
+        return config.render_sms(
+            'payment_reminder',
+            amount=transaction.amount,
+            currency=transaction.currency,
+            course_title=transaction.course.title,
+            reference_code=transaction.reference_code,
+            minutes_left=max(1, round(seconds_left / 60))
+        )
+    
     def _send_sms(self, transaction: MobileMoneyTransaction, phone_number: str, 
                   message: str, notification_type: str) -> bool:
-        """Send SMS using configured provider"""
+        """Queue an SMS for the dispatch worker (see sms.py)"""
         try:
-            # Create SMS notification record
-            sms_notification = SMSNotification.objects.create(
-                transaction=transaction,
-                phone_number=phone_number,
-                message=message,
-                notification_type=notification_type
-            )
-            
-            # Here you would integrate with actual SMS provider
-            # For now, we'll simulate successful sending
-            sms_notification.delivered = True
-            sms_notification.delivery_status = 'delivered'
-            sms_notification.save()
-            
+            sms.enqueue(transaction, phone_number, message, notification_type)
             return True
             
-        except Exception as e:
-            print(f"SMS sending failed: {e}")
+        except Exception:
+            logger.exception("SMS queueing failed")
             return False
 
+def close_transactions(queryset, status: str) -> int:
+    """Move matching transactions to ``status`` with one UPDATE and publish the change"""
+    from . import live
+    
+    with db_transaction.atomic():
+        transaction_ids = list(queryset.select_for_update().values_list('id', flat=True))
+        if not transaction_ids:
+            return 0
+        MobileMoneyTransaction.objects.filter(id__in=transaction_ids).update(
+            status=status, updated_at=timezone.now()
+        )
+        db_transaction.on_commit(lambda: live.publish_ids(transaction_ids))
+    return len(transaction_ids)
+
 class PaymentProcessor:
     """Handle payment processing and enrollment"""
     
@@ -197,7 +214,7 @@ class PaymentProcessor:
         
         # Get provider
         try:
-            provider = MobileMoneyProvider.objects.get(name=provider_name, is_active=True)
+            provider = config.get_provider(provider_name)
         except MobileMoneyProvider.DoesNotExist:
             raise ValueError(f"Provider {provider_name} not available")
         
@@ -225,49 +242,85 @@ class PaymentProcessor:
                        verification_method: str = 'manual', 
                        verified_by=None, notes: str = '') -> bool:
         """Confirm payment and create enrollment"""
-        
-        if transaction.status != 'pending':
-            return False
-        
-        # Update transaction status
-        transaction.status = 'confirmed'
-        transaction.confirmed_at = timezone.now()
-        transaction.save()
-        
-        # Create verification record
-        from .models import PaymentVerification
-        PaymentVerification.objects.create(
-            transaction=transaction,
-            method=verification_method,
+        confirmed = self.confirm_payments(
+            [transaction],
+            verification_method=verification_method,
             verified_by=verified_by,
-            is_successful=True,
-            notes=notes
+            notes={transaction.id: notes}
         )
+        return bool(confirmed)
+    
+    def confirm_payments(self, transactions, verification_method: str = 'manual', verified_by=None,
+                         notes: Optional[Dict] = None, verification_data: Optional[Dict] = None):
+        """
+        Confirm pending payments in bulk and return the ones confirmed.
         
-        # Create course enrollment
-        enrollment, created = Enrollment.objects.get_or_create(
-            user=transaction.user,
-            course=transaction.course,
-            defaults={
-                'amount_paid': transaction.amount,
-                'payment_status': 'completed',
-                'payment_method': 'mobile_money'
-            }
-        )
+        ``notes`` and ``verification_data`` are keyed by transaction id.
+        Payments that are no longer pending are skipped. Verifications,
+        enrollments, ledger entries and confirmation SMS are each written
+        with one INSERT.
+        """
+        from .models import PaymentVerification, SMSNotification
+        from .signals import payments_confirmed
         
-        # Send confirmation SMS
-        self.sms_service.send_payment_confirmation(transaction)
+        notes = notes or {}
+        verification_data = verification_data or {}
+        by_id = {transaction.id: transaction for transaction in transactions}
+        if not by_id:
+            return []
+        
+        now = timezone.now()
+        with db_transaction.atomic():
+            pending = MobileMoneyTransaction.objects.select_for_update().filter(id__in=list(by_id), status='pending')
+            pending_ids = set(pending.values_list('id', flat=True))
+            if not pending_ids:
+                return []
+            MobileMoneyTransaction.objects.filter(id__in=pending_ids).update(
+                status='confirmed', confirmed_at=now, updated_at=now
+            )
+            
+            confirmed = [transaction for transaction_id, transaction in by_id.items() if transaction_id in pending_ids]
+            for transaction in confirmed:
+                transaction.status = 'confirmed'
+                transaction.confirmed_at = now
+            
+            PaymentVerification.objects.bulk_create([
+                PaymentVerification(
+                    transaction=transaction,
+                    method=verification_method,
+                    verified_by=verified_by,
+                    is_successful=True,
+                    notes=notes.get(transaction.id, ''),
+                    verification_data=verification_data.get(transaction.id, {})
+                )
+                for transaction in confirmed
+            ])
+            create_paid_enrollments(confirmed)
+            ledger.record_sales('mobile_money', confirmed)
+            sms.enqueue_many([
+                SMSNotification(
+                    transaction=transaction,
+                    phone_number=transaction.phone_number,
+                    message=self.sms_service.payment_confirmed_message(transaction),
+                    notification_type='payment_confirmed'
+                )
+                for transaction in confirmed
+            ])
+            db_transaction.on_commit(
+                lambda: payments_confirmed.send(sender=MobileMoneyTransaction, transactions=confirmed)
+            )
         
-        return True
+        return confirmed
     
     def expire_pending_payments(self):
         """Mark expired payments as expired"""
+        now = timezone.now()
         expired_transactions = MobileMoneyTransaction.objects.filter(
             status='pending',
-            expires_at__lt=timezone.now()
+            expires_at__lt=now
         )
         
-        expired_count = expired_transactions.update(status='expired')
+        expired_count = close_transactions(expired_transactions, 'expired')
         return expired_count
 
 class PaymentStatusTracker:
@@ -276,56 +329,41 @@ class PaymentStatusTracker:
     @staticmethod
     def get_transaction_status(reference_code: str) -> Dict[str, Any]:
         """Get current status of a transaction"""
-        try:
-            transaction = MobileMoneyTransaction.objects.get(reference_code=reference_code)
-            
-            return {
-                'reference_code': transaction.reference_code,
-                'status': transaction.status,
-                'amount': float(transaction.amount),
-                'currency': transaction.currency,
-                'provider': transaction.provider.display_name,
-                'course_title': transaction.course.title,
-                'expires_at': transaction.expires_at.isoformat(),
-                'is_expired': transaction.is_expired,
-                'created_at': transaction.created_at.isoformat()
-            }
-            
-        except MobileMoneyTransaction.DoesNotExist:
+        from . import live
+        
+        entry = live.get_status(reference_code)
+        if entry is None:
             return {'error': 'Transaction not found'}
+        return live.current_status(entry)
     
     @staticmethod
     def update_from_sms(sms_content: str, sender_phone: str) -> bool:
         """Update transaction status from SMS confirmation"""
-        # This would parse SMS confirmations from mobile money providers
-        # Implementation depends on SMS format from each provider
+        # The webhook queues messages for inbound.py instead; this confirms
+        # a single message synchronously with the same parsers.
+        from .inbound import parse_sms
         
-        # Example SMS parsing logic
-        reference_match = re.search(r'Reference[:\s]+(\d{8})', sms_content, re.IGNORECASE)
-        if not reference_match:
+        parsed = parse_sms(sms_content, sender_phone)
+        if not parsed:
             return False
         
-        reference_code = reference_match.group(1)
-        
         try:
             transaction = MobileMoneyTransaction.objects.get(
-                reference_code=reference_code,
+                reference_code=parsed.reference_code,
                 status='pending'
             )
-            
-            # Check if SMS indicates successful payment
-            success_keywords = ['successful', 'confirmed', 'completed', 'received']
-            is_successful = any(keyword in sms_content.lower() for keyword in success_keywords)
-            
-            if is_successful:
-                processor = PaymentProcessor()
-                return processor.confirm_payment(
-                    transaction=transaction,
-                    verification_method='sms',
-                    notes=f"SMS confirmation: {sms_content[:100]}"
-                )
-            
         except MobileMoneyTransaction.DoesNotExist:
-            pass
+            return False
         
-        return False
+        # Same checks as inbound.process_batch
+        if parsed.amount is None or parsed.amount < transaction.amount:
+            return False
+        if parsed.provider != transaction.provider.name:
+            return False
+        
+        processor = PaymentProcessor()
+        return processor.confirm_payment(
+            transaction=transaction,
+            verification_method='sms',
+            notes=f"SMS confirmation: {sms_content[:100]}"
+        )
@@ -0,0 +1,47 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import config, deadlines, live
+from .models import MobileMoneyProvider, MobileMoneyTransaction, PaymentSettings
+
+logger = logging.getLogger(__name__)
+
+# Sent after commit with the ``transactions`` confirmed in bulk by
+# PaymentProcessor.confirm_payments, which bypasses post_save
+payments_confirmed = Signal()
+
+
+@receiver(post_save, sender=PaymentSettings)
+@receiver(post_delete, sender=PaymentSettings)
+@receiver(post_save, sender=MobileMoneyProvider)
+@receiver(post_delete, sender=MobileMoneyProvider)
+def payment_config_changed(sender, **kwargs):
+    transaction.on_commit(config.invalidate)
+
+
+def _schedule_deadlines(instance):
+    try:
+        deadlines.get_deadlines().schedule(instance)
+    except Exception:
+        # recover_payment_deadlines picks the transaction up later
+        logger.exception("Could not schedule deadlines for %s", instance.reference_code)
+
+
+@receiver(post_save, sender=MobileMoneyTransaction)
+def schedule_payment_deadlines(sender, instance, **kwargs):
+    if instance.status == 'pending':
+        transaction.on_commit(lambda: _schedule_deadlines(instance))
+
+
+@receiver(post_save, sender=MobileMoneyTransaction)
+def publish_payment_status(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: live.publish([instance]))
+
+
+@receiver(payments_confirmed)
+def publish_confirmed_payments(sender, transactions, **kwargs):
+    live.publish_ids([t.id for t in transactions])
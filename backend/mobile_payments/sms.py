@@ -0,0 +1,305 @@
+"""
+Outbound SMS dispatch.
+
+``SMSService`` only inserts SMSNotification rows with ``status='queued'``;
+the table is the durable queue. The ``dispatch_sms`` Celery task (scheduled,
+and kicked whenever messages are queued) claims due rows with
+``SELECT ... FOR UPDATE SKIP LOCKED``, groups them by gateway, takes tokens
+from each gateway's token bucket and sends what the bucket allows as one
+batch. Results are written back with a single ``bulk_update``:
+
+* accepted messages become ``sent`` (or ``delivered`` when the gateway
+  reports delivery synchronously, as the simulator does)
+* retryable failures are re-queued with exponential backoff until
+  ``MAX_ATTEMPTS``, then marked ``failed``
+* messages the bucket had no tokens for are re-queued for when it refills
+
+Claimed rows get ``next_attempt_at`` pushed ``CLAIM_TIMEOUT`` seconds ahead,
+so rows left in ``sending`` by a crashed worker are claimed again later.
+Delivery reports that arrive afterwards go through ``record_delivery_reports``.
+
+Gateways implement ``send_batch``; ``SimulatedGateway`` stands in for a real
+provider in development and load tests, with configurable latency and
+failure rate.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import SMSNotification
+
+logger = logging.getLogger(__name__)
+
+# Refill a bucket and take up to ARGV[3] tokens; returns the number granted
+TAKE_TOKENS_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local granted = math.min(wanted, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return granted
+"""
+
+UPDATE_FIELDS = [
+    'status', 'gateway', 'provider_message_id', 'attempts', 'next_attempt_at',
+    'last_error', 'sent_at', 'delivered', 'delivery_status',
+]
+
+
+def dispatch_settings():
+    return settings.SMS_DISPATCH
+
+
+@dataclass
+class SendResult:
+    status: str  # 'sent', 'delivered' or 'failed'
+    provider_message_id: str = ''
+    error: str = ''
+    retryable: bool = True
+
+
+class SMSGateway(ABC):
+    """Interface for SMS providers"""
+    name = ''
+    
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+    
+    @abstractmethod
+    def send_batch(self, messages):
+        """Send SMSNotification objects; return one SendResult per message, in order"""
+
+
+class SimulatedGateway(SMSGateway):
+    """Accepts everything after an optional delay, failing a configurable share"""
+    
+    def send_batch(self, messages):
+        latency = self.options.get('LATENCY_MS', 0)
+        if latency:
+            time.sleep(latency / 1000)
+        
+        failure_rate = self.options.get('FAILURE_RATE', 0)
+        results = []
+        for message in messages:
+            if failure_rate and random.random() < failure_rate:
+                results.append(SendResult('failed', error='Simulated gateway failure'))
+            else:
+                results.append(SendResult('delivered', provider_message_id=f'sim-{uuid.uuid4().hex}'))
+        return results
+
+
+class MemoryTokenBucket:
+    """Per-process token bucket, for development and tests"""
+    
+    def __init__(self, options):
+        self.state = {}
+        self.lock = threading.Lock()
+    
+    def take(self, name, rate, burst, wanted):
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.state.get(name, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            granted = min(wanted, int(tokens))
+            self.state[name] = (tokens - granted, now)
+            return granted
+
+
+class RedisTokenBucket:
+    """Token bucket shared by every worker"""
+    
+    def __init__(self, options):
+        import redis
+        
+        self.client = redis.Redis.from_url(options['REDIS_URL'])
+        self.take_tokens = self.client.register_script(TAKE_TOKENS_SCRIPT)
+    
+    def take(self, name, rate, burst, wanted):
+        return int(self.take_tokens(keys=[f'sms:bucket:{name}'], args=[rate, burst, wanted, time.time()]))
+
+
+RATE_LIMITERS = {
+    'redis': RedisTokenBucket,
+    'memory': MemoryTokenBucket,
+}
+
+_gateways = {}
+_rate_limiter = None
+_lock = threading.Lock()
+
+
+def get_gateway(name):
+    with _lock:
+        if name not in _gateways:
+            options = dispatch_settings()['GATEWAYS'][name]
+            _gateways[name] = import_string(options['CLASS'])(name, options)
+    return _gateways[name]
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    with _lock:
+        if _rate_limiter is None:
+            options = dispatch_settings()
+            _rate_limiter = RATE_LIMITERS[options['RATE_LIMITER']](options)
+    return _rate_limiter
+
+
+def enqueue(transaction_obj, phone_number, message, notification_type):
+    """Queue an SMS; it is sent by the dispatch worker once the caller commits"""
+    sms = SMSNotification.objects.create(
+        transaction=transaction_obj,
+        phone_number=phone_number,
+        message=message,
+        notification_type=notification_type,
+        gateway=dispatch_settings()['GATEWAY'],
+    )
+    
+    from .tasks import dispatch_sms
+    transaction.on_commit(dispatch_sms.delay)
+    return sms
+
+
+def enqueue_many(messages):
+    """Queue unsaved SMSNotification objects with one INSERT"""
+    gateway = dispatch_settings()['GATEWAY']
+    for sms in messages:
+        sms.gateway = gateway
+    SMSNotification.objects.bulk_create(messages)
+    
+    from .tasks import dispatch_sms
+    transaction.on_commit(dispatch_sms.delay)
+    return messages
+
+
+def claim_batch(batch_size):
+    """Lock and mark 'sending' up to ``batch_size`` due messages"""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            SMSNotification.objects.select_for_update(skip_locked=True).filter(
+                status__in=['queued', 'sending'],
+                next_attempt_at__lte=now,
+            ).order_by('next_attempt_at')[:batch_size]
+        )
+        claimed_until = now + timedelta(seconds=dispatch_settings()['CLAIM_TIMEOUT'])
+        for sms in batch:
+            sms.status = 'sending'
+            sms.next_attempt_at = claimed_until
+        SMSNotification.objects.bulk_update(batch, ['status', 'next_attempt_at'])
+    return batch
+
+
+def backoff(attempts):
+    options = dispatch_settings()
+    return timedelta(seconds=min(options['RETRY_BACKOFF_SECONDS'] * 2 ** (attempts - 1), options['RETRY_BACKOFF_MAX_SECONDS']))
+
+
+def apply_result(sms, result, now):
+    sms.attempts += 1
+    if result.status in ('sent', 'delivered'):
+        sms.status = result.status
+        sms.provider_message_id = result.provider_message_id
+        sms.sent_at = now
+        sms.last_error = ''
+        sms.delivered = result.status == 'delivered'
+        sms.delivery_status = result.status
+        return
+    
+    sms.last_error = result.error
+    if result.retryable and sms.attempts < dispatch_settings()['MAX_ATTEMPTS']:
+        sms.status = 'queued'
+        sms.next_attempt_at = now + backoff(sms.attempts)
+    else:
+        sms.status = 'failed'
+        sms.delivery_status = 'failed'
+
+
+def send_gateway_batch(gateway_name, messages):
+    """Send what the gateway's bucket allows; returns (sent, deferred)"""
+    options = dispatch_settings()['GATEWAYS'][gateway_name]
+    granted = get_rate_limiter().take(gateway_name, options['RATE'], options['BURST'], len(messages))
+    sending, deferred = messages[:granted], messages[granted:]
+    
+    now = timezone.now()
+    if sending:
+        try:
+            results = get_gateway(gateway_name).send_batch(sending)
+        except Exception as e:
+            logger.warning('SMS gateway %s failed a batch of %d', gateway_name, len(sending), exc_info=True)
+            results = [SendResult('failed', error=str(e))] * len(sending)
+        for sms, result in zip(sending, results):
+            apply_result(sms, result, now)
+    
+    # Retry once the bucket has refilled enough for the first deferred message
+    retry_at = now + timedelta(seconds=1 / options['RATE'])
+    for sms in deferred:
+        sms.status = 'queued'
+        sms.next_attempt_at = retry_at
+    return len(sending), len(deferred)
+
+
+def dispatch_batch():
+    """Claim and send one batch; returns (claimed, sent, deferred)"""
+    batch = claim_batch(dispatch_settings()['BATCH_SIZE'])
+    if not batch:
+        return 0, 0, 0
+    
+    by_gateway = defaultdict(list)
+    for sms in batch:
+        by_gateway[sms.gateway or dispatch_settings()['GATEWAY']].append(sms)
+    
+    sent = deferred = 0
+    for gateway_name, messages in by_gateway.items():
+        for sms in messages:
+            sms.gateway = gateway_name
+        gateway_sent, gateway_deferred = send_gateway_batch(gateway_name, messages)
+        sent += gateway_sent
+        deferred += gateway_deferred
+    
+    SMSNotification.objects.bulk_update(batch, UPDATE_FIELDS)
+    return len(batch), sent, deferred
+
+
+def dispatch_pending(max_seconds=None):
+    """Send due messages batch by batch until none are left or the time is up"""
+    max_seconds = max_seconds or dispatch_settings()['MAX_RUN_SECONDS']
+    deadline = time.monotonic() + max_seconds
+    total_sent = 0
+    while time.monotonic() < deadline:
+        claimed, sent, deferred = dispatch_batch()
+        total_sent += sent
+        if not claimed or not sent:
+            break
+    return total_sent
+
+
+def record_delivery_reports(reports):
+    """Apply ``{provider_message_id: delivered?}`` delivery reports in bulk"""
+    messages = list(SMSNotification.objects.filter(provider_message_id__in=list(reports)))
+    for sms in messages:
+        delivered = reports[sms.provider_message_id]
+        sms.delivered = delivered
+        sms.status = 'delivered' if delivered else 'failed'
+        sms.delivery_status = sms.status
+    SMSNotification.objects.bulk_update(messages, ['delivered', 'status', 'delivery_status'])
+    return len(messages)
@@ -0,0 +1,30 @@
+from celery import shared_task
+
+from . import deadlines, inbound, sms
+from .services import PaymentProcessor
+
+
+@shared_task(ignore_result=True)
+def dispatch_sms():
+    """Send queued SMS notifications in rate-limited batches"""
+    return sms.dispatch_pending()
+
+
+@shared_task(ignore_result=True)
+def process_inbound_sms():
+    """Confirm payments from received confirmation SMS in batches"""
+    return inbound.process_pending()
+
+
+@shared_task(ignore_result=True)
+def process_payment_deadlines():
+    """Send due payment reminders and expire overdue payments"""
+    return deadlines.process_due()
+
+
+@shared_task(ignore_result=True)
+def recover_payment_deadlines():
+    """Reschedule pending payments and sweep any expiry that was missed"""
+    scheduled = deadlines.get_deadlines().recover()
+    expired = PaymentProcessor().expire_pending_payments()
+    return scheduled, expired
@@ -0,0 +1,133 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from courses.models import Category, Course, Enrollment
+from mobile_payments import config
+from mobile_payments.models import MobileMoneyProvider, MobileMoneyTransaction, PaymentVerification, SMSNotification
+from mobile_payments.services import PaymentProcessor
+from mobile_payments.signals import payments_confirmed
+from payments.models import LedgerEntry
+
+User = get_user_model()
+
+
+@override_settings(REVENUE_LEDGER={'PLATFORM_FEE_PERCENT': '30'})
+class ConfirmPaymentsTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user(
+            email='instructor@example.com', username='instructor', password='x', user_type='instructor'
+        )
+        category = Category.objects.create(name='Data', slug='data')
+        cls.course = Course.objects.create(
+            title='SQL', description='d', instructor=cls.instructor, category=category, price=Decimal('50.00')
+        )
+        cls.provider = MobileMoneyProvider.objects.create(
+            name='airtel', display_name='Airtel Money', ussd_code='*778#', instructions='Pay', phone_prefixes=['097']
+        )
+    
+    def setUp(self):
+        config.invalidate()
+        for target in ('mobile_payments.tasks.dispatch_sms.delay', 'mobile_payments.live.publish_ids'):
+            patcher = mock.patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def transaction(self, number, status='pending'):
+        student = User.objects.create_user(
+            email=f'student{number}@example.com', username=f'student{number}', password='x'
+        )
+        return MobileMoneyTransaction.objects.create(
+            user=student, course=self.course, provider=self.provider, phone_number='0971234567',
+            amount=Decimal('50.00'), reference_code=f'10000000{number}', status=status,
+            expires_at=timezone.now() + timedelta(minutes=30),
+        )
+    
+    def test_confirms_pending_payments(self):
+        transactions = [self.transaction(1), self.transaction(2)]
+        
+        confirmed = PaymentProcessor().confirm_payments(
+            transactions, verification_method='statement',
+            notes={transactions[0].id: 'Line 2'}, verification_data={transactions[0].id: {'line': 2}},
+        )
+        
+        self.assertEqual({t.id for t in confirmed}, {t.id for t in transactions})
+        for transaction in transactions:
+            transaction.refresh_from_db()
+            self.assertEqual(transaction.status, 'confirmed')
+            self.assertIsNotNone(transaction.confirmed_at)
+            self.assertTrue(Enrollment.objects.filter(user=transaction.user, course=self.course).exists())
+        verification = PaymentVerification.objects.get(transaction=transactions[0])
+        self.assertEqual(
+            (verification.method, verification.is_successful, verification.notes, verification.verification_data),
+            ('statement', True, 'Line 2', {'line': 2}),
+        )
+        self.assertEqual(SMSNotification.objects.filter(notification_type='payment_confirmed').count(), 2)
+        self.assertEqual(LedgerEntry.objects.filter(source='mobile_money', entry_type='sale').count(), 2)
+    
+    def test_skips_payments_that_are_no_longer_pending(self):
+        pending = self.transaction(1)
+        expired = self.transaction(2, status='expired')
+        
+        confirmed = PaymentProcessor().confirm_payments([pending, expired])
+        
+        self.assertEqual([t.id for t in confirmed], [pending.id])
+        expired.refresh_from_db()
+        self.assertEqual(expired.status, 'expired')
+        self.assertFalse(PaymentVerification.objects.filter(transaction=expired).exists())
+    
+    def test_confirming_twice_does_nothing_the_second_time(self):
+        transaction = self.transaction(1)
+        PaymentProcessor().confirm_payments([transaction])
+        
+        self.assertEqual(PaymentProcessor().confirm_payments([transaction]), [])
+        self.assertEqual(PaymentVerification.objects.count(), 1)
+        self.assertEqual(Enrollment.objects.count(), 1)
+        self.assertEqual(SMSNotification.objects.count(), 1)
+    
+    def test_nothing_to_confirm(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(PaymentProcessor().confirm_payments([]), [])
+    
+    def test_query_count_does_not_grow_with_the_batch(self):
+        processor = PaymentProcessor()
+        processor.confirm_payments([self.transaction(0)])  # warm the config snapshot
+        one = [self.transaction(1)]
+        many = [self.transaction(number) for number in range(2, 7)]
+        
+        with CaptureQueriesContext(connection) as single:
+            processor.confirm_payments(one)
+        with CaptureQueriesContext(connection) as batch:
+            processor.confirm_payments(many)
+        self.assertEqual(len(batch), len(single))
+    
+    def test_payments_confirmed_is_sent_after_commit(self):
+        transaction = self.transaction(1)
+        received = []
+        
+        def receiver(sender, transactions, **kwargs):
+            received.extend(transactions)
+        
+        payments_confirmed.connect(receiver)
+        self.addCleanup(payments_confirmed.disconnect, receiver)
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentProcessor().confirm_payments([transaction])
+            self.assertEqual(received, [])
+        
+        self.assertEqual([t.id for t in received], [transaction.id])
+    
+    def test_confirm_payment_reports_whether_it_confirmed(self):
+        transaction = self.transaction(1)
+        processor = PaymentProcessor()
+        
+        self.assertTrue(processor.confirm_payment(transaction, notes='Checked by hand'))
+        self.assertFalse(processor.confirm_payment(transaction))
+        self.assertEqual(PaymentVerification.objects.get().notes, 'Checked by hand')
@@ -0,0 +1,114 @@
+import hashlib
+from unittest import mock
+
+from django.db import transaction
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from mobile_payments import reference_codes
+from mobile_payments.models import ReferenceSequence
+
+KEY = b'k' * 32
+
+
+class PermutationTests(SimpleTestCase):
+    
+    def test_permute_is_one_to_one(self):
+        # The same network over 10^2 x 10^2 can be checked exhaustively
+        with mock.patch.object(reference_codes, 'HALF', 100):
+            values = [reference_codes.permute(value, KEY) for value in range(100 * 100)]
+        self.assertEqual(sorted(values), list(range(100 * 100)))
+    
+    def test_permute_stays_in_range_without_repeats(self):
+        values = [reference_codes.permute(value, KEY) for value in range(20000)]
+        
+        self.assertEqual(len(set(values)), len(values))
+        self.assertTrue(all(0 <= value < reference_codes.SPACE for value in values))
+    
+    def test_permute_depends_on_the_key(self):
+        other = [reference_codes.permute(value, b'x' * 32) for value in range(100)]
+        
+        self.assertNotEqual([reference_codes.permute(value, KEY) for value in range(100)], other)
+    
+    def test_consecutive_values_are_not_consecutive_codes(self):
+        first, second = reference_codes.permute(0, KEY), reference_codes.permute(1, KEY)
+        
+        self.assertNotEqual(abs(first - second), 1)
+
+
+class LuhnTests(SimpleTestCase):
+    
+    def test_luhn_digit(self):
+        self.assertEqual(reference_codes.luhn_digit('7992739871'), '3')
+        self.assertEqual(reference_codes.luhn_digit('00000000'), '0')
+    
+    def test_encoded_codes_are_plausible(self):
+        for value in range(500):
+            code = reference_codes.encode(value, KEY)
+            self.assertEqual(len(code), 9)
+            self.assertTrue(reference_codes.is_plausible(code), code)
+    
+    def test_mistyped_digit_is_caught(self):
+        code = reference_codes.encode(42, KEY)
+        for position in range(len(code)):
+            digit = str((int(code[position]) + 1) % 10)
+            self.assertFalse(reference_codes.is_plausible(code[:position] + digit + code[position + 1:]))
+    
+    def test_adjacent_swap_is_caught(self):
+        for value in range(200):
+            code = reference_codes.encode(value, KEY)
+            for position in range(len(code) - 1):
+                a, b = code[position], code[position + 1]
+                # 0 and 9 swapped is the one transposition Luhn cannot see
+                if a == b or {a, b} == {'0', '9'}:
+                    continue
+                swapped = code[:position] + b + a + code[position + 2:]
+                self.assertFalse(reference_codes.is_plausible(swapped), swapped)
+    
+    def test_legacy_and_malformed_codes(self):
+        self.assertTrue(reference_codes.is_plausible('12345678'))
+        self.assertFalse(reference_codes.is_plausible('1234567'))
+        self.assertFalse(reference_codes.is_plausible('12345678901'))
+        self.assertFalse(reference_codes.is_plausible('abcdefghi'))
+
+
+@override_settings(REFERENCE_CODES={'BLOCK_SIZE': 3, 'PERMUTATION_KEY': 'test'})
+class AllocatorTests(SimpleTestCase):
+    
+    def test_codes_come_from_reserved_blocks(self):
+        allocator = reference_codes.Allocator()
+        with mock.patch.object(reference_codes, 'reserve_block', side_effect=[0, 30]) as reserve_block:
+            codes = [allocator.take() for _ in range(5)]
+        
+        self.assertEqual(reserve_block.call_count, 2)
+        key = hashlib.blake2b(b'test', digest_size=32).digest()
+        self.assertEqual(codes, [reference_codes.encode(value, key) for value in (0, 1, 2, 30, 31)])
+    
+    def test_forked_process_reserves_its_own_block(self):
+        allocator = reference_codes.Allocator()
+        with mock.patch.object(reference_codes, 'reserve_block', side_effect=[0, 30]) as reserve_block:
+            allocator.take()
+            allocator.pid = -1
+            allocator.take()
+        
+        self.assertEqual(reserve_block.call_count, 2)
+
+
+class ReserveBlockTests(TransactionTestCase):
+    
+    def test_blocks_follow_each_other(self):
+        self.assertEqual(reference_codes.reserve_block(10), 0)
+        self.assertEqual(reference_codes.reserve_block(5), 10)
+        self.assertEqual(ReferenceSequence.objects.get().next_value, 15)
+    
+    def test_block_survives_a_rolled_back_caller(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            reference_codes.reserve_block(10)
+            raise RuntimeError
+        
+        self.assertEqual(reference_codes.reserve_block(10), 10)
+    
+    def test_exhausted_space_raises(self):
+        ReferenceSequence.objects.create(name=reference_codes.SEQUENCE_NAME, next_value=reference_codes.SPACE - 1)
+        
+        with self.assertRaises(reference_codes.ReferenceCodesExhausted):
+            reference_codes.reserve_block(2)
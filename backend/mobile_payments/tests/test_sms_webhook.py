@@ -0,0 +1,40 @@
+import json
+
+from django.test import TestCase, override_settings
+
+from mobile_payments.models import InboundSMS
+
+URL = '/api/mobile-payments/webhook/sms/'
+
+
+@override_settings(SMS_INBOUND={'BATCH_SIZE': 200, 'MAX_WEBHOOK_MESSAGES': 3, 'MAX_ATTEMPTS': 5, 'MAX_RUN_SECONDS': 60})
+class SMSWebhookTests(TestCase):
+    
+    def post(self, data):
+        return self.client.post(URL, json.dumps(data), content_type='application/json')
+    
+    def message(self, number):
+        return {'id': f'm{number}', 'from': 'AirtelMoney', 'message': f'Payment {number} received'}
+    
+    def test_accepts_a_batch(self):
+        response = self.post({'messages': [self.message(n) for n in range(3)]})
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(InboundSMS.objects.count(), 3)
+    
+    def test_accepts_a_single_message(self):
+        self.assertEqual(self.post(self.message(1)).status_code, 202)
+    
+    def test_rejects_a_batch_over_the_limit(self):
+        response = self.post({'messages': [self.message(n) for n in range(4)]})
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(InboundSMS.objects.exists())
+    
+    def test_rejects_messages_that_are_not_a_list(self):
+        for messages in ('text', {'message': 'x'}, 5, []):
+            with self.subTest(messages=messages):
+                self.assertEqual(self.post({'messages': messages}).status_code, 400)
+    
+    def test_rejects_items_that_are_not_objects(self):
+        self.assertEqual(self.post({'messages': ['text']}).status_code, 400)
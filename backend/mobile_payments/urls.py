@@ -14,6 +14,7 @@ urlpatterns = [
     # Payment flow endpoints
     path('initiate/', views.initiate_payment, name='initiate-payment'),
     path('status/<str:reference_code>/', views.payment_status, name='payment-status'),
+    path('status/<str:reference_code>/wait/', views.wait_payment_status, name='payment-status-wait'),
     path('cancel/<str:reference_code>/', views.cancel_payment, name='cancel-payment'),
     path('instructions/<str:reference_code>/', views.payment_instructions, name='payment-instructions'),
     
@@ -1,13 +1,19 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.request import Request
+from rest_framework.views import APIView
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from django.utils.decorators import method_decorator
 import json
 
-from .models import MobileMoneyTransaction, MobileMoneyProvider
+from . import inbound, live
+from .config import active_providers
+from .models import MobileMoneyTransaction
 from .serializers import (
     MobileMoneyTransactionSerializer, 
     PaymentInitiationSerializer,
@@ -16,24 +22,34 @@ from .serializers import (
 from .services import (
     PaymentProcessor, 
     USSDInstructionGenerator, 
-    PaymentStatusTracker,
     PhoneNumberValidator
 )
 from courses.models import Course
+from learnhub.pagination import KeysetPagination
 
 class MobileMoneyProviderListView(generics.ListAPIView):
     """List available mobile money providers"""
-    queryset = MobileMoneyProvider.objects.filter(is_active=True)
     serializer_class = MobileMoneyProviderSerializer
     permission_classes = [permissions.AllowAny]
+    
+    def list(self, request, *args, **kwargs):
+        # Served from the in-process configuration cache, see config.py
+        providers = active_providers()
+        page = self.paginate_queryset(providers)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(providers, many=True).data)
 
 class MobileMoneyTransactionListView(generics.ListAPIView):
     """List user's mobile money transactions"""
     serializer_class = MobileMoneyTransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        return MobileMoneyTransaction.objects.filter(user=self.request.user)
+        return MobileMoneyTransaction.objects.filter(
+            user=self.request.user
+        ).select_related('user', 'course', 'provider')
 
 class MobileMoneyTransactionDetailView(generics.RetrieveAPIView):
     """Get transaction details"""
@@ -109,12 +125,49 @@ def initiate_payment(request):
 @permission_classes([permissions.IsAuthenticated])
 def payment_status(request, reference_code):
     """Get payment status"""
-    transaction_status = PaymentStatusTracker.get_transaction_status(reference_code)
+    entry = live.get_status(reference_code)
+    
+    if entry is None or entry['user_id'] != str(request.user.pk):
+        return Response({'error': 'Transaction not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(live.current_status(entry))
+
+def _authenticated_user(request):
+    """Authenticate a plain Django request with the API's authentication classes"""
+    user = Request(request, authenticators=APIView().get_authenticators()).user
+    return user if user.is_authenticated else None
+
+async def wait_payment_status(request, reference_code):
+    """
+    Long-poll fallback for the payment status websocket.
+    
+    Returns as soon as the status differs from ``?status=`` (the last one the
+    client saw), or after ``?timeout=`` seconds with the unchanged status.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
     
-    if 'error' in transaction_status:
-        return Response(transaction_status, status=status.HTTP_404_NOT_FOUND)
+    user = await sync_to_async(_authenticated_user)(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
     
-    return Response(transaction_status)
+    entry = await sync_to_async(live.get_status)(reference_code)
+    if entry is None or entry['user_id'] != str(user.pk):
+        return JsonResponse({'error': 'Transaction not found'}, status=404)
+    
+    current = live.current_status(entry)
+    known_status = request.GET.get('status')
+    if known_status != current['status'] or current['status'] not in live.OPEN_STATUSES:
+        return JsonResponse(current)
+    
+    max_wait = live.push_settings()['MAX_WAIT_SECONDS']
+    try:
+        timeout = min(max(float(request.GET.get('timeout', max_wait)), 0), max_wait)
+    except ValueError:
+        timeout = max_wait
+    
+    changed = await live.wait_for_change(reference_code, known_status, timeout)
+    return JsonResponse(changed or current)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -166,24 +219,41 @@ def validate_phone_number(request):
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def sms_webhook(request):
-    """Handle SMS confirmations from mobile money providers"""
+    """Accept SMS confirmations from mobile money providers for processing"""
     try:
-        # Parse webhook data (format depends on SMS provider)
+        # A single message, or a batch under 'messages'
         data = json.loads(request.body) if request.body else request.POST
+        if 'messages' not in data:
+            payload = [data]
+        else:
+            payload = data['messages']
+            if not isinstance(payload, list) or not payload:
+                return JsonResponse({'error': 'messages must be a non-empty list'}, status=400)
+            max_messages = settings.SMS_INBOUND['MAX_WEBHOOK_MESSAGES']
+            if len(payload) > max_messages:
+                return JsonResponse({'error': f'At most {max_messages} messages per request'}, status=400)
         
-        sms_content = data.get('message', '')
-        sender_phone = data.get('from', '')
-        
-        if not sms_content:
-            return JsonResponse({'error': 'No message content'}, status=400)
+        messages = []
+        for item in payload:
+            if not isinstance(item, dict):
+                return JsonResponse({'error': 'Each message must be an object'}, status=400)
+            sms_content = item.get('message') or item.get('text', '')
+            if not sms_content:
+                return JsonResponse({'error': 'No message content'}, status=400)
+            messages.append({
+                'id': item.get('id') or item.get('message_id', ''),
+                'from': item.get('from', ''),
+                'message': sms_content,
+                'provider': item.get('provider', ''),
+            })
         
-        # Update transaction status from SMS
-        success = PaymentStatusTracker.update_from_sms(sms_content, sender_phone)
+        accepted = inbound.accept(messages)
         
         return JsonResponse({
-            'success': success,
-            'message': 'SMS processed successfully' if success else 'No matching transaction found'
-        })
+            'success': True,
+            'accepted': accepted,
+            'message': 'SMS queued for processing'
+        }, status=202)
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
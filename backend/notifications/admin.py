@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Notification, NotificationPreference, Announcement
+from .models import Notification, NotificationBroadcast, NotificationPreference, Announcement
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
@@ -8,6 +8,16 @@ class NotificationAdmin(admin.ModelAdmin):
     search_fields = ('title', 'recipient__email', 'message')
     readonly_fields = ('id', 'created_at')
 
+@admin.register(NotificationBroadcast)
+class NotificationBroadcastAdmin(admin.ModelAdmin):
+    list_display = ('title', 'notification_type', 'status', 'sent_count', 'total_recipients', 'created_at')
+    list_filter = ('status', 'notification_type', 'created_at')
+    search_fields = ('title', 'message')
+    readonly_fields = (
+        'id', 'status', 'total_recipients', 'sent_count', 'last_recipient_id',
+        'error_message', 'created_at', 'updated_at', 'started_at', 'completed_at',
+    )
+
 @admin.register(NotificationPreference)
 class NotificationPreferenceAdmin(admin.ModelAdmin):
     list_display = ('user', 'email_notifications', 'push_notifications', 'course_updates')
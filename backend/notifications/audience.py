@@ -0,0 +1,98 @@
+"""
+Cached announcement audiences.
+
+Instead of joining ``target_users`` and scanning ``target_user_types`` with a
+DISTINCT for every request, the currently visible announcements are resolved
+once into a cached index:
+
+* ``everyone`` - announcements without target users, shown to all users
+* ``by_user_type`` - targeted announcements listed for a user type
+* ``by_user`` - targeted announcements listed for individual users
+
+Listing is then a cache read plus a membership check. The index expires at
+the next ``start_date``/``end_date`` boundary (or ``MAX_AGE`` seconds) and is
+dropped whenever an announcement or its target users change.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Announcement
+from .serializers import AnnouncementSerializer
+
+CACHE_KEY = 'notifications:announcement-audience'
+
+
+def build_index(now=None):
+    now = now or timezone.now()
+    announcements = list(
+        Announcement.objects.filter(is_active=True).filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=now)
+        ).select_related('created_by').prefetch_related('target_users')
+    )
+    
+    expires_at = now + timedelta(seconds=settings.ANNOUNCEMENT_AUDIENCE_CACHE['MAX_AGE'])
+    everyone, by_user_type, by_user = [], defaultdict(list), defaultdict(list)
+    visible = []
+    for announcement in announcements:
+        if announcement.start_date > now:
+            expires_at = min(expires_at, announcement.start_date)
+            continue
+        if announcement.end_date:
+            # end_date is inclusive, so drop it just after
+            expires_at = min(expires_at, announcement.end_date + timedelta(microseconds=1))
+        
+        visible.append(announcement)
+        key = str(announcement.id)
+        target_users = announcement.target_users.all()
+        if not target_users:
+            everyone.append(key)
+            continue
+        for user in target_users:
+            by_user[str(user.id)].append(key)
+        for user_type in announcement.target_user_types:
+            by_user_type[user_type].append(key)
+    
+    return {
+        # Serialized in Announcement.Meta.ordering
+        'announcements': [serialize(a) for a in visible],
+        'everyone': everyone,
+        'by_user_type': dict(by_user_type),
+        'by_user': dict(by_user),
+        'expires_at': expires_at,
+    }
+
+
+def serialize(announcement):
+    # Readers only see announcements meant for them; who else is targeted
+    # stays out of the payload (and the cache)
+    data = AnnouncementSerializer(announcement).data
+    data.pop('target_users', None)
+    return data
+
+
+def get_index():
+    index = cache.get(CACHE_KEY)
+    if index is None:
+        index = build_index()
+        timeout = (index['expires_at'] - timezone.now()).total_seconds()
+        if timeout > 0:
+            cache.set(CACHE_KEY, index, timeout)
+    return index
+
+
+def announcements_for(user):
+    """Serialized announcements visible to ``user``, in display order"""
+    index = get_index()
+    visible = set(index['everyone'])
+    visible.update(index['by_user_type'].get(user.user_type, ()))
+    visible.update(index['by_user'].get(str(user.id), ()))
+    return [data for data in index['announcements'] if data['id'] in visible]
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
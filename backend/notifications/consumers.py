@@ -10,6 +10,12 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         self.user_id = self.scope['url_route']['kwargs']['user_id']
         self.room_group_name = f'notifications_{self.user_id}'
         
+        # Only the recipient may listen to their notification group
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated or str(user.pk) != self.user_id:
+            await self.close()
+            return
+        
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -17,6 +23,13 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
+        
+        # Current unread count; later changes arrive as unread_count events
+        await self.send(text_data=json.dumps({
+            'type': 'unread_count',
+            'unread_count': await self.get_unread_count(),
+            'delta': 0,
+        }))
     
     async def disconnect(self, close_code):
         # Leave room group
@@ -29,7 +42,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         text_data_json = json.loads(text_data)
         message_type = text_data_json.get('type')
         
-        if message_type == 'mark_read':
+        if message_type == 'mark_read' and self.scope['user'].is_authenticated:
             notification_id = text_data_json.get('notification_id')
             await self.mark_notification_read(notification_id)
     
@@ -40,16 +53,26 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'notification': event['notification']
         }))
     
+    async def unread_count(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'unread_count',
+            'unread_count': event['unread_count'],
+            'delta': event['delta'],
+        }))
+    
+    @database_sync_to_async
+    def get_unread_count(self):
+        from .unread import get_counters
+        return get_counters().get(self.scope['user'].pk)
+    
     @database_sync_to_async
     def mark_notification_read(self, notification_id):
         from .models import Notification
-        try:
-            notification = Notification.objects.get(
-                id=notification_id,
-                recipient_id=self.user_id
-            )
-            notification.is_read = True
-            notification.save()
-            return True
-        except Notification.DoesNotExist:
+        from .unread import mark_read
+        # Scoped to the authenticated user, never the id in the URL
+        user_id = self.scope['user'].pk
+        notifications = Notification.objects.filter(id=notification_id, recipient_id=user_id)
+        if not notifications.exists():
             return False
+        mark_read(notifications, user_id)
+        return True
@@ -0,0 +1,155 @@
+"""
+Fan-out of one notification to a large audience.
+
+``send_notification`` only records a NotificationBroadcast; the
+``fan_out_broadcast`` Celery task then walks the matching users in id order,
+``CHUNK_SIZE`` at a time. Each chunk's Notification rows are written with one
+``bulk_create`` in the same transaction that advances the broadcast's
+``last_recipient_id`` cursor, so a crashed or retried task resumes where the
+last committed chunk ended without duplicating rows. After each commit the
+chunk's unread counters are bumped and the notifications are pushed to the
+recipients' ``notifications_<user_id>`` channel groups in one concurrent
+batch of ``group_send`` calls.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Notification, NotificationBroadcast
+from .realtime import send_to_users
+from .unread import get_counters
+
+User = get_user_model()
+
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+def fanout_settings():
+    return settings.NOTIFICATION_FANOUT
+
+
+def resolve_recipients(broadcast):
+    """Ids of active users in the broadcast's audience, in id order"""
+    audience = Q()
+    if broadcast.recipient_ids:
+        audience |= Q(id__in=broadcast.recipient_ids)
+    if broadcast.user_types:
+        audience |= Q(user_type__in=broadcast.user_types)
+    if broadcast.school_ids:
+        audience |= Q(student_profile__current_school_id__in=broadcast.school_ids)
+        audience |= Q(teacher_profile__current_school_id__in=broadcast.school_ids)
+    if broadcast.province_ids:
+        audience |= Q(student_profile__current_school__district__province_id__in=broadcast.province_ids)
+        audience |= Q(teacher_profile__current_school__district__province_id__in=broadcast.province_ids)
+    
+    if not audience:
+        return User.objects.none().values_list('id', flat=True)
+    return User.objects.filter(audience, is_active=True).order_by('id').values_list('id', flat=True)
+
+
+def notification_payload(notification):
+    """The realtime message NotificationConsumer forwards to the browser"""
+    return {
+        'id': str(notification.id),
+        'notification_type': notification.notification_type,
+        'title': notification.title,
+        'message': notification.message,
+        'course': str(notification.course_id) if notification.course_id else None,
+        'action_url': notification.action_url,
+        'metadata': notification.metadata,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def push_notifications(notifications):
+    """Send each notification to its recipient's channel group in one batch"""
+    send_to_users([
+        (notification.recipient_id, {
+            'type': 'notification_message',
+            'notification': notification_payload(notification),
+        })
+        for notification in notifications
+    ])
+
+
+def start_broadcast(broadcast_id):
+    with transaction.atomic():
+        broadcast = NotificationBroadcast.objects.select_for_update().get(pk=broadcast_id)
+        if broadcast.status == 'pending':
+            broadcast.status = 'running'
+            broadcast.started_at = timezone.now()
+            broadcast.total_recipients = resolve_recipients(broadcast).count()
+            broadcast.save(update_fields=['status', 'started_at', 'total_recipients', 'updated_at'])
+    return broadcast
+
+
+def process_chunk(broadcast_id):
+    """
+    Write notifications for the next chunk of recipients.
+    
+    Returns the broadcast and the notifications written, which is empty once
+    the broadcast is finished.
+    """
+    with transaction.atomic():
+        broadcast = NotificationBroadcast.objects.select_for_update().get(pk=broadcast_id)
+        if broadcast.status in FINISHED_STATUSES:
+            return broadcast, []
+        
+        recipients = resolve_recipients(broadcast)
+        if broadcast.last_recipient_id:
+            recipients = recipients.filter(id__gt=broadcast.last_recipient_id)
+        recipient_ids = list(recipients[:fanout_settings()['CHUNK_SIZE']])
+        
+        if not recipient_ids:
+            broadcast.status = 'completed'
+            broadcast.completed_at = timezone.now()
+            broadcast.save(update_fields=['status', 'completed_at', 'updated_at'])
+            return broadcast, []
+        
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                recipient_id=recipient_id,
+                sender_id=broadcast.sender_id,
+                notification_type=broadcast.notification_type,
+                title=broadcast.title,
+                message=broadcast.message,
+                course_id=broadcast.course_id,
+                action_url=broadcast.action_url,
+                metadata=broadcast.metadata,
+                broadcast=broadcast,
+            )
+            for recipient_id in recipient_ids
+        ])
+        
+        broadcast.last_recipient_id = recipient_ids[-1]
+        broadcast.sent_count += len(notifications)
+        broadcast.save(update_fields=['last_recipient_id', 'sent_count', 'updated_at'])
+    return broadcast, notifications
+
+
+def run_broadcast(broadcast_id):
+    """Fan a broadcast out to the end, resuming from its cursor"""
+    broadcast = start_broadcast(broadcast_id)
+    while broadcast.status not in FINISHED_STATUSES:
+        broadcast, notifications = process_chunk(broadcast_id)
+        get_counters().adjust_many(Counter(n.recipient_id for n in notifications))
+        push_notifications(notifications)
+    return broadcast
+
+
+def mark_failed(broadcast_id, error):
+    NotificationBroadcast.objects.filter(pk=broadcast_id).exclude(status='completed').update(
+        status='failed', error_message=str(error), updated_at=timezone.now()
+    )
+
+
+def stalled_broadcasts():
+    """Unfinished broadcasts that no worker has advanced for STALL_SECONDS"""
+    cutoff = timezone.now() - timedelta(seconds=fanout_settings()['STALL_SECONDS'])
+    return NotificationBroadcast.objects.filter(status__in=['pending', 'running'], updated_at__lt=cutoff)
@@ -33,18 +33,75 @@ class Notification(models.Model):
     action_url = models.URLField(blank=True)
     metadata = models.JSONField(default=dict, blank=True)
     
+    broadcast = models.ForeignKey(
+        'NotificationBroadcast', on_delete=models.SET_NULL, blank=True, null=True, related_name='notifications'
+    )
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['recipient', 'is_read']),
+            models.Index(fields=['recipient', '-created_at', '-id']),
             models.Index(fields=['created_at']),
         ]
     
     def __str__(self):
         return f"{self.title} - {self.recipient.email}"
 
+class NotificationBroadcast(models.Model):
+    """A notification fanned out to an audience by notifications.fanout"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    sender = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='notification_broadcasts', blank=True, null=True)
+    
+    notification_type = models.CharField(max_length=30, choices=Notification.NOTIFICATION_TYPES)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, blank=True, null=True)
+    action_url = models.URLField(blank=True)
+    metadata = models.JSONField(default=dict, blank=True)
+    
+    # Audience: users matching any of these are notified
+    recipient_ids = models.JSONField(default=list, blank=True)
+    user_types = models.JSONField(default=list, blank=True)
+    school_ids = models.JSONField(default=list, blank=True)
+    province_ids = models.JSONField(default=list, blank=True)
+    
+    # Progress; recipients are processed in id order so last_recipient_id is a resume cursor
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_recipients = models.PositiveIntegerField(blank=True, null=True)
+    sent_count = models.PositiveIntegerField(default=0)
+    last_recipient_id = models.UUIDField(blank=True, null=True)
+    error_message = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.title} ({self.get_status_display()})"
+    
+    @property
+    def progress_percentage(self):
+        if not self.total_recipients:
+            return 100 if self.status == 'completed' else 0
+        return round(self.sent_count * 100 / self.total_recipients, 1)
+
 class NotificationPreference(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_preferences')
     
@@ -0,0 +1,38 @@
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id):
+    """Channel group NotificationConsumer joins for a user"""
+    return f'notifications_{user_id}'
+
+
+def send_to_users(messages):
+    """
+    Send ``[(user_id, event), ...]`` to the users' notification groups as one
+    concurrent batch. Failures are logged, never raised: realtime delivery is
+    best effort on top of rows that are already committed.
+    """
+    send_to_groups([(user_group(user_id), event) for user_id, event in messages])
+
+
+def send_to_groups(messages):
+    """Send ``[(group, event), ...]`` as one concurrent batch, see ``send_to_users``"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not messages:
+        return
+    
+    async def send_all():
+        await asyncio.gather(*(
+            channel_layer.group_send(group, event) for group, event in messages
+        ))
+    
+    try:
+        async_to_sync(send_all)()
+    except Exception:
+        logger.warning('Realtime push failed for %d messages', len(messages), exc_info=True)
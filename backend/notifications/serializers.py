@@ -1,5 +1,8 @@
 from rest_framework import serializers
-from .models import Notification, NotificationPreference, Announcement
+from django.contrib.auth import get_user_model
+from .models import Notification, NotificationBroadcast, NotificationPreference, Announcement
+
+User = get_user_model()
 
 class NotificationSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source='sender.get_full_name', read_only=True)
@@ -29,6 +32,41 @@ class NotificationSerializer(serializers.ModelSerializer):
         else:
             return obj.created_at.strftime("%b %d, %Y")
 
+class NotificationBroadcastSerializer(serializers.ModelSerializer):
+    recipient_ids = serializers.ListField(child=serializers.UUIDField(), required=False)
+    user_types = serializers.ListField(
+        child=serializers.ChoiceField(choices=User.USER_TYPES), required=False
+    )
+    school_ids = serializers.ListField(child=serializers.UUIDField(), required=False)
+    province_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    progress_percentage = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = NotificationBroadcast
+        fields = '__all__'
+        read_only_fields = (
+            'id', 'sender', 'status', 'total_recipients', 'sent_count', 'last_recipient_id',
+            'error_message', 'created_at', 'updated_at', 'started_at', 'completed_at',
+        )
+        extra_kwargs = {
+            'notification_type': {'default': 'system_announcement'},
+        }
+    
+    def validate(self, attrs):
+        if not any(attrs.get(field) for field in ('recipient_ids', 'user_types', 'school_ids', 'province_ids')):
+            raise serializers.ValidationError(
+                'At least one of recipient_ids, user_types, school_ids or province_ids is required'
+            )
+        return attrs
+    
+    def to_internal_value(self, data):
+        attrs = super().to_internal_value(data)
+        # JSON fields store plain strings
+        for field in ('recipient_ids', 'school_ids'):
+            if field in attrs:
+                attrs[field] = [str(value) for value in attrs[field]]
+        return attrs
+
 class NotificationPreferenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = NotificationPreference
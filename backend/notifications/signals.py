@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import audience
+from .models import Announcement, Notification
+from .unread import get_counters
+
+
+@receiver(post_save, sender=Notification)
+def notification_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and not instance.is_read:
+        transaction.on_commit(lambda: get_counters().adjust(instance.recipient_id, 1))
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        transaction.on_commit(lambda: get_counters().adjust(instance.recipient_id, -1))
+
+
+@receiver(post_save, sender=Announcement)
+@receiver(post_delete, sender=Announcement)
+@receiver(m2m_changed, sender=Announcement.target_users.through)
+def announcement_changed(sender, **kwargs):
+    transaction.on_commit(audience.invalidate)
@@ -0,0 +1,31 @@
+from celery import shared_task
+
+from . import fanout
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=30, ignore_result=True)
+def fan_out_broadcast(self, broadcast_id):
+    """Write and push a broadcast's notifications, resuming from its cursor"""
+    try:
+        return fanout.run_broadcast(broadcast_id).sent_count
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            fanout.mark_failed(broadcast_id, exc)
+            raise
+        raise self.retry(exc=exc)
+
+
+@shared_task(ignore_result=True)
+def resume_stalled_broadcasts():
+    """Re-queue broadcasts whose worker died mid fan-out"""
+    broadcast_ids = list(fanout.stalled_broadcasts().values_list('id', flat=True))
+    for broadcast_id in broadcast_ids:
+        fan_out_broadcast.delay(str(broadcast_id))
+    return len(broadcast_ids)
+
+
+@shared_task(ignore_result=True)
+def reconcile_unread_counts():
+    """Correct unread counters that drifted from the Notification table"""
+    from .unread import get_counters
+    return get_counters().reconcile()
@@ -0,0 +1,186 @@
+"""
+Per-user unread notification counters.
+
+Every open tab used to poll ``unread-count``, which ran a COUNT each time.
+Counts now live in one Redis hash (field = user id) that is seeded from the
+table on first read and adjusted with HINCRBY when notifications are created
+or read; each change is pushed to the user's ``notifications_<user_id>``
+group as an ``unread_count`` event, so clients no longer need to poll.
+
+Counters only move when the field already exists, so a missing field always
+means "ask the table". Drift (a change racing a seed, a Redis restart) is
+healed by the ``reconcile_unread_counts`` task, which compares the hash with
+one GROUP BY query per batch of users. With ``BACKEND='db'``, or whenever
+Redis is unreachable, counts come straight from the table.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .realtime import send_to_users
+
+logger = logging.getLogger(__name__)
+
+# Adjust a counter only if it is already seeded; -1 means "not seeded"
+ADJUST_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    local value = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+    if value < 0 then
+        redis.call('HDEL', KEYS[1], ARGV[1])
+        return -1
+    end
+    return value
+end
+return -1
+"""
+
+
+def counter_settings():
+    return settings.NOTIFICATION_UNREAD_COUNTERS
+
+
+def count_unread(user_ids):
+    """``{user_id: unread count}`` from the table, with one GROUP BY query"""
+    from .models import Notification
+    
+    counts = dict.fromkeys((str(user_id) for user_id in user_ids), 0)
+    rows = Notification.objects.filter(
+        recipient_id__in=list(counts), is_read=False
+    ).values('recipient_id').annotate(count=Count('id')).order_by()
+    for row in rows:
+        counts[str(row['recipient_id'])] = row['count']
+    return counts
+
+
+def push_counts(counts, deltas):
+    send_to_users([
+        (user_id, {'type': 'unread_count', 'unread_count': count, 'delta': deltas.get(user_id, 0)})
+        for user_id, count in counts.items()
+    ])
+
+
+class DatabaseUnreadCounters:
+    """Counts straight from the Notification table"""
+    
+    def __init__(self, options):
+        self.options = options
+    
+    def get(self, user_id):
+        return count_unread([user_id])[str(user_id)]
+    
+    def adjust(self, user_id, delta):
+        return self.adjust_many({user_id: delta}).get(str(user_id))
+    
+    def adjust_many(self, deltas):
+        """Apply ``{user_id: delta}`` after the change is committed and push the new counts"""
+        deltas = {str(user_id): delta for user_id, delta in deltas.items() if delta}
+        if not deltas:
+            return {}
+        counts = self.current_counts(deltas)
+        push_counts(counts, deltas)
+        return counts
+    
+    def current_counts(self, deltas):
+        return count_unread(deltas)
+    
+    def reconcile(self):
+        return 0
+
+
+class RedisUnreadCounters(DatabaseUnreadCounters):
+    key = 'notifications:unread'
+    
+    def __init__(self, options):
+        import redis
+        
+        super().__init__(options)
+        self.client = redis.Redis.from_url(options['REDIS_URL'])
+        self.adjust_script = self.client.register_script(ADJUST_SCRIPT)
+    
+    def get(self, user_id):
+        import redis
+        
+        try:
+            value = self.client.hget(self.key, str(user_id))
+            if value is not None:
+                return int(value)
+            return self.seed([user_id])[str(user_id)]
+        except redis.RedisError:
+            logger.warning('Unread counters unavailable, counting from the database', exc_info=True)
+            return super().get(user_id)
+    
+    def seed(self, user_ids):
+        counts = count_unread(user_ids)
+        pipe = self.client.pipeline(transaction=False)
+        for user_id, count in counts.items():
+            pipe.hsetnx(self.key, user_id, count)
+        pipe.execute()
+        return counts
+    
+    def current_counts(self, deltas):
+        import redis
+        
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for user_id, delta in deltas.items():
+                self.adjust_script(keys=[self.key], args=[user_id, delta], client=pipe)
+            results = pipe.execute()
+            
+            counts = {user_id: value for user_id, value in zip(deltas, results) if value >= 0}
+            missing = [user_id for user_id in deltas if user_id not in counts]
+            if missing:
+                counts.update(self.seed(missing))
+            return counts
+        except redis.RedisError:
+            logger.warning('Unread counters unavailable, counting from the database', exc_info=True)
+            return count_unread(deltas)
+    
+    def reconcile(self):
+        """Correct every stored counter that disagrees with the table"""
+        batch_size = self.options['RECONCILE_BATCH_SIZE']
+        corrected = 0
+        cursor = 0
+        while True:
+            cursor, stored = self.client.hscan(self.key, cursor, count=batch_size)
+            stored = {user_id.decode(): int(value) for user_id, value in stored.items()}
+            if stored:
+                actual = count_unread(stored)
+                wrong = {user_id: count for user_id, count in actual.items() if stored[user_id] != count}
+                if wrong:
+                    self.client.hset(self.key, mapping=wrong)
+                    push_counts(wrong, {user_id: wrong[user_id] - stored[user_id] for user_id in wrong})
+                    corrected += len(wrong)
+            if cursor == 0:
+                return corrected
+
+
+COUNTER_BACKENDS = {
+    'redis': RedisUnreadCounters,
+    'db': DatabaseUnreadCounters,
+}
+
+_counters = None
+_counters_lock = threading.Lock()
+
+
+def get_counters():
+    """Process-wide counter store for the configured backend"""
+    global _counters
+    if _counters is None:
+        with _counters_lock:
+            if _counters is None:
+                options = counter_settings()
+                _counters = COUNTER_BACKENDS[options['BACKEND']](options)
+    return _counters
+
+
+def mark_read(queryset, user_id):
+    """Mark the unread notifications in ``queryset`` read and update the counter"""
+    marked = queryset.filter(is_read=False).update(is_read=True, read_at=timezone.now())
+    if marked:
+        transaction.on_commit(lambda: get_counters().adjust(user_id, -marked))
+    return marked
@@ -10,4 +10,5 @@ urlpatterns = [
     path('preferences/', views.NotificationPreferenceView.as_view(), name='notification-preferences'),
     path('announcements/', views.AnnouncementListView.as_view(), name='announcements'),
     path('send/', views.send_notification, name='send-notification'),
+    path('broadcasts/<uuid:id>/', views.NotificationBroadcastDetailView.as_view(), name='notification-broadcast-detail'),
 ]
@@ -1,16 +1,24 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from django.db import transaction
 from django.utils import timezone
-from .models import Notification, NotificationPreference, Announcement
-from .serializers import NotificationSerializer, NotificationPreferenceSerializer, AnnouncementSerializer
+from .models import Notification, NotificationBroadcast, NotificationPreference
+from .serializers import (
+    NotificationSerializer, NotificationBroadcastSerializer, NotificationPreferenceSerializer, AnnouncementSerializer
+)
+from .audience import announcements_for
+from .tasks import fan_out_broadcast
+from .unread import get_counters, mark_read
+from learnhub.pagination import KeysetPagination
 
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user).select_related('sender', 'course')
 
 class NotificationDetailView(generics.RetrieveUpdateAPIView):
     serializer_class = NotificationSerializer
@@ -21,50 +29,43 @@ class NotificationDetailView(generics.RetrieveUpdateAPIView):
         return Notification.objects.filter(recipient=self.request.user)
     
     def perform_update(self, serializer):
+        was_read = serializer.instance.is_read
         # Mark as read when accessed
         if not serializer.instance.is_read:
             serializer.save(is_read=True, read_at=timezone.now())
         else:
             serializer.save()
+        
+        if serializer.instance.is_read != was_read:
+            delta = -1 if serializer.instance.is_read else 1
+            transaction.on_commit(lambda: get_counters().adjust(self.request.user.id, delta))
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def mark_notification_read(request, notification_id):
-    try:
-        notification = Notification.objects.get(
-            id=notification_id, 
-            recipient=request.user
-        )
-        notification.is_read = True
-        notification.read_at = timezone.now()
-        notification.save()
-        
-        return Response({'message': 'Notification marked as read'})
-    except Notification.DoesNotExist:
+    notifications = Notification.objects.filter(id=notification_id, recipient=request.user)
+    if not notifications.exists():
         return Response(
             {'error': 'Notification not found'}, 
             status=status.HTTP_404_NOT_FOUND
         )
+    
+    mark_read(notifications, request.user.id)
+    return Response({'message': 'Notification marked as read'})
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def mark_all_notifications_read(request):
-    Notification.objects.filter(
-        recipient=request.user, 
-        is_read=False
-    ).update(is_read=True, read_at=timezone.now())
+    mark_read(Notification.objects.filter(recipient=request.user), request.user.id)
     
     return Response({'message': 'All notifications marked as read'})
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def unread_notifications_count(request):
-    count = Notification.objects.filter(
-        recipient=request.user, 
-        is_read=False
-    ).count()
-    
-    return Response({'unread_count': count})
+    # Served from the unread counter store; clients connected to the
+    # notifications websocket also receive every change as it happens
+    return Response({'unread_count': get_counters().get(request.user.id)})
 
 class NotificationPreferenceView(generics.RetrieveUpdateAPIView):
     serializer_class = NotificationPreferenceSerializer
@@ -80,64 +81,42 @@ class AnnouncementListView(generics.ListAPIView):
     serializer_class = AnnouncementSerializer
     permission_classes = [permissions.IsAuthenticated]
     
-    def get_queryset(self):
-        user = self.request.user
-        now = timezone.now()
-        
-        queryset = Announcement.objects.filter(
-            is_active=True,
-            start_date__lte=now
-        ).filter(
-            models.Q(end_date__isnull=True) | models.Q(end_date__gte=now)
-        )
-        
-        # Filter by target users or user types
-        queryset = queryset.filter(
-            models.Q(target_users=user) | 
-            models.Q(target_users__isnull=True) |
-            models.Q(target_user_types__contains=[user.user_type])
-        ).distinct()
-        
-        return queryset
+    def list(self, request, *args, **kwargs):
+        # Already serialized by the cached audience index, see audience.py
+        announcements = announcements_for(request.user)
+        page = self.paginate_queryset(announcements)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(announcements)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def send_notification(request):
-    """Send a notification to specific users (admin only)"""
+    """Queue a notification for fan-out to users, user types, schools or provinces (admin only)"""
     if not request.user.is_staff:
         return Response(
             {'error': 'Permission denied'}, 
             status=status.HTTP_403_FORBIDDEN
         )
     
-    recipient_ids = request.data.get('recipient_ids', [])
-    title = request.data.get('title')
-    message = request.data.get('message')
-    notification_type = request.data.get('notification_type', 'system_announcement')
-    
-    if not recipient_ids or not title or not message:
-        return Response(
-            {'error': 'recipient_ids, title, and message are required'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    from django.contrib.auth import get_user_model
-    User = get_user_model()
+    serializer = NotificationBroadcastSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    recipients = User.objects.filter(id__in=recipient_ids)
-    notifications = []
+    broadcast = serializer.save(sender=request.user)
+    transaction.on_commit(lambda: fan_out_broadcast.delay(str(broadcast.id)))
     
-    for recipient in recipients:
-        notification = Notification.objects.create(
-            recipient=recipient,
-            sender=request.user,
-            notification_type=notification_type,
-            title=title,
-            message=message
-        )
-        notifications.append(notification)
-    
-    return Response({
-        'message': f'Sent {len(notifications)} notifications',
-        'notification_ids': [str(n.id) for n in notifications]
-    })
+    return Response(
+        {
+            'message': 'Notification queued for delivery',
+            'broadcast': NotificationBroadcastSerializer(broadcast).data,
+        },
+        status=status.HTTP_202_ACCEPTED
+    )
+
+class NotificationBroadcastDetailView(generics.RetrieveAPIView):
+    """Progress of a queued notification fan-out"""
+    queryset = NotificationBroadcast.objects.all()
+    serializer_class = NotificationBroadcastSerializer
+    permission_classes = [permissions.IsAdminUser]
+    lookup_field = 'id'
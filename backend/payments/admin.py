@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Payment, Coupon, CouponUsage, InstructorPayout
+from .models import Payment, Coupon, CouponUsage, InstructorPayout, StripeEvent, LedgerEntry, InstructorBalance, PayoutBatch
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
@@ -17,7 +17,42 @@ class CouponAdmin(admin.ModelAdmin):
 
 @admin.register(InstructorPayout)
 class InstructorPayoutAdmin(admin.ModelAdmin):
-    list_display = ('id', 'instructor', 'amount', 'payout_status', 'period_start', 'period_end', 'created_at')
-    list_filter = ('payout_status', 'created_at')
+    list_display = ('id', 'instructor', 'amount', 'payout_method', 'payout_status', 'period_start', 'period_end', 'created_at')
+    list_filter = ('payout_status', 'payout_method', 'batch', 'created_at')
     search_fields = ('instructor__email',)
-    readonly_fields = ('id', 'created_at')
+    readonly_fields = ('id', 'batch', 'created_at')
+
+@admin.register(PayoutBatch)
+class PayoutBatchAdmin(admin.ModelAdmin):
+    list_display = ('period_start', 'period_end', 'status', 'payout_count', 'total_amount', 'created_at', 'completed_at')
+    list_filter = ('status',)
+    readonly_fields = ('id', 'status', 'payout_count', 'total_amount', 'created_by', 'created_at', 'completed_at')
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'payment_intent_id', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type', 'received_at')
+    search_fields = ('event_id', 'payment_intent_id')
+    readonly_fields = ('event_id', 'event_type', 'payment_intent_id', 'stripe_created', 'payload', 'received_at', 'processed_at')
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'instructor', 'entry_type', 'source', 'source_id', 'amount', 'balance_after', 'created_at')
+    list_filter = ('entry_type', 'source', 'created_at')
+    search_fields = ('instructor__email', 'source_id')
+    
+    # The ledger is append-only; corrections are posted as new entries
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(InstructorBalance)
+class InstructorBalanceAdmin(admin.ModelAdmin):
+    list_display = ('instructor', 'gross_revenue', 'refunds', 'platform_fees', 'pending_payout', 'paid_out', 'available', 'updated_at')
+    search_fields = ('instructor__email',)
+    readonly_fields = ('instructor', 'gross_revenue', 'refunds', 'platform_fees', 'pending_payout', 'paid_out', 'available', 'updated_at')
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class PaymentsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'payments'
+    verbose_name = 'Payments'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
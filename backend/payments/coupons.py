@@ -0,0 +1,254 @@
+"""
+Coupon rules and redemption.
+
+Checking a coupon used to fetch it and materialise its ``applicable_courses``
+on every request. Every coupon that is active and not yet expired is now
+compiled once per process into a ``CouponRule`` (validity window, caps and
+the applicable course ids as a frozenset) with two queries, and the rule set
+is reused until an admin edit bumps the version in the shared cache (see
+``signals.py``), as ``mobile_payments.config`` does for payment settings.
+Unknown or expired codes are rejected without a query.
+
+``used_count`` in a rule is only a hint for previews. The limit is enforced
+by ``reserve``, a conditional UPDATE that takes a use only while
+``used_count < usage_limit``, so concurrent checkouts cannot oversubscribe a
+coupon and nothing holds a row lock across a request. A use is reserved
+when the PaymentIntent is created and recorded on its ``Payment``; it is
+released if the payment fails or is cancelled, when the same user starts
+another checkout of the course, or by ``release_stale`` once the checkout
+has been abandoned for ``COUPON_RESERVATIONS['MAX_AGE_HOURS']``.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from courses.models import Course
+
+from .models import Coupon, Payment
+
+VERSION_KEY = 'payments:coupon-rules-version'
+
+VERSION_CHECK_SECONDS = 5
+
+# Payment statuses that may still hold a reserved use
+OPEN_STATUSES = ('pending', 'processing', 'failed')
+
+_rules = None
+_lock = threading.Lock()
+
+
+class CouponError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class CouponRule:
+    id: int
+    code: str
+    discount_type: str
+    discount_value: Decimal
+    minimum_amount: Decimal
+    maximum_discount: Optional[Decimal]
+    usage_limit: Optional[int]
+    used_count: int
+    valid_from: object
+    valid_until: object
+    course_ids: frozenset  # empty means every course
+    
+    def check(self, now=None):
+        """Raise CouponError unless the coupon can be used right now"""
+        now = now or timezone.now()
+        if not self.valid_from <= now <= self.valid_until:
+            raise CouponError("Coupon is not valid or has expired")
+        if self.usage_limit is not None and self.used_count >= self.usage_limit:
+            raise CouponError("Coupon is not valid or has expired")
+    
+    def applies_to(self, course_id):
+        return not self.course_ids or course_id in self.course_ids
+    
+    def discount_for(self, price):
+        if self.discount_type == 'percentage':
+            discount = (price * self.discount_value) / 100
+            if self.maximum_discount:
+                discount = min(discount, self.maximum_discount)
+        else:
+            discount = self.discount_value
+        return min(discount, price)
+
+
+@dataclass
+class Quote:
+    course_id: object
+    price: Decimal
+    discount_amount: Decimal = Decimal('0')
+    error: str = ''
+    
+    @property
+    def final_price(self):
+        return max(Decimal('0'), self.price - self.discount_amount)
+
+
+class RuleSet:
+    def __init__(self, version):
+        self.version = version
+        self.checked_at = time.monotonic()
+        
+        coupons = list(Coupon.objects.filter(is_active=True, valid_until__gte=timezone.now()))
+        course_ids = {}
+        links = Coupon.applicable_courses.through.objects.filter(coupon_id__in=[c.id for c in coupons])
+        for coupon_id, course_id in links.values_list('coupon_id', 'course_id'):
+            course_ids.setdefault(coupon_id, set()).add(course_id)
+        
+        self.rules = {
+            coupon.code: CouponRule(
+                id=coupon.id,
+                code=coupon.code,
+                discount_type=coupon.discount_type,
+                discount_value=coupon.discount_value,
+                minimum_amount=coupon.minimum_amount,
+                maximum_discount=coupon.maximum_discount,
+                usage_limit=coupon.usage_limit,
+                used_count=coupon.used_count,
+                valid_from=coupon.valid_from,
+                valid_until=coupon.valid_until,
+                course_ids=frozenset(course_ids.get(coupon.id, ())),
+            )
+            for coupon in coupons
+        }
+
+
+def current_version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def get_rules():
+    global _rules
+    rules = _rules
+    if rules is not None and time.monotonic() - rules.checked_at < VERSION_CHECK_SECONDS:
+        return rules.rules
+    
+    with _lock:
+        version = current_version()
+        if _rules is None or _rules.version != version:
+            _rules = RuleSet(version)
+        else:
+            _rules.checked_at = time.monotonic()
+        return _rules.rules
+
+
+def invalidate():
+    """Make every process recompile its coupon rules"""
+    global _rules
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    _rules = None
+
+
+def get_rule(code):
+    """The usable coupon ``code``; raises CouponError"""
+    rule = get_rules().get(code)
+    if rule is None:
+        raise CouponError("Invalid coupon code")
+    rule.check()
+    return rule
+
+
+def quote(rule, course_id, price):
+    line = Quote(course_id=course_id, price=price)
+    if not rule.applies_to(course_id):
+        line.error = "Coupon is not applicable to this course"
+    elif price < rule.minimum_amount:
+        line.error = f"Minimum purchase amount is ${rule.minimum_amount}"
+    else:
+        line.discount_amount = rule.discount_for(price)
+    return line
+
+
+@dataclass
+class Cart:
+    rule: CouponRule
+    lines: list
+    
+    @property
+    def discount_amount(self):
+        return sum((line.discount_amount for line in self.lines), Decimal('0'))
+    
+    @property
+    def final_price(self):
+        return sum((line.final_price for line in self.lines), Decimal('0'))
+
+
+def evaluate_cart(code, course_ids):
+    """
+    Quote coupon ``code`` for each course in the cart, loading the prices
+    with one query. Each course is bought as its own payment, so caps and
+    minimums apply per course. Raises CouponError if the coupon is unusable.
+    """
+    rule = get_rule(code)
+    course_ids = list(dict.fromkeys(course_ids))
+    prices = dict(Course.objects.filter(id__in=course_ids).values_list('id', 'price'))
+    return Cart(rule, [
+        quote(rule, course_id, prices[course_id]) if course_id in prices
+        else Quote(course_id=course_id, price=Decimal('0'), error="Course not found")
+        for course_id in course_ids
+    ])
+
+
+def reserve(rule):
+    """Take one use of a coupon if its limit and window allow; raises CouponError"""
+    now = timezone.now()
+    taken = Coupon.objects.filter(
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit')),
+        pk=rule.id, is_active=True, valid_from__lte=now, valid_until__gte=now,
+    ).update(used_count=F('used_count') + 1)
+    if not taken:
+        # Let previews see the coupon as used up
+        invalidate()
+        raise CouponError("Coupon is not valid or has expired")
+
+
+def release(codes):
+    """Give back one use of the coupon per code in ``codes``"""
+    per_coupon = {}
+    for code in codes:
+        per_coupon[code] = per_coupon.get(code, 0) + 1
+    for code, count in per_coupon.items():
+        Coupon.objects.filter(code=code, used_count__gte=count).update(used_count=F('used_count') - count)
+    if per_coupon:
+        # A failed reserve() may have compiled the coupon as used up
+        transaction.on_commit(invalidate)
+
+
+def release_reservations(payments):
+    """Give back the uses still reserved for ``payments`` (a queryset), once each"""
+    with transaction.atomic():
+        held = list(
+            payments.select_for_update(skip_locked=True)
+            .filter(coupon_reserved=True)
+            .values_list('id', 'coupon_code')
+        )
+        if held:
+            Payment.objects.filter(id__in=[payment_id for payment_id, _ in held]).update(coupon_reserved=False)
+            release([code for _, code in held])
+    return len(held)
+
+
+def release_stale():
+    """Release the uses reserved for checkouts that were abandoned"""
+    max_age = timedelta(hours=settings.COUPON_RESERVATIONS['MAX_AGE_HOURS'])
+    return release_reservations(Payment.objects.filter(
+        coupon_reserved=True,
+        payment_status__in=OPEN_STATUSES,
+        created_at__lt=timezone.now() - max_age,
+    ))
@@ -0,0 +1,251 @@
+"""
+Instructor revenue ledger.
+
+Instructor earnings used to be summed from every completed enrollment of
+every course on each request. Money movements are now appended to
+``LedgerEntry`` as they happen, and entries are never changed:
+
+* ``sale`` and ``platform_fee`` when a card payment completes or a mobile
+  money payment is confirmed
+* ``refund`` and ``fee_refund`` when a card payment is refunded, in part
+  or in full
+* ``payout`` when a payout is requested, then ``payout_paid`` or
+  ``payout_failed`` once it settles
+
+Each entry type moves fixed ``BUCKETS`` of the instructor's
+``InstructorBalance`` row, which is locked while entries are posted, so the
+running totals and each entry's ``balance_after`` stay exact. Earnings,
+pending payouts and the available balance are then a one-row read, and a
+statement is a range scan of ``(instructor, created_at)``.
+
+Sales and refunds carry a unique ``reference``, so posting one twice is a
+no-op. ``rebuild_balances`` recomputes the balances from the entries.
+"""
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from courses.models import Course
+
+from .models import InstructorBalance, LedgerEntry
+
+CENT = Decimal('0.01')
+
+# How much of each entry's amount every balance field moves by
+BUCKETS = {
+    'sale': {'gross_revenue': 1, 'available': 1},
+    'platform_fee': {'platform_fees': 1, 'available': -1},
+    'refund': {'refunds': 1, 'available': -1},
+    'fee_refund': {'platform_fees': -1, 'available': 1},
+    'payout': {'pending_payout': 1, 'available': -1},
+    'payout_paid': {'pending_payout': -1, 'paid_out': 1},
+    'payout_failed': {'pending_payout': -1, 'available': 1},
+}
+
+BALANCE_FIELDS = ['gross_revenue', 'refunds', 'platform_fees', 'pending_payout', 'paid_out', 'available']
+
+REVERSALS = {'sale': 'refund', 'platform_fee': 'fee_refund'}
+
+# Entry types that earn money for instructors or take it back, as opposed to paying it out
+EARNING_TYPES = ('sale', 'platform_fee', 'refund', 'fee_refund')
+
+
+def ledger_settings():
+    return settings.REVENUE_LEDGER
+
+
+def platform_fee(amount):
+    rate = Decimal(str(ledger_settings()['PLATFORM_FEE_PERCENT']))
+    return (amount * rate / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def get_balance(instructor):
+    """Balance of an instructor, unsaved and zero if nothing was posted yet"""
+    return InstructorBalance.objects.filter(instructor=instructor).first() or InstructorBalance(instructor=instructor)
+
+
+def post(entries):
+    """
+    Append unsaved ``LedgerEntry`` rows, in order, and move the balances of
+    their instructors. Entries whose ``reference`` was posted before are
+    dropped. Returns the entries written.
+    """
+    entries = [entry for entry in entries if entry.amount]
+    if not entries:
+        return []
+    
+    instructor_ids = sorted({entry.instructor_id for entry in entries}, key=str)
+    now = timezone.now()
+    with transaction.atomic():
+        InstructorBalance.objects.bulk_create(
+            [InstructorBalance(instructor_id=instructor_id) for instructor_id in instructor_ids],
+            ignore_conflicts=True,
+        )
+        balances = {
+            balance.instructor_id: balance
+            for balance in InstructorBalance.objects.select_for_update()
+            .filter(instructor_id__in=instructor_ids).order_by('instructor_id')
+        }
+        # Checked under the balance locks, which every poster of the same
+        # reference takes first
+        posted = set(LedgerEntry.objects.filter(
+            reference__in=[entry.reference for entry in entries if entry.reference]
+        ).values_list('reference', flat=True))
+        
+        written = []
+        for entry in entries:
+            if entry.reference:
+                if entry.reference in posted:
+                    continue
+                posted.add(entry.reference)
+            balance = balances[entry.instructor_id]
+            for field, sign in BUCKETS[entry.entry_type].items():
+                setattr(balance, field, getattr(balance, field) + sign * entry.amount)
+            balance.updated_at = now
+            entry.balance_after = balance.available
+            written.append(entry)
+        
+        if written:
+            LedgerEntry.objects.bulk_create(written)
+            InstructorBalance.objects.bulk_update(
+                {entry.instructor_id: balances[entry.instructor_id] for entry in written}.values(),
+                BALANCE_FIELDS + ['updated_at'],
+            )
+    return written
+
+
+def record_sales(source, purchases):
+    """
+    Post the sale and platform fee of completed ``purchases`` (anything with
+    ``id``, ``course_id`` and ``amount``) from ``source``.
+    """
+    instructors = dict(
+        Course.objects.filter(id__in={purchase.course_id for purchase in purchases})
+        .values_list('id', 'instructor_id')
+    )
+    entries = []
+    for purchase in purchases:
+        for entry_type, amount in (('sale', purchase.amount), ('platform_fee', platform_fee(purchase.amount))):
+            entries.append(LedgerEntry(
+                instructor_id=instructors[purchase.course_id],
+                course_id=purchase.course_id,
+                entry_type=entry_type,
+                source=source,
+                source_id=str(purchase.id),
+                reference=f'{source}:{purchase.id}:{entry_type}',
+                amount=amount,
+            ))
+    return post(entries)
+
+
+def record_refunds(source, purchases, refunded=None):
+    """
+    Reverse the posted sale and platform fee of refunded ``purchases``.
+    
+    ``refunded`` maps purchase ids to how much of them has been refunded so
+    far, for partial refunds; purchases missing from it are reversed in
+    full. Only what was not reversed yet is posted, and the platform fee is
+    given back in proportion to the refund.
+    """
+    refunded = refunded or {}
+    purchases = {str(purchase.id): purchase for purchase in purchases}
+    charged = defaultdict(dict)
+    reversed_so_far = defaultdict(lambda: defaultdict(Decimal))
+    for entry in LedgerEntry.objects.filter(
+        source=source,
+        source_id__in=list(purchases),
+        entry_type__in=list(REVERSALS) + list(REVERSALS.values()),
+    ).order_by('id'):
+        if entry.entry_type in REVERSALS:
+            charged[entry.source_id][entry.entry_type] = entry
+        else:
+            reversed_so_far[entry.source_id][entry.entry_type] += entry.amount
+    
+    entries = []
+    for source_id, purchase in purchases.items():
+        sale = charged[source_id].get('sale')
+        if sale is None:
+            continue
+        target = min(sale.amount, refunded.get(purchase.id, sale.amount))
+        full = target >= sale.amount
+        for entry_type, entry in charged[source_id].items():
+            reversal = REVERSALS[entry_type]
+            if full:
+                due, reference = entry.amount, f'{source}:{source_id}:{reversal}'
+            else:
+                due = (entry.amount * target / sale.amount).quantize(CENT, rounding=ROUND_HALF_UP)
+                reference = f'{source}:{source_id}:{reversal}:{target:.2f}'
+            amount = due - reversed_so_far[source_id][reversal]
+            if amount > 0:
+                entries.append(LedgerEntry(
+                    instructor_id=entry.instructor_id,
+                    course_id=entry.course_id,
+                    entry_type=reversal,
+                    source=source,
+                    source_id=source_id,
+                    reference=reference,
+                    amount=amount,
+                ))
+    return post(entries)
+
+
+def payout_state(payout_status):
+    return {'completed': 'paid', 'failed': 'released'}.get(payout_status, 'held')
+
+
+def payout_entry_types(previous_status, payout_status):
+    """Entry types moving a payout from ``previous_status`` (None if new) to ``payout_status``"""
+    old, new = payout_state(previous_status) if previous_status else None, payout_state(payout_status)
+    entry_types = []
+    if old in (None, 'released') and new != 'released':
+        entry_types.append('payout')
+        old = 'held'
+    if old == 'held' and new == 'paid':
+        entry_types.append('payout_paid')
+    elif old == 'held' and new == 'released':
+        entry_types.append('payout_failed')
+    return entry_types
+
+
+def record_payouts(changes):
+    """Post ``[(payout, previous_status), ...]``; ``previous_status`` is None for new payouts"""
+    return post([
+        LedgerEntry(
+            instructor_id=payout.instructor_id,
+            entry_type=entry_type,
+            source='payout',
+            source_id=str(payout.id),
+            amount=payout.amount,
+        )
+        for payout, previous_status in changes
+        for entry_type in payout_entry_types(previous_status, payout.payout_status)
+    ])
+
+
+def rebuild_balances(instructor_ids=None):
+    """Recompute balances from the ledger; ``balance_after`` of past entries is left alone"""
+    entries = LedgerEntry.objects.all()
+    if instructor_ids is not None:
+        entries = entries.filter(instructor_id__in=list(instructor_ids))
+    
+    totals = defaultdict(lambda: dict.fromkeys(BALANCE_FIELDS, Decimal('0')))
+    rows = entries.order_by().values('instructor_id', 'entry_type').annotate(total=Sum('amount'))
+    for row in rows:
+        for field, sign in BUCKETS[row['entry_type']].items():
+            totals[row['instructor_id']][field] += sign * row['total']
+    
+    now = timezone.now()
+    InstructorBalance.objects.bulk_create(
+        [
+            InstructorBalance(instructor_id=instructor_id, updated_at=now, **fields)
+            for instructor_id, fields in totals.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['instructor'],
+        update_fields=BALANCE_FIELDS + ['updated_at'],
+    )
+    return len(totals)
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from mobile_payments.models import MobileMoneyTransaction
+from payments import ledger
+from payments.models import InstructorPayout, LedgerEntry, Payment
+
+CHUNK_SIZE = 1000
+
+class Command(BaseCommand):
+    help = 'Post revenue ledger entries for payments and payouts made before the ledger existed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--balances-only',
+            action='store_true',
+            help='Only recompute instructor balances from the existing entries',
+        )
+    
+    def handle(self, *args, **options):
+        if not options['balances_only']:
+            # Sales and refunds are posted with unique references, so
+            # running this again only fills in what is missing
+            payments = Payment.objects.filter(payment_status__in=['completed', 'refunded']).order_by('completed_at', 'id')
+            sales = self.post_chunks(payments, lambda chunk: ledger.record_sales('payment', chunk))
+            refunds = self.post_chunks(
+                payments.filter(payment_status='refunded'), lambda chunk: ledger.record_refunds('payment', chunk)
+            )
+            mobile = self.post_chunks(
+                MobileMoneyTransaction.objects.filter(status='confirmed').order_by('confirmed_at', 'id'),
+                lambda chunk: ledger.record_sales('mobile_money', chunk),
+            )
+            # Payout entries have no reference; skip payouts already posted
+            posted_payouts = set(LedgerEntry.objects.filter(source='payout').values_list('source_id', flat=True))
+            payouts = self.post_chunks(
+                InstructorPayout.objects.order_by('created_at', 'id'),
+                lambda chunk: ledger.record_payouts(
+                    [(payout, None) for payout in chunk if str(payout.id) not in posted_payouts]
+                ),
+            )
+            self.stdout.write(
+                f'Posted {sales} sale, {refunds} refund, {mobile} mobile money and {payouts} payout entries'
+            )
+        
+        rebuilt = ledger.rebuild_balances()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt balances for {rebuilt} instructors'))
+    
+    def post_chunks(self, queryset, post):
+        posted = 0
+        chunk = []
+        for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+            chunk.append(row)
+            if len(chunk) == CHUNK_SIZE:
+                posted += len(post(chunk))
+                chunk = []
+        if chunk:
+            posted += len(post(chunk))
+        return posted
@@ -0,0 +1,26 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from payments import payouts
+from payments.models import PayoutBatch
+
+class Command(BaseCommand):
+    help = 'Write the provider payout file of one payout method in a batch'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('batch_id', help='Payout batch id')
+        parser.add_argument('--method', required=True, choices=sorted(payouts.EXPORT_COLUMNS))
+        parser.add_argument('--output', help='File to write (default: standard output)')
+    
+    def handle(self, *args, **options):
+        try:
+            batch = PayoutBatch.objects.get(pk=options['batch_id'])
+        except (PayoutBatch.DoesNotExist, ValidationError):
+            raise CommandError(f"Payout batch {options['batch_id']} not found")
+        
+        lines = payouts.export_lines(batch, options['method'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
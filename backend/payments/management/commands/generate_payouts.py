@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+from payments import payouts
+
+class Command(BaseCommand):
+    help = 'Generate (or resume) the instructor payout batch of a month'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            help='Month to pay out as YYYY-MM (default: the previous month)',
+        )
+    
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                year, month = (int(part) for part in options['month'].split('-'))
+                period_start, period_end = payouts.month_period(year, month)
+            except ValueError:
+                raise CommandError(f"Invalid month: {options['month']}")
+        else:
+            period_start, period_end = payouts.previous_month()
+        
+        batch, skipped = payouts.generate(period_start, period_end)
+        
+        by_method = batch.payouts.values('payout_method').annotate(count=Count('id'), total=Sum('amount'))
+        for row in by_method.order_by('payout_method'):
+            self.stdout.write(f"{row['payout_method']}: {row['count']} payouts, {row['total']}")
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'{skipped} instructors have no payout details and were left out'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Batch {batch.id}: {batch.payout_count} payouts totalling {batch.total_amount}'
+        ))
@@ -37,16 +37,57 @@ class Payment(models.Model):
     transaction_id = models.CharField(max_length=200, blank=True, null=True)
     failure_reason = models.TextField(blank=True)
     
+    # Coupon applied at checkout and whether this payment still holds the
+    # use reserved for it, see coupons.release_reservations
+    coupon_code = models.CharField(max_length=50, blank=True)
+    coupon_reserved = models.BooleanField(default=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(blank=True, null=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+            models.Index(fields=['stripe_payment_intent_id']),
+            models.Index(fields=['coupon_reserved', 'created_at']),
+        ]
     
     def __str__(self):
         return f"Payment {self.id} - {self.user.email} - {self.course.title}"
 
+class StripeEvent(models.Model):
+    """Webhook event as received from Stripe, see stripe_events.py"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payment_intent_id = models.CharField(max_length=200, blank=True)
+    stripe_created = models.BigIntegerField(default=0)  # Unix time Stripe created the event
+    payload = models.JSONField()
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'stripe_created']),
+            models.Index(fields=['payment_intent_id', 'stripe_created']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} {self.event_id}"
+
 class Coupon(models.Model):
     DISCOUNT_TYPE_CHOICES = [
         ('percentage', 'Percentage'),
@@ -99,6 +140,32 @@ class CouponUsage(models.Model):
     def __str__(self):
         return f"{self.coupon.code} used by {self.user.email}"
 
+class PayoutBatch(models.Model):
+    """Payouts generated together for a period, see payouts.py"""
+    STATUS_CHOICES = [
+        ('generating', 'Generating'),
+        ('generated', 'Generated'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='generating')
+    payout_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-period_end']
+        unique_together = ['period_start', 'period_end']
+    
+    def __str__(self):
+        return f"Payouts {self.period_start:%Y-%m-%d} - {self.period_end:%Y-%m-%d}"
+
 class InstructorPayout(models.Model):
     PAYOUT_STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -107,14 +174,26 @@ class InstructorPayout(models.Model):
         ('failed', 'Failed'),
     ]
     
+    PAYOUT_METHOD_CHOICES = [
+        ('bank', 'Bank Transfer'),
+        ('mobile_money', 'Mobile Money'),
+        ('paypal', 'PayPal'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     instructor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payouts')
+    batch = models.ForeignKey(PayoutBatch, on_delete=models.PROTECT, null=True, blank=True, related_name='payouts')
     
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, default='USD')
     
     payout_status = models.CharField(max_length=20, choices=PAYOUT_STATUS_CHOICES, default='pending')
     
+    # Payout details of the instructor when the payout was generated
+    payout_method = models.CharField(max_length=20, choices=PAYOUT_METHOD_CHOICES, blank=True)
+    payout_account = models.CharField(max_length=100, blank=True)
+    payout_bank = models.CharField(max_length=100, blank=True)
+    
     stripe_transfer_id = models.CharField(max_length=200, blank=True, null=True)
     failure_reason = models.TextField(blank=True)
     
@@ -124,5 +203,77 @@ class InstructorPayout(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(blank=True, null=True)
     
+    class Meta:
+        unique_together = ['batch', 'instructor']
+        indexes = [
+            models.Index(fields=['batch', 'payout_method', 'instructor']),
+        ]
+    
     def __str__(self):
         return f"Payout {self.id} - {self.instructor.email} - ${self.amount}"
+
+class LedgerEntry(models.Model):
+    """Append-only instructor revenue ledger, see ledger.py"""
+    ENTRY_TYPE_CHOICES = [
+        ('sale', 'Sale'),
+        ('platform_fee', 'Platform Fee'),
+        ('refund', 'Refund'),
+        ('fee_refund', 'Platform Fee Refund'),
+        ('payout', 'Payout'),
+        ('payout_paid', 'Payout Paid'),
+        ('payout_failed', 'Payout Failed'),
+    ]
+    
+    SOURCE_CHOICES = [
+        ('payment', 'Payment'),
+        ('mobile_money', 'Mobile Money'),
+        ('payout', 'Payout'),
+    ]
+    
+    instructor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_entries')
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPE_CHOICES)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    source_id = models.CharField(max_length=100)
+    # Makes posting the same sale or refund twice a no-op
+    reference = models.CharField(max_length=150, unique=True, null=True, blank=True)
+    
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['instructor', '-created_at', '-id']),
+            models.Index(fields=['source', 'source_id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_entry_type_display()} {self.amount} for {self.instructor_id}"
+
+class InstructorBalance(models.Model):
+    """Running totals of an instructor's ledger entries"""
+    instructor = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='revenue_balance')
+    
+    gross_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    refunds = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    platform_fees = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_payout = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid_out = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    available = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Balance of {self.instructor_id}: {self.available}"
+    
+    @property
+    def total_revenue(self):
+        return self.gross_revenue - self.refunds
+    
+    @property
+    def earnings(self):
+        return self.gross_revenue - self.refunds - self.platform_fees
@@ -0,0 +1,211 @@
+"""
+Payout batches.
+
+Instructor payouts used to be created by hand. ``generate`` creates a
+``PayoutBatch`` for a period and pays every instructor what they earned up
+to the end of the period and have not been paid yet:
+
+* the payable amount is the instructor's ledger balance (see ledger.py) less
+  whatever was earned after the period ended, so only ledger entries newer
+  than ``period_end`` are read
+* instructors are walked in chunks of ``CHUNK_SIZE`` by id; each chunk locks
+  the batch and the chunk's balances, skips instructors already paid in the
+  batch, creates the payouts with one INSERT, holds their amounts in the
+  ledger and commits on its own
+
+A run that stops part way is resumed by running it again, and running it
+twice creates nothing new. Each payout keeps the instructor's payout method
+and account as they were at generation. ``export_lines`` streams the payouts
+of one method as a provider upload file without loading the batch into
+memory.
+"""
+import csv
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import InstructorProfile
+
+from . import ledger
+from .models import InstructorBalance, InstructorPayout, LedgerEntry, PayoutBatch
+
+EXPORT_COLUMNS = {
+    'bank': ['payout_id', 'name', 'email', 'bank_name', 'account_number', 'amount', 'currency', 'reference'],
+    'mobile_money': ['payout_id', 'name', 'email', 'phone_number', 'amount', 'currency', 'reference'],
+    'paypal': ['payout_id', 'name', 'email', 'paypal_email', 'amount', 'currency', 'reference'],
+}
+
+
+def payout_settings():
+    return settings.PAYOUTS
+
+
+def earned_since(moment):
+    """Subquery: net earnings an instructor (``OuterRef('instructor')``) posted from ``moment`` on"""
+    signed_amount = Case(
+        *[
+            When(entry_type=entry_type, then=F('amount') * ledger.BUCKETS[entry_type]['available'])
+            for entry_type in ledger.EARNING_TYPES
+        ],
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    earned = (
+        LedgerEntry.objects.filter(
+            instructor=OuterRef('instructor'), created_at__gte=moment, entry_type__in=ledger.EARNING_TYPES
+        )
+        .order_by().values('instructor')
+        .annotate(total=Sum(signed_amount)).values('total')
+    )
+    return Coalesce(Subquery(earned), Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def payout_details(profile):
+    """``(method, account, bank)`` an instructor is paid with; account is blank if not set up"""
+    method = profile['preferred_payout_method']
+    if method == 'bank':
+        return method, profile['bank_account_number'], profile['bank_name']
+    if method == 'mobile_money':
+        return method, profile['mobile_money_number'], ''
+    return method, profile['user__email'], ''
+
+
+def month_period(year, month):
+    """Start and end (exclusive) of a calendar month in the current time zone"""
+    start = timezone.make_aware(datetime(year, month, 1))
+    end = timezone.make_aware(datetime(year + month // 12, month % 12 + 1, 1))
+    return start, end
+
+
+def previous_month(now=None):
+    now = timezone.localtime(now)
+    year, month = (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+    return month_period(year, month)
+
+
+def get_batch(period_start, period_end, created_by=None):
+    batch, _ = PayoutBatch.objects.get_or_create(
+        period_start=period_start, period_end=period_end, defaults={'created_by': created_by}
+    )
+    return batch
+
+
+def generate(period_start, period_end, created_by=None):
+    """
+    Create (or complete) the payout batch of a period. Returns the batch and
+    how many instructors were left out for missing payout details.
+    """
+    batch = get_batch(period_start, period_end, created_by)
+    options = payout_settings()
+    minimum = Decimal(str(options['MINIMUM_AMOUNT']))
+    
+    skipped = 0
+    last_id = None
+    while True:
+        candidates = InstructorBalance.objects.filter(available__gte=minimum).order_by('instructor_id')
+        if last_id is not None:
+            candidates = candidates.filter(instructor_id__gt=last_id)
+        instructor_ids = list(candidates.values_list('instructor_id', flat=True)[:options['CHUNK_SIZE']])
+        if not instructor_ids:
+            break
+        last_id = instructor_ids[-1]
+        skipped += generate_chunk(batch, instructor_ids, minimum)
+    
+    totals = batch.payouts.aggregate(total=Sum('amount'))
+    batch.payout_count = batch.payouts.count()
+    batch.total_amount = totals['total'] or Decimal('0')
+    batch.status = 'generated'
+    batch.completed_at = timezone.now()
+    batch.save(update_fields=['payout_count', 'total_amount', 'status', 'completed_at'])
+    return batch, skipped
+
+
+def generate_chunk(batch, instructor_ids, minimum):
+    """Create the payouts of one chunk of instructors; returns how many lacked payout details"""
+    with transaction.atomic():
+        # Serialises concurrent runs over the same batch
+        PayoutBatch.objects.select_for_update().get(pk=batch.pk)
+        balances = list(
+            InstructorBalance.objects.select_for_update()
+            .filter(instructor_id__in=instructor_ids)
+            .annotate(earned_later=earned_since(batch.period_end))
+            .order_by('instructor_id')
+        )
+        done = set(
+            InstructorPayout.objects.filter(batch=batch, instructor_id__in=instructor_ids)
+            .values_list('instructor_id', flat=True)
+        )
+        profiles = {
+            profile['user_id']: profile
+            for profile in InstructorProfile.objects.filter(user_id__in=instructor_ids).values(
+                'user_id', 'user__email', 'preferred_payout_method', 'bank_account_number', 'bank_name',
+                'mobile_money_number',
+            )
+        }
+        
+        payouts = []
+        skipped = 0
+        for balance in balances:
+            if balance.instructor_id in done:
+                continue
+            # Refunds after the period can leave less available than was earned in it
+            amount = min(balance.available, balance.available - balance.earned_later)
+            if amount < minimum:
+                continue
+            profile = profiles.get(balance.instructor_id)
+            method, account, bank = payout_details(profile) if profile else ('', '', '')
+            if not account:
+                skipped += 1
+                continue
+            payouts.append(InstructorPayout(
+                batch=batch,
+                instructor_id=balance.instructor_id,
+                amount=amount,
+                payout_method=method,
+                payout_account=account,
+                payout_bank=bank,
+                period_start=batch.period_start,
+                period_end=batch.period_end,
+            ))
+        
+        # bulk_create skips the post_save receiver that posts payout holds
+        InstructorPayout.objects.bulk_create(payouts)
+        ledger.record_payouts([(payout, None) for payout in payouts])
+    return skipped
+
+
+class Echo:
+    """File-like object handing back what is written, for streaming csv"""
+    
+    def write(self, value):
+        return value
+
+
+def export_rows(batch, method):
+    """The header and one row per payout of ``method`` in the batch"""
+    yield EXPORT_COLUMNS[method]
+    payouts = (
+        batch.payouts.filter(payout_method=method).order_by('instructor_id')
+        .values_list(
+            'id', 'instructor__first_name', 'instructor__last_name', 'instructor__email',
+            'payout_bank', 'payout_account', 'amount', 'currency',
+        )
+    )
+    reference = f"LearnHub {timezone.localtime(batch.period_start):%Y-%m}"
+    for payout_id, first_name, last_name, email, bank, account, amount, currency in payouts.iterator(chunk_size=1000):
+        name = f"{first_name} {last_name}".strip()
+        if method == 'bank':
+            yield [payout_id, name, email, bank, account, amount, currency, reference]
+        else:
+            yield [payout_id, name, email, account, amount, currency, reference]
+
+
+def export_lines(batch, method):
+    """The provider file of ``method`` as csv lines"""
+    writer = csv.writer(Echo())
+    for row in export_rows(batch, method):
+        yield writer.writerow(row)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Payment, Coupon, CouponUsage, InstructorPayout
+from .models import Payment, Coupon, CouponUsage, InstructorPayout, LedgerEntry
 
 class PaymentSerializer(serializers.ModelSerializer):
     course_title = serializers.CharField(source='course.title', read_only=True)
@@ -18,29 +18,29 @@ class CouponSerializer(serializers.ModelSerializer):
 
 class CouponValidationSerializer(serializers.Serializer):
     code = serializers.CharField(max_length=50)
-    course_id = serializers.UUIDField()
+    course_id = serializers.UUIDField(required=False)
+    course_ids = serializers.ListField(child=serializers.UUIDField(), required=False, allow_empty=False, max_length=100)
     
     def validate(self, attrs):
-        from django.utils import timezone
-        from courses.models import Course
+        from .coupons import CouponError, evaluate_cart
         
-        try:
-            coupon = Coupon.objects.get(code=attrs['code'])
-            course = Course.objects.get(id=attrs['course_id'])
-        except (Coupon.DoesNotExist, Course.DoesNotExist):
-            raise serializers.ValidationError("Invalid coupon or course")
-        
-        if not coupon.is_valid:
-            raise serializers.ValidationError("Coupon is not valid or has expired")
+        if 'course_ids' in attrs:
+            course_ids = attrs['course_ids']
+        elif 'course_id' in attrs:
+            course_ids = [attrs['course_id']]
+        else:
+            raise serializers.ValidationError("course_id or course_ids is required")
         
-        if coupon.applicable_courses.exists() and course not in coupon.applicable_courses.all():
-            raise serializers.ValidationError("Coupon is not applicable to this course")
+        try:
+            cart = evaluate_cart(attrs['code'], course_ids)
+        except CouponError as e:
+            raise serializers.ValidationError(str(e))
         
-        if course.price < coupon.minimum_amount:
-            raise serializers.ValidationError(f"Minimum purchase amount is ${coupon.minimum_amount}")
+        # A cart reports each course's problem on its line instead
+        if 'course_ids' not in attrs and cart.lines[0].error:
+            raise serializers.ValidationError(cart.lines[0].error)
         
-        attrs['coupon'] = coupon
-        attrs['course'] = course
+        attrs['cart'] = cart
         return attrs
 
 class InstructorPayoutSerializer(serializers.ModelSerializer):
@@ -50,3 +50,10 @@ class InstructorPayoutSerializer(serializers.ModelSerializer):
         model = InstructorPayout
         fields = '__all__'
         read_only_fields = ('id', 'instructor', 'created_at', 'processed_at')
+
+class LedgerEntrySerializer(serializers.ModelSerializer):
+    course_title = serializers.CharField(source='course.title', read_only=True, default=None)
+    
+    class Meta:
+        model = LedgerEntry
+        fields = ('id', 'entry_type', 'source', 'source_id', 'course', 'course_title', 'amount', 'balance_after', 'created_at')
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import coupons, ledger
+from .models import Coupon, InstructorPayout
+
+# Sent after commit with the ``payments`` completed in bulk by
+# stripe_events.apply_updates, which bypasses post_save
+payments_completed = Signal()
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+@receiver(m2m_changed, sender=Coupon.applicable_courses.through)
+def coupon_changed(sender, **kwargs):
+    """Recompile coupon rules everywhere once an edit is committed"""
+    transaction.on_commit(coupons.invalidate)
+
+
+@receiver(pre_save, sender=InstructorPayout)
+def remember_payout_status(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        instance._previous_status = None
+        return
+    instance._previous_status = InstructorPayout.objects.filter(pk=instance.pk).values_list(
+        'payout_status', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=InstructorPayout)
+def post_payout_entries(sender, instance, created, raw=False, **kwargs):
+    """Hold requested payouts in the ledger and settle them as their status changes"""
+    if raw:
+        return
+    previous_status = None if created else getattr(instance, '_previous_status', instance.payout_status)
+    if previous_status != instance.payout_status:
+        ledger.record_payouts([(instance, previous_status)])
@@ -0,0 +1,320 @@
+"""
+Stripe webhook event store.
+
+``stripe_webhook`` verifies the signature, inserts the event into
+``StripeEvent`` (unique on Stripe's event id, so redeliveries are dropped)
+and answers straight away. The ``process_stripe_events`` task drains the
+store in batches:
+
+* pending events are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` in
+  the order Stripe created them; a PaymentIntent whose earlier events are
+  held by another worker is left for later, so each intent's events are
+  applied in order
+* the batch's payments are loaded and locked with one query, and events
+  move them along ``TRANSITIONS`` only, so a late ``payment_failed`` can
+  no longer undo a ``succeeded``
+* payments are written back with one ``bulk_update``; newly completed ones
+  get their enrollments, coupon usages and ledger entries in bulk, refunds
+  are reversed in the ledger (a partial refund leaves the payment
+  completed), and failed or cancelled ones give back the coupon use
+  reserved for them
+
+If a batch fails it is retried one PaymentIntent at a time, so a bad event
+only holds up its own intent; it is marked ``failed`` after
+``MAX_ATTEMPTS``.
+"""
+import logging
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from courses.enrollments import create_paid_enrollments
+from courses.models import Course
+
+from . import coupons as coupon_rules, ledger
+from .models import Coupon, CouponUsage, Payment, StripeEvent
+from .signals import payments_completed
+
+logger = logging.getLogger(__name__)
+
+# Payment status each handled event type moves a payment to
+EVENT_STATUSES = {
+    'payment_intent.processing': 'processing',
+    'payment_intent.succeeded': 'completed',
+    'payment_intent.payment_failed': 'failed',
+    'payment_intent.canceled': 'cancelled',
+    # Partial refunds stay completed, see apply_updates
+    'charge.refunded': 'refunded',
+}
+
+# Statuses a payment may move to from each status
+TRANSITIONS = {
+    'pending': {'processing', 'completed', 'failed', 'cancelled'},
+    'processing': {'completed', 'failed', 'cancelled'},
+    # A failed intent can be retried with another payment method
+    'failed': {'processing', 'completed', 'cancelled'},
+    'completed': {'refunded'},
+    'cancelled': set(),
+    'refunded': set(),
+}
+
+PAYMENT_FIELDS = [
+    'payment_status', 'completed_at', 'stripe_charge_id', 'failure_reason',
+    'coupon_code', 'coupon_reserved', 'updated_at',
+]
+
+
+def event_settings():
+    return settings.STRIPE_EVENTS
+
+
+def payment_intent_id(event):
+    obj = event['data']['object']
+    if obj.get('object') == 'payment_intent':
+        return obj['id']
+    return obj.get('payment_intent') or ''
+
+
+def charge_id(obj):
+    """Charge id of a PaymentIntent or Charge object"""
+    if obj.get('object') == 'charge':
+        return obj['id']
+    if obj.get('latest_charge'):
+        return obj['latest_charge']
+    charges = (obj.get('charges') or {}).get('data') or []
+    return charges[0]['id'] if charges else None
+
+
+def store_event(event):
+    """Persist a verified webhook event; redeliveries are ignored"""
+    handled = event['type'] in EVENT_STATUSES
+    StripeEvent.objects.bulk_create([
+        StripeEvent(
+            event_id=event['id'],
+            event_type=event['type'],
+            payment_intent_id=payment_intent_id(event) if handled else '',
+            stripe_created=event.get('created') or 0,
+            payload=event,
+            status='pending' if handled else 'ignored',
+        )
+    ], ignore_conflicts=True)
+    
+    if handled:
+        from .tasks import process_stripe_events
+        transaction.on_commit(process_stripe_events.delay)
+
+
+def apply_updates(updates):
+    """
+    Apply ``[(payment, status, stripe_object), ...]`` to locked payments, in
+    order, and return the payments that became completed.
+    
+    Moves not allowed by ``TRANSITIONS`` are skipped. Changed payments are
+    saved with one ``bulk_update``.
+    """
+    now = timezone.now()
+    changed = {}
+    completed = {}
+    refunded = {}
+    coupons = {}
+    released = []
+    for payment, status, obj in updates:
+        if status == 'refunded' and not fully_refunded(obj):
+            if payment.payment_status == 'completed':
+                refunded[payment.pk] = (payment, refunded_amount(obj))
+            continue
+        if status not in TRANSITIONS[payment.payment_status]:
+            continue
+        payment.payment_status = status
+        payment.updated_at = now
+        if not payment.coupon_code:
+            # Intents created before reservations were recorded on the payment
+            metadata = obj.get('metadata') or {}
+            payment.coupon_code = metadata.get('coupon_code') or ''
+            payment.coupon_reserved = bool(payment.coupon_code and metadata.get('coupon_reserved'))
+        if status == 'completed':
+            payment.completed_at = now
+            payment.stripe_charge_id = charge_id(obj) or payment.stripe_charge_id
+            payment.failure_reason = ''
+            completed[payment.pk] = payment
+            coupons[payment.pk] = (payment.coupon_code, payment.coupon_reserved)
+            payment.coupon_reserved = False
+        elif status == 'failed':
+            payment.failure_reason = (obj.get('last_payment_error') or {}).get('message', '')
+        elif status == 'refunded':
+            refunded[payment.pk] = (payment, payment.amount)
+        if status in ('failed', 'cancelled') and payment.coupon_reserved:
+            # A failed intent may still be retried; if it then succeeds its
+            # use is counted as one that was never reserved
+            released.append(payment.coupon_code)
+            payment.coupon_reserved = False
+        changed[payment.pk] = payment
+    
+    if refunded:
+        ledger.record_refunds(
+            'payment',
+            [payment for payment, _ in refunded.values()],
+            {payment.pk: amount for payment, amount in refunded.values()},
+        )
+    if not changed:
+        return []
+    Payment.objects.bulk_update(changed.values(), PAYMENT_FIELDS)
+    if released:
+        coupon_rules.release(released)
+    
+    completed = [payment for payment in completed.values() if payment.payment_status == 'completed']
+    if completed:
+        create_paid_enrollments(completed)
+        record_coupon_usage(completed, coupons)
+        ledger.record_sales('payment', completed)
+        transaction.on_commit(lambda: payments_completed.send(sender=Payment, payments=completed))
+    return completed
+
+
+def fully_refunded(obj):
+    """Whether a Charge object has been refunded in full"""
+    return bool(obj.get('refunded')) or obj.get('amount_refunded', 0) >= obj.get('amount', 0)
+
+
+def refunded_amount(obj):
+    """Amount refunded so far on a Charge object; Stripe amounts are in cents"""
+    return Decimal(obj.get('amount_refunded') or 0) / 100
+
+
+def record_coupon_usage(payments, coupons):
+    """
+    Record the coupon usages of completed payments. Uses were counted when
+    their intents were created (see coupons.reserve); those never reserved
+    or given back before the payment completed are counted here.
+    """
+    by_code = Coupon.objects.in_bulk({code for code, _ in coupons.values() if code}, field_name='code')
+    payments = [payment for payment in payments if coupons[payment.pk][0] in by_code]
+    if not payments:
+        return
+    
+    prices = dict(Course.objects.filter(
+        id__in={payment.course_id for payment in payments}
+    ).values_list('id', 'price'))
+    usages = [
+        CouponUsage(
+            coupon=by_code[coupons[payment.pk][0]],
+            user_id=payment.user_id,
+            payment=payment,
+            discount_amount=prices[payment.course_id] - payment.amount,
+        )
+        for payment in payments
+    ]
+    CouponUsage.objects.bulk_create(usages)
+    
+    per_coupon = defaultdict(int)
+    for payment, usage in zip(payments, usages):
+        if not coupons[payment.pk][1]:
+            per_coupon[usage.coupon_id] += 1
+    for coupon_id, count in per_coupon.items():
+        Coupon.objects.filter(pk=coupon_id).update(used_count=F('used_count') + count)
+
+
+def claim_batch(batch_size):
+    """Lock pending events, leaving out intents with earlier events held elsewhere"""
+    events = list(
+        StripeEvent.objects.select_for_update(skip_locked=True)
+        .filter(status='pending')
+        .order_by('stripe_created', 'received_at')[:batch_size]
+    )
+    latest = {}
+    for event in events:
+        latest[event.payment_intent_id] = event.stripe_created
+    
+    earlier_elsewhere = set(
+        StripeEvent.objects.filter(status='pending', payment_intent_id__in=list(latest))
+        .exclude(id__in=[event.id for event in events])
+        .values('payment_intent_id')
+        .annotate(first=Min('stripe_created'))
+        .values_list('payment_intent_id', 'first')
+    )
+    held = {intent for intent, first in earlier_elsewhere if first < latest[intent]}
+    return [event for event in events if event.payment_intent_id not in held]
+
+
+def apply_events(events):
+    """Apply claimed events (in creation order) and mark them processed"""
+    if not events:
+        return
+    payments = {
+        payment.stripe_payment_intent_id: payment
+        for payment in Payment.objects.select_for_update().filter(
+            stripe_payment_intent_id__in={event.payment_intent_id for event in events}
+        )
+    }
+    
+    updates = []
+    now = timezone.now()
+    for event in events:
+        payment = payments.get(event.payment_intent_id)
+        if payment is None:
+            event.status = 'ignored'
+            event.last_error = 'No payment for this PaymentIntent'
+        else:
+            updates.append((payment, EVENT_STATUSES[event.event_type], event.payload['data']['object']))
+            event.status = 'processed'
+        event.processed_at = now
+    
+    apply_updates(updates)
+    StripeEvent.objects.bulk_update(events, ['status', 'last_error', 'processed_at'])
+
+
+def record_failure(event_ids, error):
+    StripeEvent.objects.filter(id__in=event_ids).update(attempts=F('attempts') + 1, last_error=str(error))
+    StripeEvent.objects.filter(
+        id__in=event_ids, attempts__gte=event_settings()['MAX_ATTEMPTS']
+    ).update(status='failed')
+
+
+def process_batch(batch_size=None):
+    """Apply one batch of pending events; returns how many were claimed"""
+    batch_size = batch_size or event_settings()['BATCH_SIZE']
+    claimed = []
+    try:
+        with transaction.atomic():
+            claimed = claim_batch(batch_size)
+            apply_events(claimed)
+        return len(claimed)
+    except Exception:
+        if not claimed:
+            raise
+        logger.exception('Stripe event batch failed, retrying one PaymentIntent at a time')
+    
+    by_intent = defaultdict(list)
+    for event in claimed:
+        by_intent[event.payment_intent_id].append(event.id)
+    for event_ids in by_intent.values():
+        try:
+            with transaction.atomic():
+                events = list(
+                    StripeEvent.objects.select_for_update(skip_locked=True)
+                    .filter(id__in=event_ids, status='pending')
+                    .order_by('stripe_created', 'received_at')
+                )
+                apply_events(events)
+        except Exception as e:
+            logger.exception('Stripe events %s failed', event_ids)
+            record_failure(event_ids, e)
+    return len(claimed)
+
+
+def process_pending(max_seconds=None):
+    """Apply pending events batch by batch until none are left or the time is up"""
+    max_seconds = max_seconds or event_settings()['MAX_RUN_SECONDS']
+    deadline = time.monotonic() + max_seconds
+    total = 0
+    while time.monotonic() < deadline:
+        claimed = process_batch()
+        total += claimed
+        if not claimed:
+            break
+    return total
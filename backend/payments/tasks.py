@@ -0,0 +1,23 @@
+from celery import shared_task
+
+from . import coupons, payouts, stripe_events
+
+
+@shared_task(ignore_result=True)
+def process_stripe_events():
+    """Apply stored Stripe webhook events in batches"""
+    return stripe_events.process_pending()
+
+
+@shared_task(ignore_result=True)
+def generate_monthly_payouts():
+    """Generate the payout batch of the previous calendar month; safe to rerun"""
+    period_start, period_end = payouts.previous_month()
+    batch, skipped = payouts.generate(period_start, period_end)
+    return batch.payout_count
+
+
+@shared_task(ignore_result=True)
+def release_stale_coupon_reservations():
+    """Give back coupon uses reserved for abandoned checkouts"""
+    return coupons.release_stale()
@@ -0,0 +1,120 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from courses.models import Category, Course
+from payments import coupons
+from payments.models import Coupon, Payment
+
+User = get_user_model()
+
+
+@override_settings(COUPON_RESERVATIONS={'MAX_AGE_HOURS': 2})
+class CouponReservationTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        instructor = User.objects.create_user(
+            email='instructor@example.com', username='instructor', password='x', user_type='instructor'
+        )
+        cls.student = User.objects.create_user(email='student@example.com', username='student', password='x')
+        category = Category.objects.create(name='Data', slug='data')
+        cls.course = Course.objects.create(
+            title='SQL', description='d', instructor=instructor, category=category, price=Decimal('100.00')
+        )
+    
+    def setUp(self):
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(
+            code='SAVE20', discount_type='percentage', discount_value=Decimal('20'), usage_limit=2,
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+        coupons.invalidate()
+    
+    def used_count(self):
+        self.coupon.refresh_from_db()
+        return self.coupon.used_count
+    
+    def reserved_payment(self, **fields):
+        return Payment.objects.create(
+            user=self.student, course=self.course, amount=Decimal('80.00'),
+            coupon_code=self.coupon.code, coupon_reserved=True, **fields
+        )
+    
+    def test_reserve_stops_at_the_usage_limit(self):
+        rule = coupons.get_rule('SAVE20')
+        coupons.reserve(rule)
+        coupons.reserve(rule)
+        
+        with self.assertRaises(coupons.CouponError):
+            coupons.reserve(rule)
+        self.assertEqual(self.used_count(), 2)
+    
+    def test_used_up_coupon_is_rejected_after_a_failed_reserve(self):
+        rule = coupons.get_rule('SAVE20')
+        Coupon.objects.filter(pk=self.coupon.pk).update(used_count=2)
+        
+        with self.assertRaises(coupons.CouponError):
+            coupons.reserve(rule)
+        with self.assertRaises(coupons.CouponError):
+            coupons.get_rule('SAVE20')
+    
+    def test_reserve_rejects_an_expired_coupon(self):
+        rule = coupons.get_rule('SAVE20')
+        Coupon.objects.filter(pk=self.coupon.pk).update(valid_until=timezone.now() - timedelta(minutes=1))
+        
+        with self.assertRaises(coupons.CouponError):
+            coupons.reserve(rule)
+        self.assertEqual(self.used_count(), 0)
+    
+    def test_unknown_code_is_rejected(self):
+        with self.assertRaises(coupons.CouponError):
+            coupons.get_rule('NOPE')
+    
+    def test_release_gives_uses_back_and_recompiles_rules(self):
+        Coupon.objects.filter(pk=self.coupon.pk).update(used_count=2)
+        coupons.invalidate()
+        with self.assertRaises(coupons.CouponError):
+            coupons.get_rule('SAVE20')
+        
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            coupons.release(['SAVE20', 'SAVE20'])
+        
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.used_count(), 0)
+        self.assertEqual(coupons.get_rule('SAVE20').used_count, 0)
+    
+    def test_release_never_goes_below_zero(self):
+        coupons.release(['SAVE20'])
+        
+        self.assertEqual(self.used_count(), 0)
+    
+    def test_reservation_is_released_once(self):
+        Coupon.objects.filter(pk=self.coupon.pk).update(used_count=1)
+        payment = self.reserved_payment()
+        
+        self.assertEqual(coupons.release_reservations(Payment.objects.filter(pk=payment.pk)), 1)
+        self.assertEqual(coupons.release_reservations(Payment.objects.filter(pk=payment.pk)), 0)
+        self.assertEqual(self.used_count(), 0)
+        payment.refresh_from_db()
+        self.assertFalse(payment.coupon_reserved)
+    
+    def test_release_stale_only_releases_abandoned_checkouts(self):
+        Coupon.objects.filter(pk=self.coupon.pk).update(used_count=2)
+        stale = self.reserved_payment()
+        Payment.objects.filter(pk=stale.pk).update(created_at=timezone.now() - timedelta(hours=3))
+        self.reserved_payment()
+        
+        self.assertEqual(coupons.release_stale(), 1)
+        self.assertEqual(self.used_count(), 1)
+    
+    def test_release_stale_leaves_completed_payments_alone(self):
+        Coupon.objects.filter(pk=self.coupon.pk).update(used_count=1)
+        payment = self.reserved_payment(payment_status='completed')
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(hours=3))
+        
+        self.assertEqual(coupons.release_stale(), 0)
+        self.assertEqual(self.used_count(), 1)
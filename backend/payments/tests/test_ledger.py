@@ -0,0 +1,139 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from courses.models import Category, Course
+from payments import ledger
+from payments.models import InstructorPayout, LedgerEntry, Payment
+
+User = get_user_model()
+
+
+@override_settings(REVENUE_LEDGER={'PLATFORM_FEE_PERCENT': '30'})
+class LedgerTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user(
+            email='instructor@example.com', username='instructor', password='x', user_type='instructor'
+        )
+        cls.student = User.objects.create_user(email='student@example.com', username='student', password='x')
+        category = Category.objects.create(name='Data', slug='data')
+        cls.course = Course.objects.create(
+            title='SQL', description='d', instructor=cls.instructor, category=category, price=Decimal('100.00')
+        )
+    
+    def payment(self, amount='100.00'):
+        return Payment.objects.create(
+            user=self.student, course=self.course, amount=Decimal(amount), payment_status='completed'
+        )
+    
+    def balance(self):
+        return ledger.get_balance(self.instructor)
+    
+    def test_sale_posts_sale_and_platform_fee(self):
+        ledger.record_sales('payment', [self.payment()])
+        
+        balance = self.balance()
+        self.assertEqual(balance.gross_revenue, Decimal('100.00'))
+        self.assertEqual(balance.platform_fees, Decimal('30.00'))
+        self.assertEqual(balance.available, Decimal('70.00'))
+        entries = LedgerEntry.objects.order_by('id')
+        self.assertEqual([entry.entry_type for entry in entries], ['sale', 'platform_fee'])
+        self.assertEqual([entry.balance_after for entry in entries], [Decimal('100.00'), Decimal('70.00')])
+    
+    def test_sale_is_posted_once(self):
+        payment = self.payment()
+        ledger.record_sales('payment', [payment])
+        
+        self.assertEqual(ledger.record_sales('payment', [payment]), [])
+        self.assertEqual(LedgerEntry.objects.count(), 2)
+        self.assertEqual(self.balance().available, Decimal('70.00'))
+    
+    def test_full_refund_reverses_sale_and_fee(self):
+        payment = self.payment()
+        ledger.record_sales('payment', [payment])
+        ledger.record_refunds('payment', [payment])
+        ledger.record_refunds('payment', [payment])
+        
+        balance = self.balance()
+        self.assertEqual(balance.refunds, Decimal('100.00'))
+        self.assertEqual(balance.platform_fees, Decimal('0.00'))
+        self.assertEqual(balance.available, Decimal('0.00'))
+        self.assertEqual(LedgerEntry.objects.filter(entry_type__in=['refund', 'fee_refund']).count(), 2)
+    
+    def test_partial_refunds_add_up_to_the_full_reversal(self):
+        payment = self.payment()
+        ledger.record_sales('payment', [payment])
+        
+        ledger.record_refunds('payment', [payment], {payment.id: Decimal('25.00')})
+        balance = self.balance()
+        self.assertEqual(balance.refunds, Decimal('25.00'))
+        self.assertEqual(balance.platform_fees, Decimal('22.50'))
+        self.assertEqual(balance.available, Decimal('52.50'))
+        
+        # Redelivered: nothing new was refunded
+        ledger.record_refunds('payment', [payment], {payment.id: Decimal('25.00')})
+        self.assertEqual(self.balance().refunds, Decimal('25.00'))
+        
+        ledger.record_refunds('payment', [payment])
+        balance = self.balance()
+        self.assertEqual(balance.refunds, Decimal('100.00'))
+        self.assertEqual(balance.platform_fees, Decimal('0.00'))
+        self.assertEqual(balance.available, Decimal('0.00'))
+    
+    def test_refund_without_a_posted_sale_is_skipped(self):
+        self.assertEqual(ledger.record_refunds('payment', [self.payment()]), [])
+        self.assertFalse(LedgerEntry.objects.exists())
+    
+    def test_payout_is_held_then_paid(self):
+        ledger.record_sales('payment', [self.payment()])
+        now = timezone.now()
+        payout = InstructorPayout.objects.create(
+            instructor=self.instructor, amount=Decimal('50.00'), period_start=now - timedelta(days=30), period_end=now
+        )
+        balance = self.balance()
+        self.assertEqual(balance.pending_payout, Decimal('50.00'))
+        self.assertEqual(balance.available, Decimal('20.00'))
+        
+        payout.payout_status = 'completed'
+        payout.save()
+        payout.save()
+        balance = self.balance()
+        self.assertEqual(balance.pending_payout, Decimal('0.00'))
+        self.assertEqual(balance.paid_out, Decimal('50.00'))
+        self.assertEqual(balance.available, Decimal('20.00'))
+    
+    def test_failed_payout_is_released(self):
+        ledger.record_sales('payment', [self.payment()])
+        now = timezone.now()
+        payout = InstructorPayout.objects.create(
+            instructor=self.instructor, amount=Decimal('50.00'), period_start=now - timedelta(days=30), period_end=now
+        )
+        payout.payout_status = 'failed'
+        payout.save()
+        
+        balance = self.balance()
+        self.assertEqual(balance.pending_payout, Decimal('0.00'))
+        self.assertEqual(balance.available, Decimal('70.00'))
+    
+    def test_payout_entry_types(self):
+        self.assertEqual(ledger.payout_entry_types(None, 'pending'), ['payout'])
+        self.assertEqual(ledger.payout_entry_types(None, 'completed'), ['payout', 'payout_paid'])
+        self.assertEqual(ledger.payout_entry_types('processing', 'failed'), ['payout_failed'])
+        self.assertEqual(ledger.payout_entry_types('failed', 'pending'), ['payout'])
+        self.assertEqual(ledger.payout_entry_types('completed', 'completed'), [])
+    
+    def test_rebuild_balances_matches_posted_totals(self):
+        payment = self.payment('59.99')
+        ledger.record_sales('payment', [payment])
+        ledger.record_refunds('payment', [payment], {payment.id: Decimal('10.00')})
+        posted = self.balance()
+        
+        ledger.rebuild_balances()
+        rebuilt = self.balance()
+        for field in ledger.BALANCE_FIELDS:
+            self.assertEqual(getattr(rebuilt, field), getattr(posted, field), field)
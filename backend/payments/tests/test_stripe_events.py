@@ -0,0 +1,216 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from courses.models import Category, Course, Enrollment
+from payments import ledger, stripe_events
+from payments.models import Coupon, CouponUsage, Payment, StripeEvent
+from payments.signals import payments_completed
+
+User = get_user_model()
+
+
+def event(event_id, event_type, intent_id, created, **fields):
+    if event_type.startswith('charge.'):
+        obj = {'object': 'charge', 'id': f'ch_{intent_id}', 'payment_intent': intent_id, **fields}
+    else:
+        obj = {'object': 'payment_intent', 'id': intent_id, **fields}
+    return {'id': event_id, 'type': event_type, 'created': created, 'data': {'object': obj}}
+
+
+@override_settings(
+    STRIPE_EVENTS={'BATCH_SIZE': 50, 'MAX_ATTEMPTS': 2, 'MAX_RUN_SECONDS': 10},
+    REVENUE_LEDGER={'PLATFORM_FEE_PERCENT': '30'},
+)
+class StripeEventTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user(
+            email='instructor@example.com', username='instructor', password='x', user_type='instructor'
+        )
+        cls.student = User.objects.create_user(email='student@example.com', username='student', password='x')
+        category = Category.objects.create(name='Data', slug='data')
+        cls.course = Course.objects.create(
+            title='SQL', description='d', instructor=cls.instructor, category=category, price=Decimal('100.00')
+        )
+    
+    def setUp(self):
+        patcher = mock.patch('payments.tasks.process_stripe_events.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def payment(self, intent_id='pi_1', **fields):
+        return Payment.objects.create(
+            user=self.student, course=self.course, amount=Decimal('100.00'),
+            stripe_payment_intent_id=intent_id, **fields
+        )
+    
+    def deliver(self, *events):
+        for stripe_event in events:
+            stripe_events.store_event(stripe_event)
+        stripe_events.process_pending()
+    
+    def status(self, payment):
+        payment.refresh_from_db()
+        return payment.payment_status
+    
+    def test_redelivered_event_is_stored_once(self):
+        self.payment()
+        stripe_events.store_event(event('evt_1', 'payment_intent.processing', 'pi_1', 1))
+        stripe_events.store_event(event('evt_1', 'payment_intent.processing', 'pi_1', 1))
+        
+        self.assertEqual(StripeEvent.objects.count(), 1)
+    
+    def test_unhandled_event_type_is_ignored(self):
+        stripe_events.store_event(event('evt_1', 'customer.created', 'cus_1', 1))
+        
+        self.assertEqual(StripeEvent.objects.get().status, 'ignored')
+    
+    def test_events_apply_in_stripe_order(self):
+        payment = self.payment()
+        # The failure of an earlier attempt arrives after the success
+        self.deliver(
+            event('evt_2', 'payment_intent.succeeded', 'pi_1', 2),
+            event('evt_1', 'payment_intent.payment_failed', 'pi_1', 1,
+                  last_payment_error={'message': 'Card declined'}),
+        )
+        
+        self.assertEqual(self.status(payment), 'completed')
+        self.assertEqual(payment.failure_reason, '')
+        self.assertEqual(set(StripeEvent.objects.values_list('status', flat=True)), {'processed'})
+    
+    def test_late_failure_does_not_undo_a_completed_payment(self):
+        payment = self.payment()
+        self.deliver(event('evt_1', 'payment_intent.succeeded', 'pi_1', 1))
+        self.deliver(event('evt_2', 'payment_intent.payment_failed', 'pi_1', 2))
+        
+        self.assertEqual(self.status(payment), 'completed')
+    
+    def test_failed_intent_can_still_complete(self):
+        payment = self.payment()
+        self.deliver(event('evt_1', 'payment_intent.payment_failed', 'pi_1', 1,
+                           last_payment_error={'message': 'Card declined'}))
+        self.assertEqual(self.status(payment), 'failed')
+        self.assertEqual(payment.failure_reason, 'Card declined')
+        
+        self.deliver(event('evt_2', 'payment_intent.succeeded', 'pi_1', 2, latest_charge='ch_9'))
+        self.assertEqual(self.status(payment), 'completed')
+        self.assertEqual(payment.stripe_charge_id, 'ch_9')
+    
+    def test_cancelled_payment_stays_cancelled(self):
+        payment = self.payment()
+        self.deliver(
+            event('evt_1', 'payment_intent.canceled', 'pi_1', 1),
+            event('evt_2', 'payment_intent.succeeded', 'pi_1', 2),
+        )
+        
+        self.assertEqual(self.status(payment), 'cancelled')
+        self.assertFalse(Enrollment.objects.exists())
+    
+    def test_event_without_a_payment_is_ignored(self):
+        self.deliver(event('evt_1', 'payment_intent.succeeded', 'pi_unknown', 1))
+        
+        stored = StripeEvent.objects.get()
+        self.assertEqual(stored.status, 'ignored')
+        self.assertEqual(stored.last_error, 'No payment for this PaymentIntent')
+    
+    def test_completion_enrolls_posts_the_sale_and_sends_payments_completed(self):
+        payment = self.payment()
+        received = []
+        
+        def receiver(sender, payments, **kwargs):
+            received.extend(payments)
+        
+        payments_completed.connect(receiver)
+        self.addCleanup(payments_completed.disconnect, receiver)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deliver(event('evt_1', 'payment_intent.succeeded', 'pi_1', 1))
+        
+        self.assertEqual([p.pk for p in received], [payment.pk])
+        self.assertTrue(Enrollment.objects.filter(user=self.student, course=self.course).exists())
+        self.assertEqual(ledger.get_balance(self.instructor).gross_revenue, Decimal('100.00'))
+    
+    def test_no_payments_completed_signal_without_a_completion(self):
+        self.payment()
+        received = []
+        
+        def receiver(sender, payments, **kwargs):
+            received.extend(payments)
+        
+        payments_completed.connect(receiver)
+        self.addCleanup(payments_completed.disconnect, receiver)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deliver(event('evt_1', 'payment_intent.processing', 'pi_1', 1))
+        
+        self.assertEqual(received, [])
+    
+    def test_partial_refund_keeps_the_payment_completed(self):
+        payment = self.payment()
+        self.deliver(event('evt_1', 'payment_intent.succeeded', 'pi_1', 1))
+        self.deliver(event('evt_2', 'charge.refunded', 'pi_1', 2, amount=10000, amount_refunded=2500, refunded=False))
+        
+        self.assertEqual(self.status(payment), 'completed')
+        self.assertEqual(ledger.get_balance(self.instructor).refunds, Decimal('25.00'))
+        
+        self.deliver(event('evt_3', 'charge.refunded', 'pi_1', 3, amount=10000, amount_refunded=10000, refunded=True))
+        self.assertEqual(self.status(payment), 'refunded')
+        balance = ledger.get_balance(self.instructor)
+        self.assertEqual(balance.refunds, Decimal('100.00'))
+        self.assertEqual(balance.available, Decimal('0.00'))
+    
+    def test_completion_records_the_coupon_use(self):
+        now = timezone.now()
+        coupon = Coupon.objects.create(
+            code='SAVE20', discount_type='percentage', discount_value=Decimal('20'), usage_limit=5, used_count=1,
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+        payment = self.payment(coupon_code='SAVE20', coupon_reserved=True)
+        self.deliver(event('evt_1', 'payment_intent.succeeded', 'pi_1', 1))
+        
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 1)
+        self.assertTrue(CouponUsage.objects.filter(coupon=coupon, payment=payment).exists())
+        payment.refresh_from_db()
+        self.assertFalse(payment.coupon_reserved)
+    
+    def test_failure_releases_the_reserved_coupon_use(self):
+        now = timezone.now()
+        coupon = Coupon.objects.create(
+            code='SAVE20', discount_type='percentage', discount_value=Decimal('20'), usage_limit=5, used_count=1,
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+        payment = self.payment(coupon_code='SAVE20', coupon_reserved=True)
+        self.deliver(event('evt_1', 'payment_intent.payment_failed', 'pi_1', 1))
+        
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 0)
+        payment.refresh_from_db()
+        self.assertFalse(payment.coupon_reserved)
+    
+    def test_failing_intent_does_not_hold_up_the_others(self):
+        good = self.payment('pi_good')
+        self.payment('pi_bad')
+        apply_updates = stripe_events.apply_updates
+        
+        def fail_for_bad_intent(updates):
+            if any(payment.stripe_payment_intent_id == 'pi_bad' for payment, _, _ in updates):
+                raise ValueError('boom')
+            return apply_updates(updates)
+        
+        stripe_events.store_event(event('evt_1', 'payment_intent.succeeded', 'pi_good', 1))
+        stripe_events.store_event(event('evt_2', 'payment_intent.succeeded', 'pi_bad', 2))
+        with mock.patch('payments.stripe_events.apply_updates', side_effect=fail_for_bad_intent), \
+                self.assertLogs('payments.stripe_events', 'ERROR'):
+            stripe_events.process_batch()
+            self.assertEqual(self.status(good), 'completed')
+            bad = StripeEvent.objects.get(event_id='evt_2')
+            self.assertEqual((bad.status, bad.attempts, bad.last_error), ('pending', 1, 'boom'))
+            
+            stripe_events.process_batch()
+            bad.refresh_from_db()
+            self.assertEqual((bad.status, bad.attempts), ('failed', 2))
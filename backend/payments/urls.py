@@ -10,4 +10,6 @@ urlpatterns = [
     path('validate-coupon/', views.validate_coupon, name='validate-coupon'),
     path('instructor/payouts/', views.InstructorPayoutListView.as_view(), name='instructor-payouts'),
     path('instructor/earnings/', views.instructor_earnings, name='instructor-earnings'),
+    path('payout-batches/<uuid:batch_id>/export/<str:method>/', views.export_payout_batch, name='export-payout-batch'),
+    path('instructor/statement/', views.InstructorStatementView.as_view(), name='instructor-statement'),
 ]
@@ -1,21 +1,31 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
 import stripe
-from .models import Payment, Coupon, CouponUsage, InstructorPayout
-from .serializers import PaymentSerializer, CouponSerializer, CouponValidationSerializer, InstructorPayoutSerializer
+from . import coupons, ledger, payouts
+from .models import Payment, InstructorPayout, LedgerEntry, PayoutBatch
+from .stripe_events import apply_updates, store_event
+from .serializers import PaymentSerializer, CouponSerializer, CouponValidationSerializer, InstructorPayoutSerializer, LedgerEntrySerializer
 from courses.models import Course, Enrollment
+from learnhub.pagination import KeysetPagination
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 class PaymentListView(generics.ListAPIView):
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        return Payment.objects.filter(user=self.request.user)
+        return Payment.objects.filter(user=self.request.user).select_related('user', 'course')
 
 class PaymentDetailView(generics.RetrieveAPIView):
     serializer_class = PaymentSerializer
@@ -43,46 +53,58 @@ def create_payment_intent(request):
         
         amount = course.price
         discount_amount = 0
-        coupon = None
+        rule = None
         
         # Apply coupon if provided
         if coupon_code:
             try:
-                coupon = Coupon.objects.get(code=coupon_code)
-                if coupon.is_valid and (not coupon.applicable_courses.exists() or course in coupon.applicable_courses.all()):
-                    if coupon.discount_type == 'percentage':
-                        discount_amount = (amount * coupon.discount_value) / 100
-                        if coupon.maximum_discount:
-                            discount_amount = min(discount_amount, coupon.maximum_discount)
-                    else:
-                        discount_amount = coupon.discount_value
-                    
-                    amount = max(0, amount - discount_amount)
-            except Coupon.DoesNotExist:
+                rule = coupons.get_rule(coupon_code)
+                line = coupons.quote(rule, course.id, course.price)
+                if line.error:
+                    rule = None
+                else:
+                    # Taken now so a flash sale cannot oversubscribe the
+                    # coupon. A user holds one use per course at a time,
+                    # see coupons.py for when it is given back
+                    coupons.release_reservations(Payment.objects.filter(
+                        user=request.user, course=course, payment_status__in=coupons.OPEN_STATUSES,
+                    ))
+                    coupons.reserve(rule)
+                    discount_amount = line.discount_amount
+                    amount = line.final_price
+            except coupons.CouponError as e:
                 return Response(
-                    {'error': 'Invalid coupon code'}, 
+                    {'error': str(e)}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Create Stripe payment intent
-        intent = stripe.PaymentIntent.create(
-            amount=int(amount * 100),  # Stripe expects cents
-            currency='usd',
-            metadata={
-                'course_id': str(course.id),
-                'user_id': str(request.user.id),
-                'coupon_code': coupon_code or '',
-            }
-        )
-        
-        # Create payment record
-        payment = Payment.objects.create(
-            user=request.user,
-            course=course,
-            amount=amount,
-            stripe_payment_intent_id=intent.id,
-            payment_status='pending'
-        )
+        try:
+            # Create Stripe payment intent
+            intent = stripe.PaymentIntent.create(
+                amount=int(amount * 100),  # Stripe expects cents
+                currency='usd',
+                metadata={
+                    'course_id': str(course.id),
+                    'user_id': str(request.user.id),
+                    'coupon_code': rule.code if rule else '',
+                    'coupon_reserved': '1' if rule else '',
+                }
+            )
+            
+            # Create payment record
+            payment = Payment.objects.create(
+                user=request.user,
+                course=course,
+                amount=amount,
+                stripe_payment_intent_id=intent.id,
+                payment_status='pending',
+                coupon_code=rule.code if rule else '',
+                coupon_reserved=bool(rule),
+            )
+        except Exception:
+            if rule:
+                coupons.release([rule.code])
+            raise
         
         return Response({
             'client_secret': intent.client_secret,
@@ -112,42 +134,17 @@ def confirm_payment(request):
         intent = stripe.PaymentIntent.retrieve(payment_intent_id)
         
         if intent.status == 'succeeded':
-            # Update payment record
-            payment = Payment.objects.get(stripe_payment_intent_id=payment_intent_id)
-            payment.payment_status = 'completed'
-            payment.completed_at = timezone.now()
-            payment.stripe_charge_id = intent.charges.data[0].id if intent.charges.data else None
-            payment.save()
+            # Same path as the payment_intent.succeeded webhook, which may
+            # already have completed the payment
+            with transaction.atomic():
+                payment = Payment.objects.select_for_update().get(stripe_payment_intent_id=payment_intent_id)
+                apply_updates([(payment, 'completed', intent)])
             
-            # Create enrollment
-            enrollment, created = Enrollment.objects.get_or_create(
-                user=payment.user,
-                course=payment.course,
-                defaults={
-                    'amount_paid': payment.amount,
-                    'payment_status': 'completed'
-                }
-            )
-            
-            # Handle coupon usage
-            coupon_code = intent.metadata.get('coupon_code')
-            if coupon_code:
-                try:
-                    coupon = Coupon.objects.get(code=coupon_code)
-                    CouponUsage.objects.create(
-                        coupon=coupon,
-                        user=payment.user,
-                        payment=payment,
-                        discount_amount=payment.course.price - payment.amount
-                    )
-                    coupon.used_count += 1
-                    coupon.save()
-                except Coupon.DoesNotExist:
-                    pass
+            enrollment = Enrollment.objects.filter(user_id=payment.user_id, course_id=payment.course_id).first()
             
             return Response({
                 'message': 'Payment confirmed and enrollment created',
-                'enrollment_id': enrollment.id
+                'enrollment_id': enrollment.id if enrollment else None
             })
         else:
             return Response(
@@ -180,28 +177,8 @@ def stripe_webhook(request):
     except stripe.error.SignatureVerificationError:
         return Response(status=400)
     
-    # Handle the event
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        # Handle successful payment
-        try:
-            payment = Payment.objects.get(stripe_payment_intent_id=payment_intent['id'])
-            payment.payment_status = 'completed'
-            payment.completed_at = timezone.now()
-            payment.save()
-        except Payment.DoesNotExist:
-            pass
-    
-    elif event['type'] == 'payment_intent.payment_failed':
-        payment_intent = event['data']['object']
-        # Handle failed payment
-        try:
-            payment = Payment.objects.get(stripe_payment_intent_id=payment_intent['id'])
-            payment.payment_status = 'failed'
-            payment.failure_reason = payment_intent.get('last_payment_error', {}).get('message', '')
-            payment.save()
-        except Payment.DoesNotExist:
-            pass
+    # Stored for the process_stripe_events task, see stripe_events.py
+    store_event(event.to_dict_recursive())
     
     return Response(status=200)
 
@@ -210,26 +187,26 @@ def stripe_webhook(request):
 def validate_coupon(request):
     serializer = CouponValidationSerializer(data=request.data)
     if serializer.is_valid():
-        coupon = serializer.validated_data['coupon']
-        course = serializer.validated_data['course']
-        
-        discount_amount = 0
-        if coupon.discount_type == 'percentage':
-            discount_amount = (course.price * coupon.discount_value) / 100
-            if coupon.maximum_discount:
-                discount_amount = min(discount_amount, coupon.maximum_discount)
-        else:
-            discount_amount = coupon.discount_value
-        
-        final_price = max(0, course.price - discount_amount)
-        
-        return Response({
+        cart = serializer.validated_data['cart']
+        response = {
             'valid': True,
-            'discount_amount': discount_amount,
-            'final_price': final_price,
-            'discount_type': coupon.discount_type,
-            'discount_value': coupon.discount_value,
-        })
+            'discount_amount': cart.discount_amount,
+            'final_price': cart.final_price,
+            'discount_type': cart.rule.discount_type,
+            'discount_value': cart.rule.discount_value,
+        }
+        if 'course_ids' in serializer.validated_data:
+            response['items'] = [
+                {
+                    'course_id': line.course_id,
+                    'price': line.price,
+                    'discount_amount': line.discount_amount,
+                    'final_price': line.final_price,
+                    'error': line.error,
+                }
+                for line in cart.lines
+            ]
+        return Response(response)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -251,22 +228,56 @@ def instructor_earnings(request):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    from django.db.models import Sum
-    from courses.models import Course
-    
-    courses = Course.objects.filter(instructor=request.user)
-    total_revenue = sum([course.total_revenue for course in courses])
-    instructor_share = total_revenue * 0.7  # 70% to instructor, 30% platform fee
-    
-    # Get pending payout amount
-    pending_payout = InstructorPayout.objects.filter(
-        instructor=request.user,
-        payout_status='pending'
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    # One row kept up to date by the revenue ledger, see ledger.py
+    balance = ledger.get_balance(request.user)
     
     return Response({
-        'total_revenue': total_revenue,
-        'instructor_share': instructor_share,
-        'pending_payout': pending_payout,
-        'available_for_payout': instructor_share - pending_payout,
+        'total_revenue': balance.total_revenue,
+        'instructor_share': balance.earnings,
+        'platform_fees': balance.platform_fees,
+        'pending_payout': balance.pending_payout,
+        'paid_out': balance.paid_out,
+        'available_for_payout': balance.available,
     })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def export_payout_batch(request, batch_id, method):
+    """Provider payout file of one payout method in a batch, streamed as csv"""
+    batch = get_object_or_404(PayoutBatch, pk=batch_id)
+    if method not in payouts.EXPORT_COLUMNS:
+        return Response(
+            {'error': 'Unknown payout method'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    response = StreamingHttpResponse(payouts.export_lines(batch, method), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="payouts-{timezone.localtime(batch.period_start):%Y-%m}-{method}.csv"'
+    return response
+
+class InstructorStatementView(generics.ListAPIView):
+    """Ledger entries of the instructor, optionally between ``start`` and ``end``"""
+    serializer_class = LedgerEntrySerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    
+    def get_queryset(self):
+        if self.request.user.user_type != 'instructor':
+            return LedgerEntry.objects.none()
+        entries = LedgerEntry.objects.filter(instructor=self.request.user)
+        for param, lookup in (('start', 'created_at__gte'), ('end', 'created_at__lt')):
+            value = self.request.query_params.get(param)
+            if value:
+                entries = entries.filter(**{lookup: self.parse_moment(param, value)})
+        return entries
+    
+    def parse_moment(self, param, value):
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValidationError({param: 'Expected an ISO 8601 date or datetime'})
+            moment = datetime.combine(day, time.min)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
@@ -4,7 +4,7 @@ from django.urls import reverse
 from django.db.models import Count
 from .models import (
     Province, District, School, Grade, Subject, Curriculum, 
-    Teacher, Student, AcademicYear
+    Teacher, Student, AcademicYear, GeographySummary
 )
 
 @admin.register(Province)
@@ -244,4 +244,16 @@ class AcademicYearAdmin(admin.ModelAdmin):
             obj.term_2_start, obj.term_2_end,
             obj.term_3_start, obj.term_3_end
         )
-    term_info.short_description = 'Term Dates'
\ No newline at end of file
+    term_info.short_description = 'Term Dates'
+
+@admin.register(GeographySummary)
+class GeographySummaryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'level', 'schools', 'students', 'teachers', 'refreshed_at')
+    list_filter = ('level', 'province')
+    search_fields = ('name',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
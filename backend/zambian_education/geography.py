@@ -0,0 +1,123 @@
+"""
+Province/district/school level counts for dashboards and reports.
+
+Everything is derived from a handful of GROUP BY queries (students by school
+and phase, teachers by school, published videos by phase) plus the school and
+district lists; the per-area figures are then rolled up in memory and
+written to GeographySummary in one transaction. Readers only ever touch
+the summary table, never the national-scale Student table.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Sum, Q
+from django.utils import timezone
+
+from .models import District, GeographySummary, Province, School, Student, Teacher
+
+STUDENT_PHASE_FIELDS = {
+    'primary': 'primary_students',
+    'junior_secondary': 'junior_secondary_students',
+    'senior_secondary': 'senior_secondary_students',
+}
+
+COUNT_FIELDS = ('schools', 'students', 'teachers') + tuple(STUDENT_PHASE_FIELDS.values())
+
+SECONDARY_PHASES = ['junior_secondary', 'senior_secondary']
+
+
+def _empty_counts():
+    return dict.fromkeys(COUNT_FIELDS, 0)
+
+
+def _add(target, counts):
+    for field in COUNT_FIELDS:
+        target[field] += counts[field]
+
+
+def video_counts():
+    from online_classes.models import EducationalVideo
+    
+    totals = EducationalVideo.objects.filter(is_published=True).aggregate(
+        published_videos=Count('id'),
+        primary_videos=Count('id', filter=Q(grade__phase='primary')),
+        secondary_videos=Count('id', filter=Q(grade__phase__in=SECONDARY_PHASES)),
+        video_watch_hours=Sum('total_watch_time_hours'),
+    )
+    return {field: value or 0 for field, value in totals.items()}
+
+
+def compute_geography_summary():
+    """Build (unsaved) GeographySummary rows for every area"""
+    now = timezone.now()
+    
+    per_school = defaultdict(_empty_counts)
+    national = _empty_counts()
+    
+    students = Student.objects.values('current_school_id', 'current_grade__phase').annotate(count=Count('id'))
+    for row in students:
+        counts = per_school[row['current_school_id']] if row['current_school_id'] else national
+        counts['students'] += row['count']
+        phase_field = STUDENT_PHASE_FIELDS.get(row['current_grade__phase'])
+        if phase_field:
+            counts[phase_field] += row['count']
+    
+    teachers = Teacher.objects.values('current_school_id').annotate(count=Count('id'))
+    for row in teachers:
+        counts = per_school[row['current_school_id']] if row['current_school_id'] else national
+        counts['teachers'] += row['count']
+    
+    provinces = {p.pk: p for p in Province.objects.all()}
+    districts = {d['id']: d for d in District.objects.values('id', 'name', 'province_id')}
+    per_district = defaultdict(_empty_counts)
+    per_province = defaultdict(_empty_counts)
+    
+    rows = []
+    for school in School.objects.values('id', 'name', 'district_id').iterator():
+        counts = per_school.pop(school['id'], None) or _empty_counts()
+        counts['schools'] = 1
+        district = districts[school['district_id']]
+        rows.append(GeographySummary(
+            level='school', province_id=district['province_id'], district_id=district['id'],
+            school_id=school['id'], name=school['name'], refreshed_at=now, **counts
+        ))
+        _add(per_district[district['id']], counts)
+    
+    for district_id, district in districts.items():
+        counts = per_district[district_id]
+        rows.append(GeographySummary(
+            level='district', province_id=district['province_id'], district_id=district_id,
+            name=district['name'], refreshed_at=now, **counts
+        ))
+        _add(per_province[district['province_id']], counts)
+    
+    for province_id, province in provinces.items():
+        counts = per_province[province_id]
+        rows.append(GeographySummary(
+            level='province', province_id=province_id,
+            name=province.get_name_display(), refreshed_at=now, **counts
+        ))
+        _add(national, counts)
+    
+    rows.append(GeographySummary(
+        level='national', name='Zambia', refreshed_at=now, **national, **video_counts()
+    ))
+    return rows
+
+
+def refresh_geography_summary(batch_size=1000):
+    """Rebuild the summary table; returns the number of rows written"""
+    rows = compute_geography_summary()
+    with transaction.atomic():
+        GeographySummary.objects.all().delete()
+        GeographySummary.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def national_summary():
+    """The national row, building the summary first if it has never been built"""
+    summary = GeographySummary.objects.filter(level='national').first()
+    if summary is None:
+        refresh_geography_summary()
+        summary = GeographySummary.objects.filter(level='national').first()
+    return summary
@@ -284,4 +284,49 @@ class AcademicYear(models.Model):
         if self.is_current:
             # Ensure only one academic year is current
             AcademicYear.objects.filter(is_current=True).update(is_current=False)
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class GeographySummary(models.Model):
+    """Materialized per-area counts, rebuilt by zambian_education/geography.py"""
+    LEVELS = [
+        ('national', 'National'),
+        ('province', 'Province'),
+        ('district', 'District'),
+        ('school', 'School'),
+    ]
+    
+    level = models.CharField(max_length=20, choices=LEVELS)
+    province = models.ForeignKey(Province, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    district = models.ForeignKey(District, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    name = models.CharField(max_length=200)
+    
+    schools = models.PositiveIntegerField(default=0)
+    students = models.PositiveIntegerField(default=0)
+    primary_students = models.PositiveIntegerField(default=0)
+    junior_secondary_students = models.PositiveIntegerField(default=0)
+    senior_secondary_students = models.PositiveIntegerField(default=0)
+    teachers = models.PositiveIntegerField(default=0)
+    
+    # Videos are not tied to a place, so these are only filled on the national row
+    published_videos = models.PositiveIntegerField(default=0)
+    primary_videos = models.PositiveIntegerField(default=0)
+    secondary_videos = models.PositiveIntegerField(default=0)
+    video_watch_hours = models.PositiveIntegerField(default=0)
+    
+    refreshed_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['level', 'name']
+        verbose_name_plural = 'Geography summaries'
+        indexes = [
+            models.Index(fields=['level', 'province']),
+            models.Index(fields=['level', 'district']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_level_display()}: {self.name}"
+    
+    @property
+    def secondary_students(self):
+        return self.junior_secondary_students + self.senior_secondary_students
@@ -0,0 +1,9 @@
+from rest_framework import serializers
+from .models import GeographySummary
+
+class GeographySummarySerializer(serializers.ModelSerializer):
+    secondary_students = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = GeographySummary
+        fields = '__all__'
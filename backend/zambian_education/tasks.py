@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from . import geography
+
+
+@shared_task(ignore_result=True)
+def refresh_geography_summary():
+    """Rebuild the materialized GeographySummary table"""
+    return geography.refresh_geography_summary()
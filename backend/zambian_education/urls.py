@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('geography/', views.GeographySummaryListView.as_view(), name='geography-summary'),
+]
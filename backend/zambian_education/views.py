@@ -0,0 +1,12 @@
+from rest_framework import generics, permissions
+from .models import GeographySummary
+from .serializers import GeographySummarySerializer
+
+class GeographySummaryListView(generics.ListAPIView):
+    """Materialized school, student, teacher and video counts per area"""
+    queryset = GeographySummary.objects.all()
+    serializer_class = GeographySummarySerializer
+    permission_classes = [permissions.IsAdminUser]
+    filterset_fields = ['level', 'province', 'district', 'school']
+    search_fields = ['name']
+    ordering_fields = ['name', 'schools', 'students', 'teachers']